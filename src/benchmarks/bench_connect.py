@@ -0,0 +1,80 @@
+# Benchmark of connect latency of Kryzbu client, full TLS handshake against resumed TLS session
+#
+# Run from src folder: python -m benchmarks.bench_connect [--connections N]
+#
+# Source code available on: https://github.com/martin-nohava/kryzbu.
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.bench_loop import free_port, setup, start_server
+from client.client import Client, Session
+from server.server import Server
+
+
+async def connect_latency(count: int, resume: bool) -> tuple:
+    """
+    Opens *count* connections one after another and returns their latencies in seconds
+    and number of resumed sessions.
+    Every connection is opened, switched to binary frames and closed.
+
+    """
+
+    latencies = []
+    resumed = 0
+    for _ in range(count):
+        if not resume:
+            # New context has no session to resume
+            Client.SSL_CONTEXT = None
+        start = time.perf_counter()
+        session = Session(authenticate=False)
+        await session.open()
+        latencies.append(time.perf_counter() - start)
+        resumed += session.writer.get_extra_info("ssl_object").session_reused
+        await session.close()
+    return latencies, resumed
+
+
+async def measure(count: int) -> dict:
+    server = await start_server()
+    try:
+        results = {}
+        for name, resume in (("full handshake", False), ("resumed session", True)):
+            Client.SSL_CONTEXT = None
+            results[name] = await connect_latency(count, resume)
+    finally:
+        server.cancel()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kryzbu client connect latency")
+    parser.add_argument(
+        "--connections", type=int, default=200, help="number of connections"
+    )
+    args = parser.parse_args()
+
+    Server.PORT = Client.SERVER_PORT = free_port()
+    Server.VERBOSITY = 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup(Path(tmp), 0)
+        results = asyncio.run(measure(args.connections))
+
+    print(f"{'':16} {'mean ms':>8} {'median ms':>10} {'p95 ms':>8} {'resumed':>8}")
+    for name, (latencies, resumed) in results.items():
+        latencies.sort()
+        print(
+            f"{name:16} {statistics.mean(latencies) * 1000:8.2f}"
+            f" {statistics.median(latencies) * 1000:10.2f}"
+            f" {latencies[int(len(latencies) * 0.95)] * 1000:8.2f}"
+            f" {resumed:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
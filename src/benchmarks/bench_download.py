@@ -0,0 +1,97 @@
+# Benchmark of download throughput of Kryzbu server
+#
+# Run from src folder: python -m benchmarks.bench_download [--size MiB] [--plain]
+#
+# Source code available on: https://github.com/martin-nohava/kryzbu.
+
+import argparse
+import asyncio
+import os
+import ssl
+import tempfile
+import time
+from pathlib import Path
+
+from server.server import Server
+
+
+async def legacy_send_file(file_path: Path, writer: asyncio.StreamWriter, *_):
+    # Original download loop, 1024 B read, write and drain
+    with open(file_path, "rb") as f:
+        while True:
+            bytes_read = f.read(1024)
+            if not bytes_read:
+                break
+            writer.write(bytes_read)
+            await writer.drain()
+
+
+async def measure(send, file_path: Path, size: int, use_tls: bool) -> float:
+    """
+    Serves file once over loopback with *send* function and returns throughput in MB/s.
+
+    """
+
+    server_ssl = client_ssl = None
+    if use_tls:
+        server_ssl = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        server_ssl.load_cert_chain("server.cert", "server.key")
+        client_ssl = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
+        client_ssl.check_hostname = False
+        client_ssl.verify_mode = ssl.CERT_NONE
+
+    async def handle(reader, writer):
+        await send(file_path, writer, 0, size)
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0, ssl=server_ssl)
+    port = server.sockets[0].getsockname()[1]
+
+    async with server:
+        start = time.perf_counter()
+        reader, writer = await asyncio.open_connection(
+            "127.0.0.1", port, ssl=client_ssl
+        )
+        received = 0
+        while received < size:
+            data = await reader.read(4 * 1024 * 1024)
+            if not data:
+                break
+            received += len(data)
+        elapsed = time.perf_counter() - start
+        writer.close()
+
+    if received != size:
+        raise Exception(f"Received {received} B of {size} B")
+    return size / elapsed / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kryzbu download throughput")
+    parser.add_argument("--size", type=int, default=256, help="file size in MiB")
+    parser.add_argument(
+        "--plain", action="store_true", help="measure also plain TCP (sendfile path)"
+    )
+    args = parser.parse_args()
+
+    size = args.size * 1024 * 1024
+    with tempfile.TemporaryDirectory() as tmp:
+        file_path = Path(tmp) / "bench.bin"
+        with open(file_path, "wb") as f:
+            f.write(os.urandom(size))
+
+        transports = [True, False] if args.plain else [True]
+        for use_tls in transports:
+            for name, send in (
+                ("legacy 1 KiB loop", legacy_send_file),
+                ("Server.send_file", Server.send_file),
+            ):
+                rate = asyncio.run(measure(send, file_path, size, use_tls))
+                print(
+                    f"{'TLS' if use_tls else 'TCP'} {name:20} {rate:10.1f} MB/s ({args.size} MiB)"
+                )
+
+
+if __name__ == "__main__":
+    main()
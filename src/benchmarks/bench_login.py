@@ -0,0 +1,163 @@
+# Benchmark of login handshake of Kryzbu server: key parsed per login, cached key in event loop
+# and cached key in pool of processes. Reports throughput, latency percentiles of logins
+# and the longest stall of event loop, during which no other client was served.
+#
+# Run from src folder: python -m benchmarks.bench_login [--logins N] [--connections N] [--processes N]
+#
+# Source code available on: https://github.com/martin-nohava/kryzbu.
+
+import argparse
+import asyncio
+import hashlib
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from Crypto.Cipher import AES, PKCS1_OAEP
+from Crypto.PublicKey import RSA
+
+from benchmarks.bench_loop import USER, free_port, setup, start_server
+from client.client import Client, Session
+from server.executor import Executor
+from server.limits import Rate_limiter
+from server.rsalib import Rsa
+from server.server import Server
+
+
+def legacy_cipher():
+    # Original handshake, private key read from file and parsed on every login
+    return PKCS1_OAEP.new(RSA.import_key(Rsa.get_priv_key_location().read_text()))
+
+
+async def login(session: Session, rsa_instance) -> None:
+    """
+    Runs whole login handshake over open session, the same way as
+    :py:meth:`Client.login() <client.client.Client.login>`.
+
+    """
+
+    c = rsa_instance.encrypt(f"{USER};{uuid.uuid4().hex}".encode())
+    c, tag, nonce, byte_salt = await session.handshake("LOGIN", c)
+
+    pass_hash = hashlib.sha256(byte_salt.hex().encode() + USER.encode()).hexdigest()
+    byte_pass = bytes.fromhex(pass_hash)
+    m = AES.new(byte_pass, AES.MODE_EAX, nonce).decrypt_and_verify(c, tag)
+
+    answer = await session.handshake("LOGIN", rsa_instance.encrypt(m))
+    if answer is None:
+        raise Exception("Login failed")
+
+
+async def loop_stall(stop: asyncio.Event) -> float:
+    # Longest overshoot of 1 ms sleep, event loop was blocked meanwhile
+    stall = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        stall = max(stall, time.perf_counter() - start - 0.001)
+    return stall
+
+
+async def login_rate(count: int, connections: int) -> tuple:
+    """
+    Runs server and *count* logins over *connections* concurrent sessions.
+    Returns logins per second, latencies of logins and the longest stall of event loop in seconds.
+
+    """
+
+    server = await start_server()
+    rsa_instance = PKCS1_OAEP.new(RSA.import_key(Rsa.public_pem()))
+    latencies = []
+    stop = asyncio.Event()
+    stall = asyncio.create_task(loop_stall(stop))
+
+    async def worker(n):
+        session = Session(authenticate=False)
+        await session.open()
+        for _ in range(n):
+            start = time.perf_counter()
+            await login(session, rsa_instance)
+            latencies.append(time.perf_counter() - start)
+        await session.close()
+
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(worker(count // connections) for _ in range(connections))
+        )
+        rate = len(latencies) / (time.perf_counter() - start)
+    finally:
+        stop.set()
+        server.cancel()
+    return rate, latencies, await stall
+
+
+def measure(count: int, connections: int, processes: int) -> dict:
+    """
+    Runs benchmark in every configuration, each on new event loop with new pools.
+
+    """
+
+    cipher = Rsa.cipher
+    results = {}
+    for name, server_cipher, workers in (
+        ("key per login", legacy_cipher, 0),
+        ("event loop", cipher, 0),
+        (f"{processes} processes", cipher, processes),
+    ):
+        Rsa.cipher = server_cipher
+        Executor.WORKERS["crypto"] = workers
+        try:
+            results[name] = asyncio.run(login_rate(count, connections))
+        finally:
+            Rsa.cipher = cipher
+            # Next pool of processes is forked without running threads
+            Executor.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kryzbu server login throughput")
+    parser.add_argument("--logins", type=int, default=400, help="number of logins")
+    parser.add_argument(
+        "--connections", type=int, default=8, help="number of concurrent clients"
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=os.cpu_count(),
+        help="number of processes for RSA operations",
+    )
+    args = parser.parse_args()
+
+    Server.PORT = Client.SERVER_PORT = free_port()
+    Server.VERBOSITY = 0
+    Client.PROTOCOL = "frames"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup(Path(tmp), 0)
+        # Login is limited to few attempts per minute, benchmark measures the handshake
+        Rate_limiter.REQUESTS = {}
+        # Server reports every login
+        with redirect_stdout(open(os.devnull, "w")):
+            results = measure(args.logins, args.connections, args.processes)
+
+    print(
+        f"{'':14} {'logins/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'stall ms':>9}"
+    )
+    for name, (rate, latencies, stall) in results.items():
+        latencies.sort()
+        print(
+            f"{name:14} {rate:9.1f} {statistics.median(latencies) * 1000:8.2f}"
+            f" {latencies[int(len(latencies) * 0.95)] * 1000:8.2f}"
+            f" {latencies[int(len(latencies) * 0.99)] * 1000:8.2f}"
+            f" {stall * 1000:9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
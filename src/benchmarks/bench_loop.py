@@ -0,0 +1,218 @@
+# Benchmark of Kryzbu server on different event loop implementations
+#
+# Run from src folder: python -m benchmarks.bench_loop [--requests N] [--connections N] [--size MiB]
+#
+# Server runs in temporary data folder, complete Server.run() is measured, including TLS
+# and authentication, against client in the same process and event loop.
+#
+# Source code available on: https://github.com/martin-nohava/kryzbu.
+
+import argparse
+import asyncio
+import os
+import shutil
+import socket
+import ssl
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+
+from server.db import File_index, User_db
+from server.eventloop import Event_loop
+from server.limits import Rate_limiter
+from server.protocol import Frame
+from server.server import Server
+
+USER = "bench"
+FILE = "bench.bin"
+
+CLIENT_SSL = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
+CLIENT_SSL.check_hostname = False
+CLIENT_SSL.verify_mode = ssl.CERT_NONE
+
+
+async def connect(aes_key: bytes) -> tuple:
+    """
+    Opens TLS connection, switches it to binary frames and authenticates it.
+
+    """
+
+    reader, writer = await asyncio.open_connection(
+        Server.IP, Server.PORT, ssl=CLIENT_SSL
+    )
+    writer.write(f"{Frame.HELLO};{Frame.VERSION}\n".encode())
+    await reader.readline()
+
+    pad = get_random_bytes(8)
+    aes_instance = AES.new(aes_key, AES.MODE_EAX)
+    c, tag = aes_instance.encrypt_and_digest(pad + b"AUTH;empty")
+    Frame.write(
+        writer, Frame.Op.AUTH, 0, USER.encode(), c, tag, pad, aes_instance.nonce
+    )
+    op, _, fields = await Frame.read(reader)
+    if op != Frame.Op.OK:
+        raise Exception(f"Authentication failed: {fields}")
+    return reader, writer
+
+
+async def close(writer: asyncio.StreamWriter) -> None:
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except (ConnectionError, ssl.SSLError):
+        pass
+
+
+async def bench_connect(aes_key: bytes, count: int, connections: int) -> float:
+    # New TLS connection and authentication per request, returns connections per second
+    async def worker(n):
+        for _ in range(n):
+            _, writer = await connect(aes_key)
+            await close(writer)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(count // connections) for _ in range(connections)))
+    return count // connections * connections / (time.perf_counter() - start)
+
+
+async def bench_requests(aes_key: bytes, count: int, connections: int) -> float:
+    # STAT requests over persistent sessions, returns requests per second
+    async def worker(n):
+        reader, writer = await connect(aes_key)
+        for request_id in range(n):
+            Frame.write(writer, Frame.Op.STAT, request_id, FILE.encode())
+            op, _, _ = await Frame.read(reader)
+            if op != Frame.Op.OK:
+                raise Exception("STAT failed")
+        await close(writer)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(count // connections) for _ in range(connections)))
+    return count // connections * connections / (time.perf_counter() - start)
+
+
+async def bench_download(aes_key: bytes, size: int) -> float:
+    # Download of whole file over one session, returns MB/s
+    reader, writer = await connect(aes_key)
+    start = time.perf_counter()
+    Frame.write(writer, Frame.Op.DOWNLOAD, 1, FILE.encode())
+    op, _, fields = await Frame.read(reader)
+    if op != Frame.Op.OK:
+        raise Exception("DOWNLOAD failed")
+    remaining = Frame.U64.unpack(fields[1])[0]
+    while remaining > 0:
+        data = await reader.read(min(remaining, 4 * 1024 * 1024))
+        if not data:
+            raise Exception("Connection closed during download")
+        remaining -= len(data)
+    elapsed = time.perf_counter() - start
+    await close(writer)
+    return size / elapsed / 1e6
+
+
+async def start_server() -> asyncio.Task:
+    """
+    Starts Server.run() in background and waits until server listens.
+
+    """
+
+    with redirect_stdout(open(os.devnull, "w")):
+        server = asyncio.create_task(Server.run())
+        while True:
+            try:
+                _, writer = await asyncio.open_connection(Server.IP, Server.PORT)
+                writer.close()
+                return server
+            except ConnectionRefusedError:
+                await asyncio.sleep(0.05)
+
+
+async def measure(args, aes_key: bytes) -> tuple:
+    """
+    Runs server and all benchmarks on current event loop.
+
+    """
+
+    server = await start_server()
+    try:
+        handshakes = await bench_connect(aes_key, args.handshakes, args.connections)
+        requests = await bench_requests(aes_key, args.requests, args.connections)
+        download = await bench_download(aes_key, args.size * 1024 * 1024)
+    finally:
+        server.cancel()
+    return handshakes, requests, download
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind((Server.IP, 0))
+        return sock.getsockname()[1]
+
+
+def setup(folder: Path, size: int) -> bytes:
+    """
+    Prepares server data in *folder*, registers benchmark user and stores file for download.
+
+    :returns: AES key of benchmark user
+
+    """
+
+    source = Path.cwd()
+    shutil.copy(source / "server.cert", folder)
+    shutil.copy(source / "server.key", folder)
+    os.chdir(folder)
+
+    with redirect_stdout(open(os.devnull, "w")):
+        Path("server/_data/files").mkdir(parents=True)
+        Server.init()
+        User_db.add(USER, USER)
+        (Server.SERVER_FOLDER / USER).mkdir()
+        with open(Server.SERVER_FOLDER / USER / FILE, "wb") as f:
+            f.write(os.urandom(size))
+        # Index the file
+        File_index.init(Server.SERVER_FOLDER / USER)
+
+    return User_db.get_record(USER)[2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kryzbu server on event loops")
+    parser.add_argument(
+        "--handshakes", type=int, default=400, help="number of new connections"
+    )
+    parser.add_argument(
+        "--requests", type=int, default=20000, help="number of STAT requests"
+    )
+    parser.add_argument(
+        "--connections", type=int, default=8, help="number of concurrent clients"
+    )
+    parser.add_argument("--size", type=int, default=256, help="file size in MiB")
+    args = parser.parse_args()
+
+    Server.PORT = free_port()
+    Server.VERBOSITY = 0
+    # Benchmark measures the server, not its request budgets
+    Rate_limiter.REQUESTS = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        aes_key = setup(Path(tmp), args.size * 1024 * 1024)
+
+        print(
+            f"{'loop':10} {'handshakes/s':>14} {'requests/s':>12} {'download MB/s':>14}"
+        )
+        for name in Event_loop.NAMES:
+            if name not in Event_loop.available():
+                print(f"{name:10} not installed")
+                continue
+            Event_loop.use(name)
+            handshakes, requests, download = asyncio.run(measure(args, aes_key))
+            print(f"{name:10} {handshakes:14.1f} {requests:12.1f} {download:14.1f}")
+        Event_loop.use(Event_loop.NAMES[0])
+
+
+if __name__ == "__main__":
+    main()
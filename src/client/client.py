@@ -2,7 +2,9 @@
 
 import hashlib
 import asyncio
+import collections
 import os
+import random
 import re
 from pathlib import Path
 import ssl
@@ -15,6 +17,7 @@ from Crypto.PublicKey import RSA
 from Crypto.Random import get_random_bytes
 from Crypto.Cipher import PKCS1_OAEP, AES
 import climage
+from .protocol import Frame
 
 
 class Client:
@@ -28,6 +31,17 @@ class Client:
     | **USER_CONF** (*Path*) – defines where to store user specific configuration
     | **SERVER_PUBLIC_KEY** (*Path*) – defines where to store server public key
     | **USER_AES_KEY_BASE_PATH** (*Path*) – defines where to store user specific AES key (Session ID)
+    | **PROTOCOL** (*str*) – protocol negotiated with server, 'frames' or 'text', None before first connection
+    | **CHUNK_SIZE** (*int*) – size of chunks file data are received in
+    | **UPLOAD_CHUNK** (*int*) – size of chunks of resumable upload
+    | **UPLOAD_WINDOW** (*int*) – number of chunks sent before their confirmation is awaited
+    | **UPLOAD_RETRIES** (*int*) – how many times is interrupted upload resumed
+    | **STRIPES** (*int*) – number of parallel connections downloading one large file
+    | **STRIPE_SIZE** (*int*) – size of range of large file requested at once
+    | **STRIPE_THRESHOLD** (*int*) – files of at least this size are downloaded in stripes
+    | **BUSY_RETRIES** (*int*) – how many times is request refused by busy server repeated
+    | **BUSY_MAX_DELAY** (*float*) – longest wait before request refused by busy server is repeated (seconds)
+    | **SSL_CONTEXT** (*Tls_context*) – SSL context shared by all connections, created by first connection
     """
 
     SERVER_IP = "127.0.0.1"
@@ -36,6 +50,17 @@ class Client:
     SERVER_PUBLIC_KEY = Path("client/_data/keys/publ.pem")
     USER_AES_KEY_BASE_PATH = Path("client/_data/keys")
     EOM = "\n"  # End of Message sign
+    PROTOCOL: str = None  # Negotiated by first Session
+    CHUNK_SIZE = 64 * 1024
+    UPLOAD_CHUNK = 1024 * 1024
+    UPLOAD_WINDOW = 8
+    UPLOAD_RETRIES = 5
+    STRIPES = 4
+    STRIPE_SIZE = 16 * 1024 * 1024
+    STRIPE_THRESHOLD = 64 * 1024 * 1024
+    BUSY_RETRIES = 8
+    BUSY_MAX_DELAY = 30.0
+    SSL_CONTEXT: "Tls_context" = None
 
     @staticmethod
     async def open_connection() -> Tuple:
@@ -44,6 +69,7 @@ class Client:
         Connection is `asyncio stream <https://docs.python.org/3/library/asyncio-stream.html>`_ with SSL context.
         This function is called at the beggining of each request made to server. SSL now uses self-signed certificate
         for localhost. If client and server are not at the same machine PKI has to be managed.
+        All connections share one SSL context, which resumes TLS session of previous connections, see :py:class:`Tls_context <client.client.Tls_context>`.
 
         :returns: Reader and Writer objects.
         :rtype: Tuple: (reader, writer)
@@ -51,14 +77,14 @@ class Client:
         """
 
         try:
-            ssl_context = ssl.create_default_context(
-                ssl.Purpose.SERVER_AUTH, cafile="server.cert"
-            )
-            ssl_context.check_hostname = (
-                False  # No common name in creation -> need False
-            )
+            if Client.SSL_CONTEXT is None:
+                Client.SSL_CONTEXT = Tls_context(ssl.PROTOCOL_TLS_CLIENT)
+                Client.SSL_CONTEXT.load_verify_locations(cafile="server.cert")
+                Client.SSL_CONTEXT.check_hostname = (
+                    False  # No common name in creation -> need False
+                )
             reader, writer = await asyncio.open_connection(
-                Client.SERVER_IP, Client.SERVER_PORT, ssl=ssl_context
+                Client.SERVER_IP, Client.SERVER_PORT, ssl=Client.SSL_CONTEXT
             )
             return reader, writer
         except ConnectionRefusedError as e:
@@ -66,6 +92,25 @@ class Client:
             print("ERROR: Failed to contact server!")
             exit(1)
 
+    @staticmethod
+    async def backoff(attempt: int, retry_after: float):
+        """
+        Waits before request refused by busy server is repeated. Wait starts at *retry_after* advised by server
+        and doubles with every attempt up to *BUSY_MAX_DELAY*. Random jitter spreads clients refused
+        at the same time, so they do not come back all at once.
+
+        :param attempt: Number of previous attempts
+        :type attempt: int
+        :param retry_after: Wait advised by server (seconds)
+        :type retry_after: float
+
+        """
+
+        delay = retry_after * 2**attempt
+        await asyncio.sleep(
+            min(Client.BUSY_MAX_DELAY, random.uniform(delay, 2 * delay))
+        )
+
     @staticmethod
     def load_aes_key() -> bytes:
         """
@@ -83,203 +128,551 @@ class Client:
             return aes_key
 
     @staticmethod
-    def send_request(
-        type: str, writer: asyncio.StreamWriter, file_name: str = "empty"
-    ) -> None:
+    def encrypt_request(type: str, file_name: str = "empty") -> Tuple:
         """
-        A function that provides easy sending of requests to the server by entering the type and file name to which it applies.
+        Encrypts request with user's AES key, so server can authenticate it.
 
-        :param type: Type of request. (UPLOAD, DOWNLOAD etc.)
+        :param type: Type of request. (UPLOAD, DOWNLOAD, AUTH etc.)
         :type type: str
+        :param file_name: File name the request applies to
+        :type file_name: str
+        :returns: Encrypted request, its tag, random pad and nonce
+        :rtype: Tuple: (c, tag, pad, nonce)
 
         """
-        # Prepare request
         pad = get_random_bytes(8)
         m = pad + f"{type};{file_name}".encode()
         aes_key = Client.load_aes_key()
         aes_instance = AES.new(aes_key, AES.MODE_EAX)
         c, tag = aes_instance.encrypt_and_digest(m)
 
-        payload = (c, tag, pad, aes_instance.nonce)
+        return c, tag, pad, aes_instance.nonce
+
+    @staticmethod
+    def send_request(
+        type: str, writer: asyncio.StreamWriter, file_name: str = "empty"
+    ) -> None:
+        """
+        A function that provides easy sending of requests to the server by entering the type and file name to which it applies.
+        Used by text protocol only.
+
+        :param type: Type of request. (UPLOAD, DOWNLOAD etc.)
+        :type type: str
+
+        """
+        # Prepare request
+        payload = c, tag, pad, nonce = Client.encrypt_request(type, file_name)
 
         # Send request
         writer.write(
-            f"{Client.get_username()};{len(c)};{len(tag)};{len(pad)};{len(aes_instance.nonce)}".encode()
+            f"{Client.get_username()};{len(c)};{len(tag)};{len(pad)};{len(nonce)}".encode()
             + Client.EOM.encode()
         )
         writer.writelines(payload)
 
     @staticmethod
-    async def upload(file_path: str):
+    async def upload(
+        file_path: str, session: "Session" = None, bar: tqdm.tqdm = None
+    ) -> bool:
         """
-        Uploads file to server. Requires only file path to file to be uploaded.
+        Uploads file to server. Requires only file path to file to be uploaded. Servers supporting frames
+        receive the file in upload session (see :py:meth:`upload_chunks() <client.client.Client.upload_chunks>`),
+        so dropped connection only costs chunks in flight.
 
         :param file_path: File to path asi String
         :type file_path: str
+        :param session: Opened session, new one is opened if not given
+        :type session: Session
+        :param bar: Shared loading bar of the whole batch, file gets its own if not given
+        :type bar: tqdm.tqdm
+        :returns: Whether file was uploaded
+        :rtype: bool
 
         """
 
         if os.path.exists(file_path):
 
-            reader, writer = await Client.open_connection()
+            if session is None:
+                async with Session() as session:
+                    return await Client.upload(file_path, session, bar)
 
             file_name = os.path.basename(file_path)
+            file_size = os.path.getsize(file_path)
+
+            if Client.PROTOCOL == "frames":
+                progress = Progress(f"Sending {file_name}", file_size, bar)
+                for attempt in range(Client.UPLOAD_RETRIES + 1):
+                    try:
+                        if session.writer is None:
+                            # Reconnect, server keeps the upload session
+                            print(f"Connection lost, resuming upload of '{file_name}'")
+                            await session.open()
+                        status, info = await Client.upload_chunks(
+                            file_path, session, progress
+                        )
+                        break
+                    except (ConnectionError, asyncio.IncompleteReadError):
+                        status, info = "ERROR", "ConnectionLost"
+                        progress.reset()
+                        await session.close()
 
-            # Send UPLOAD request
-            Client.send_request("UPLOAD", writer, file_name)
-
-            # Receive aswer
-            data = await reader.readuntil(Client.EOM.encode())
-            answer = data.decode()
+                if status != "OK":
+                    print(f"client.py: Upload of '{file_name}' failed with {info}")
+                return status == "OK"
 
-            if "OK" in answer:
-                # Answer: 'OK;Authenticated'
+            # Send UPLOAD request, answer: 'OK;Ready'
+            status, info, _ = await session.request("UPLOAD", file_name, file_size)
 
+            if status == "OK":
                 # Prepare loading bar
-                file_size = os.path.getsize(file_path)
-                progress = tqdm.tqdm(
-                    range(file_size),
-                    f"Sending {file_name}",
-                    unit="B",
-                    unit_scale=True,
-                    unit_divisor=1024,
-                )
+                progress = Progress(f"Sending {file_name}", file_size, bar)
 
                 # Send file
                 with open(file_path, "rb") as f:
                     while True:
-                        bytes_read = f.read(1024)
+                        bytes_read = f.read(Client.CHUNK_SIZE)
                         if not bytes_read:
                             break
                         progress.update(len(bytes_read))
-                        writer.write(bytes_read)
-                        await writer.drain()
+                        await session.write(bytes_read)
 
-            elif "NotAuthenticated" in answer:
-                # Answer: 'ERROR;NotAuthenticated'
-                print(
-                    f"User '{Client.get_username()}' can't be authenticated, CANNOT upload"
-                )
-            else:
-                # Answer: Any
-                print("client.py: Unknown exeption")
+                # Answer: 'OK;Uploaded'
+                status, info, _ = await session.response()
 
-            writer.close()
-            await writer.wait_closed()
+            if status != "OK":
+                # Answer: Any
+                print(f"client.py: Upload of '{file_name}' failed with {info}")
+            return status == "OK"
 
         else:
             # Client FileNotFoundError
             print(f"ERROR: File '{file_path}' can't be reached! No action taken.")
             print(f"Check correct file name and path and try again.")
+            return False
 
     @staticmethod
-    async def download(file_name: str):
+    async def upload_chunks(
+        file_path: str, session: "Session", progress: "Progress"
+    ) -> Tuple:
         """
-        Downloads file from server. Requires only file name.
+        Uploads file in upload session. Server keeps session of unfinished upload of the same file version,
+        so only chunks server does not hold yet are sent, also when upload is started again after client
+        was closed. Up to *UPLOAD_WINDOW* chunks are sent before their confirmation is awaited.
+        Chunks refused by busy server are sent again after :py:meth:`backoff() <client.client.Client.backoff>`.
 
-        :param file_path: File name
+        :param file_path: Path to file
         :type file_path: str
-        
+        :param session: Opened session using frames
+        :type session: Session
+        :param progress: Progress of the upload
+        :type progress: Progress
+        :returns: Status and info of the last answer
+        :rtype: Tuple: (status, info)
+
         """
 
-        reader, writer = await Client.open_connection()
+        file_name = os.path.basename(file_path)
+        file_size = os.path.getsize(file_path)
+        fingerprint = os.stat(file_path).st_mtime_ns
+
+        # Open or resume upload session, answer: 'OK;SESSION_ID'
+        status, session_id, _ = await session.exchange(
+            "UPLOAD_OPEN",
+            file_name.encode(),
+            Frame.U64.pack(file_size),
+            Frame.U64.pack(Client.UPLOAD_CHUNK),
+            Frame.U64.pack(fingerprint),
+        )
+        if status != "OK":
+            return status, session_id
 
-        # Send DOWNLOAD request
-        Client.send_request("DOWNLOAD", writer, file_name)
+        # Ask which chunks server already holds, answer: 'OK;Chunks' + bitmap
+        status, info, bitmap_len = await session.exchange(
+            "UPLOAD_STATUS", session_id.encode()
+        )
+        if status != "OK":
+            return status, info
+        bitmap = await session.read(bitmap_len)
+
+        chunk_count = max(1, -(-file_size // Client.UPLOAD_CHUNK))
+        missing = [
+            index
+            for index in range(chunk_count)
+            if not bitmap[index // 8] & (0x80 >> (index % 8))
+        ]
+
+        # Bytes server already holds count as sent
+        missing_bytes = sum(
+            min(Client.UPLOAD_CHUNK, file_size - index * Client.UPLOAD_CHUNK)
+            for index in missing
+        )
+        progress.update(file_size - missing_bytes)
+
+        # Send missing chunks, answer to every chunk: 'OK;Stored' or 'BUSY;REASON;RETRY_AFTER'
+        pending = collections.deque(missing)
+        in_flight = collections.deque()  # (request_id, index, length)
+        # Set when server is busy, nothing is sent until window is empty
+        retry_after = None
+        busy = 0
+        with open(file_path, "rb") as f:
+            while pending or in_flight:
+                if (
+                    pending
+                    and retry_after is None
+                    and len(in_flight) < Client.UPLOAD_WINDOW
+                ):
+                    index = pending.popleft()
+                    f.seek(index * Client.UPLOAD_CHUNK)
+                    chunk = f.read(Client.UPLOAD_CHUNK)
+                    request_id = session.send(
+                        "UPLOAD_CHUNK",
+                        session_id.encode(),
+                        Frame.U64.pack(index),
+                        Frame.U64.pack(len(chunk)),
+                    )
+                    in_flight.append((request_id, index, len(chunk)))
+                    await session.write(chunk)
+
+                elif in_flight:
+                    request_id, index, length = in_flight.popleft()
+                    status, info, body_len = await session.response(request_id)
+                    if status == "BUSY":
+                        pending.append(index)
+                        retry_after = body_len / 1000
+                    elif status != "OK":
+                        return status, info
+                    else:
+                        progress.update(length)
+                        if retry_after is None:
+                            busy = 0
 
-        # Receive aswer: 'OK;Authenticated' or 'ERROR;FileNotFoundError' or 'ERROR;NotAuthenticatedError'
-        data = await reader.readuntil(Client.EOM.encode())
-        answer = data.decode()[:-1]  # Decode and strip EOM symbol
+                else:
+                    # All sent chunks answered, wait and try refused ones again
+                    if busy == Client.BUSY_RETRIES:
+                        return "BUSY", info
+                    await Client.backoff(busy, retry_after)
+                    busy += 1
+                    retry_after = None
 
-        if "OK" in answer:
-            # Answer: 'OK;Authenticated'
-            data = await reader.readuntil(Client.EOM.encode())
-            file_info = data.decode()[:-1]  # Decode and strip EOM symbol
-            file_name, file_size = file_info.split(";")
+        # Move file to user folder, answer: 'OK;Uploaded'
+        status, info, _ = await session.exchange("UPLOAD_COMMIT", session_id.encode())
+        return status, info
 
-            if "FileNotFoundError" in file_info:
-                # Answer: 'ERROR;FileNotFoundError'
-                print(f"Requested file does NOT exist, CANNOT download")
-                print("Check if file name is correct and try again")
+    @staticmethod
+    async def download(
+        file_name: str, session: "Session" = None, bar: tqdm.tqdm = None
+    ) -> bool:
+        """
+        Downloads file from server. Requires only file name. File is received into *FILENAME.part*
+        and renamed when complete. If the part already exists, e.g. after dropped connection,
+        download continues from its end, but only if validator of the file saved in *FILENAME.part.meta*
+        still matches, otherwise file was changed on server and download starts over. Files of at least
+        *STRIPE_THRESHOLD* bytes are downloaded over several connections, see :py:meth:`download_striped() <client.client.Client.download_striped>`.
 
-            else:
-                progress = tqdm.tqdm(
-                    range(int(file_size)),
-                    f"Receiving {file_name}",
-                    unit="B",
-                    unit_scale=True,
-                    unit_divisor=1024,
+        :param file_path: File name
+        :type file_path: str
+        :param session: Opened session, new one is opened if not given
+        :type session: Session
+        :param bar: Shared loading bar of the whole batch, file gets its own if not given
+        :type bar: tqdm.tqdm
+        :returns: Whether file was downloaded
+        :rtype: bool
+
+        """
+
+        if session is None:
+            async with Session() as session:
+                return await Client.download(file_name, session, bar)
+
+        validator = None
+        if Client.PROTOCOL == "frames" and Client.STRIPES > 1:
+            # Ask for file size, answer: 'OK;FILENAME;SIZE;VALIDATOR' or 'ERROR;FileNotFoundError'
+            status, info, file_size = await session.request("STAT", file_name)
+            validator = session.validator
+            if status == "OK" and file_size >= Client.STRIPE_THRESHOLD:
+                return await Client.download_striped(
+                    file_name, file_size, validator, session, bar
                 )
 
-                # Receive file
-                with open(
-                    str(os.path.join(Client.get_download_folder(), file_name)), "wb"
-                ) as f:
-                    while True:
-                        bytes_read = await reader.read(1024)
-                        if not bytes_read:
-                            break
-                        f.write(bytes_read)
-                        progress.update(len(bytes_read))
+        file_path = os.path.join(Client.get_download_folder(), file_name)
+        part_path = file_path + ".part"
+        meta_path = part_path + ".meta"
+
+        if os.path.exists(part_path + ".stripes"):
+            # Part of striped download is not filled from its start, it can't be resumed here
+            os.remove(part_path + ".stripes")
+            os.remove(part_path)
+
+        # Resume from end of partially downloaded file of the same version, old servers send whole file
+        offset = 0
+        if (
+            Client.PROTOCOL == "frames"
+            and os.path.exists(part_path)
+            and os.path.exists(meta_path)
+        ):
+            if validator is None:
+                await session.request("STAT", file_name)
+                validator = session.validator
+            with open(meta_path, "r") as f:
+                if validator is not None and f.read() == validator:
+                    offset = os.path.getsize(part_path)
+
+        # Send DOWNLOAD request, answer: 'OK;FILENAME' or 'ERROR;FileNotFoundError'
+        status, info, file_size = await session.request(
+            "DOWNLOAD", file_name, offset=offset
+        )
 
-        elif "NotAuthenticatedError" in answer:
-            # Answer: 'ERROR;NotAuthenticatedError'
-            print(
-                f"User '{Client.get_username()}' can't be authenticated, CANNOT downdload"
-            )
+        if status == "ERROR" and info == "InvalidRangeError":
+            # File on server is shorter than the part, it was changed, start over
+            offset = 0
+            status, info, file_size = await session.request("DOWNLOAD", file_name)
+
+        if status == "OK" and offset and session.validator != validator:
+            # File was changed after it was checked, skip the range and start over
+            while file_size > 0:
+                file_size -= len(await session.read(min(file_size, Client.CHUNK_SIZE)))
+            os.remove(meta_path)
+            return await Client.download(file_name, session, bar)
+
+        if status == "OK":
+            progress = Progress(f"Receiving {file_name}", offset + file_size, bar)
+            progress.update(offset)
+
+            if not offset and session.validator is not None:
+                # Remember version of file, download can be resumed only with it
+                with open(meta_path, "w") as f:
+                    f.write(session.validator)
+
+            # Receive file, append to the part when resuming
+            with open(part_path, "ab" if offset else "wb") as f:
+                remaining = file_size
+                while remaining > 0:
+                    bytes_read = await session.read(min(remaining, Client.CHUNK_SIZE))
+                    f.write(bytes_read)
+                    progress.update(len(bytes_read))
+                    remaining -= len(bytes_read)
+
+            os.replace(part_path, file_path)
+            if os.path.exists(meta_path):
+                os.remove(meta_path)
+            return True
+
+        elif "FileNotFoundError" in info:
+            # Answer: 'ERROR;FileNotFoundError'
+            print(f"Requested file '{file_name}' does NOT exist, CANNOT download")
+            print("Check if file name is correct and try again")
 
         else:
             # Answer: Any
             print("client.py: Unknown exeption")
 
-        writer.close()
-        await writer.wait_closed()
+        return False
 
     @staticmethod
-    async def remove(file_name: str):
+    async def download_striped(
+        file_name: str,
+        file_size: int,
+        validator: str,
+        session: "Session",
+        bar: tqdm.tqdm = None,
+    ) -> bool:
         """
-        Removes file from server. File must be acessible to currently loged in user.
+        Downloads large file in stripes of *STRIPE_SIZE* bytes over *STRIPES* parallel sessions, so one
+        slow TCP stream does not limit the transfer. Every stripe is requested as range of the file and written
+        to its place in preallocated *FILENAME.part*. Finished stripes are recorded in *FILENAME.part.stripes*
+        after validator of the file, interrupted download continues with the missing ones only if the validator
+        still matches. Stripe of file changed on server during the download is refused.
 
         :param file_name: File name
         :type file_name: str
-        
+        :param file_size: Size of the file on server
+        :type file_size: int
+        :param validator: Validator of the file on server
+        :type validator: str
+        :param session: Opened session using frames, used for the first stripe
+        :type session: Session
+        :param bar: Shared loading bar of the whole batch, file gets its own if not given
+        :type bar: tqdm.tqdm
+        :returns: Whether file was downloaded
+        :rtype: bool
+
         """
 
-        reader, writer = await Client.open_connection()
+        file_path = os.path.join(Client.get_download_folder(), file_name)
+        part_path = file_path + ".part"
+        record_path = part_path + ".stripes"
+        stripe_count = -(-file_size // Client.STRIPE_SIZE)
+
+        # Continue interrupted striped download of the same version, otherwise preallocate new part
+        done = None
+        if (
+            os.path.exists(record_path)
+            and os.path.exists(part_path)
+            and os.path.getsize(part_path) == file_size
+        ):
+            with open(record_path, "r") as f:
+                if f.readline().rstrip("\n") == validator:
+                    done = {int(line) for line in f if line.strip()}
+        if done is None:
+            done = set()
+            with open(part_path, "wb") as f:
+                f.truncate(file_size)
+            with open(record_path, "w") as f:
+                f.write(f"{validator}\n")
+
+        stripes = collections.deque(
+            index for index in range(stripe_count) if index not in done
+        )
 
-        # Send request to server
-        Client.send_request("REMOVE", writer, file_name)
+        progress = Progress(f"Receiving {file_name}", file_size, bar)
+        progress.update(
+            sum(
+                min(Client.STRIPE_SIZE, file_size - index * Client.STRIPE_SIZE)
+                for index in done
+            )
+        )
 
-        # Receive answer: 'OK;Authenticated' or 'ERROR;FileNotFoundError' or 'ERROR;NotAuthenticatedError'
-        data = await reader.readuntil(Client.EOM.encode())
-        answer = data.decode()[:-1]  # Decode and strip EOM symbol
+        fd = os.open(part_path, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+        try:
+            with open(record_path, "a") as record:
+                results = await asyncio.gather(
+                    Client.fetch_stripes(
+                        file_name, validator, stripes, fd, record, progress, session
+                    ),
+                    *(
+                        Client.fetch_stripes(
+                            file_name, validator, stripes, fd, record, progress
+                        )
+                        for _ in range(min(Client.STRIPES, len(stripes)) - 1)
+                    ),
+                    return_exceptions=True,
+                )
+        finally:
+            os.close(fd)
 
-        if "OK" in answer:
-            # Answer: 'OK;Authenticated'
-            data = await reader.readuntil(Client.EOM.encode())
-            delete_info = data.decode()[:-1]  # Decode and strip EOM symbol
+        for result in results:
+            if result is not True:
+                print(f"client.py: Download of '{file_name}' failed with {result}")
+                return False
 
-            if "FileDeleted" in delete_info:
-                # delete_info: 'OK;FileDeleted'
-                print(f"File '{file_name}' successfully removed")
+        os.replace(part_path, file_path)
+        os.remove(record_path)
+        return True
 
-            if "FileNotFoundError" in delete_info:
-                # Answer: 'ERROR;FileNotFoundError'
-                print(f"File '{file_name}' does NOT exist, CANNOT remove")
-                print("Check correct file name and try again")
+    @staticmethod
+    async def fetch_stripes(
+        file_name: str,
+        validator: str,
+        stripes: collections.deque,
+        fd: int,
+        record,
+        progress: "Progress",
+        session: "Session" = None,
+    ) -> bool:
+        """
+        Downloads stripes taken from shared queue until it is empty and writes them to their place
+        in the part file with ``os.pwrite``. Stripe of other version of the file than *validator* is not written.
 
-        elif "NotAuthenticatedError" in answer:
-            # Answer: 'ERROR;NotAuthenticatedError'
-            print(
-                f"User '{Client.get_username()}' can't be authenticated, CANNOT remove"
+        :param file_name: File name
+        :type file_name: str
+        :param validator: Validator of the file the part belongs to
+        :type validator: str
+        :param stripes: Queue of stripe numbers shared by all parallel sessions
+        :type stripes: collections.deque
+        :param fd: File descriptor of preallocated part file
+        :type fd: int
+        :param record: Opened file finished stripes are recorded in
+        :type record: file object
+        :param progress: Progress of the download
+        :type progress: Progress
+        :param session: Opened session, new one is opened if not given
+        :type session: Session
+        :returns: True if all taken stripes were downloaded, error name otherwise
+        :rtype: bool | str
+
+        """
+
+        if session is None:
+            async with Session() as session:
+                return await Client.fetch_stripes(
+                    file_name, validator, stripes, fd, record, progress, session
+                )
+
+        while stripes:
+            index = stripes.popleft()
+            offset = index * Client.STRIPE_SIZE
+
+            # Request range of the file, answer: 'OK;FILENAME;LENGTH;VALIDATOR'
+            status, info, remaining = await session.request(
+                "DOWNLOAD", file_name, offset=offset, length=Client.STRIPE_SIZE
             )
+            if status != "OK":
+                return info
+            if session.validator != validator:
+                # File was changed on server, its stripes can't be joined
+                while remaining > 0:
+                    remaining -= len(
+                        await session.read(min(remaining, Client.CHUNK_SIZE))
+                    )
+                return "FileChangedError"
+
+            while remaining > 0:
+                bytes_read = await session.read(min(remaining, Client.CHUNK_SIZE))
+                if hasattr(os, "pwrite"):
+                    os.pwrite(fd, bytes_read, offset)
+                else:
+                    # No pwrite on Windows, no other stripe runs between seek and write
+                    os.lseek(fd, offset, os.SEEK_SET)
+                    os.write(fd, bytes_read)
+                offset += len(bytes_read)
+                remaining -= len(bytes_read)
+                progress.update(len(bytes_read))
+
+            record.write(f"{index}\n")
+            record.flush()
+
+        return True
+
+    @staticmethod
+    async def remove(
+        file_name: str, session: "Session" = None, bar: tqdm.tqdm = None
+    ) -> bool:
+        """
+        Removes file from server. File must be acessible to currently loged in user.
+
+        :param file_name: File name
+        :type file_name: str
+        :param session: Opened session, new one is opened if not given
+        :type session: Session
+        :param bar: Unused, accepted so all batch operations share the same signature
+        :type bar: tqdm.tqdm
+        :returns: Whether file was removed
+        :rtype: bool
+
+        """
+
+        if session is None:
+            async with Session() as session:
+                return await Client.remove(file_name, session)
+
+        # Send request to server, answer: 'OK;FileDeleted' or 'ERROR;FileNotFoundError'
+        status, info, _ = await session.request("REMOVE", file_name)
+
+        if "FileDeleted" in info:
+            # Answer: 'OK;FileDeleted'
+            print(f"File '{file_name}' successfully removed")
+            return True
+
+        elif "FileNotFoundError" in info:
+            # Answer: 'ERROR;FileNotFoundError'
+            print(f"File '{file_name}' does NOT exist, CANNOT remove")
+            print("Check correct file name and try again")
 
         else:
             # Answer: Any
             print("client.py: Unknown exeption")
 
-        writer.close()
-        await writer.wait_closed()
+        return False
 
     @staticmethod
     async def list_files(detailed: bool):
@@ -291,57 +684,35 @@ class Client:
 
         """
 
-        # Open connection with server
-        reader, writer = await Client.open_connection()
-
-        # Send request to server
-        Client.send_request("LIST_DIR", writer)
-
-        # Receive answer: 'OK;Authenticated' or 'ERROR;NotAuthenticatedError'
-        data = await reader.readuntil(Client.EOM.encode())
-        answer = data.decode()[:-1]  # Decode and strip EOM symbol
+        async with Session() as session:
+            # Send request to server, answer: 'OK;Listing'
+            status, _, body_len = await session.request("LIST_DIR")
+            list = pickle.loads(await session.read(body_len))
 
-        if "OK" in answer:
-            # Answer: 'OK;Authenticated'
-            list = pickle.loads(await reader.read())
-
-            if detailed:
-                # Detailed list
-                print(
-                    "{:<15} {:<12} {:<12} {:<15}".format(
-                        "Owner", "Created", "Downloads", "File"
-                    )
+        if detailed:
+            # Detailed list
+            print(
+                "{:<15} {:<12} {:<12} {:<15}".format(
+                    "Owner", "Created", "Downloads", "File"
                 )
-                print("{:–<60}".format("–"))
-                if len(list) != 0:
-                    for row in list:
-                        print(
-                            "{:<15} {:<15} {:<9} {:<15}".format(
-                                row[1], row[2], str(row[3]), row[0]
-                            )
+            )
+            print("{:–<60}".format("–"))
+            if len(list) != 0:
+                for row in list:
+                    print(
+                        "{:<15} {:<15} {:<9} {:<15}".format(
+                            row[1], row[2], str(row[3]), row[0]
                         )
-                else:
-                    print("{:^65}".format("Nothing here"))
+                    )
             else:
-                # Short list
-                if len(list) != 0:
-                    for row in list:
-                        print(row[0], end="\t")
-                else:
-                    print("Nothing here")
-
-        elif "NotAuthenticatedError" in answer:
-            # Answer: 'ERROR;NotAuthenticatedError'
-            print(
-                f"User '{Client.get_username()}' can't be authenticated, CANNOT list files"
-            )
-
+                print("{:^65}".format("Nothing here"))
         else:
-            # Answer: Any
-            print("client.py: Unknown exeption")
-
-        writer.close()
-        await writer.wait_closed()
+            # Short list
+            if len(list) != 0:
+                for row in list:
+                    print(row[0], end="\t")
+            else:
+                print("Nothing here")
 
     @staticmethod
     def init() -> None:
@@ -387,33 +758,19 @@ class Client:
         if not os.path.exists(Client.SERVER_PUBLIC_KEY):
             print("INFO: No server key found, requesting new...")
 
-            reader, writer = await Client.open_connection()
-
-            # Send GETKEY request
-            writer.write(f"GETKEY{Client.EOM}".encode())
+            async with Session(authenticate=False) as session:
+                answer = await session.handshake("GETKEY")
 
-            # Receive aswer: 'OK;Authenticated' or 'ERROR;FileNotFoundError' or 'ERROR;NotAuthenticatedError'
-            data = await reader.readuntil(Client.EOM.encode())
-            answer = data.decode()[:-1]  # Decode and strip EOM symbol
-
-            if "OK" in answer:
-                # Answer: 'OK;Authenticated'
-                # Receive file
+            if answer is not None:
+                # Save received key
                 with open(str(Client.SERVER_PUBLIC_KEY), "wb") as f:
-                    while True:
-                        bytes_read = await reader.read(1024)
-                        if not bytes_read:
-                            break
-                        f.write(bytes_read)
+                    f.write(answer[0])
                 print("INFO: Key downloaded sucessfully.")
 
             else:
                 # Answer: Any
                 print("client.py: Unknown exeption while obtaining server public key")
 
-            writer.close()
-            await writer.wait_closed()
-
     @staticmethod
     def user_exists():
         """
@@ -456,7 +813,8 @@ class Client:
         usr_nonce = uuid.uuid4().hex
 
         # Open connection
-        reader, writer = await Client.open_connection()
+        session = Session(authenticate=False)
+        await session.open()
 
         # Get public key from file
         pub_key = RSA.import_key(open(Client.SERVER_PUBLIC_KEY).read())
@@ -468,27 +826,14 @@ class Client:
         m = f"{username};{usr_nonce}".encode()
         c = rsa_instance.encrypt(m)
 
-        # Request start of login session
-        writer.write(f"LOGIN{Client.EOM}".encode())
-
-        # Receive answer: 'OK;Ready'
-        data = await reader.readuntil(Client.EOM.encode())
-        answer = data.decode()[:-1]
-
-        # If server is ready send E(username, usr-nonce)
-        if "OK" in answer:
-            writer.write(str(len(c)).encode() + Client.EOM.encode())
-            writer.write(c)
-
+        # Request start of login session and send E(username, usr-nonce)
         # Await E((usr-nonce, ser-nonce), hash(password)), salt
-        paylen = await reader.readuntil(Client.EOM.encode())
-        paylen = paylen.decode()[:-1]
-
-        c_len, tag_len, nonce_len, byte_salt_len = paylen.split(";")
-        c = await reader.read(int(c_len))
-        tag = await reader.read(int(tag_len))
-        nonce = await reader.read(int(nonce_len))
-        byte_salt = await reader.read(int(byte_salt_len))
+        answer = await session.handshake("LOGIN", c)
+        if answer is None:
+            await session.close()
+            print(f"ERROR: Login of user '{username}' failed!")
+            return
+        c, tag, nonce, byte_salt = answer
 
         # Decrypt D((usr-nonce, ser-nonce), hash(password)), salt
         pass_hash = str(
@@ -500,18 +845,14 @@ class Client:
         m = aes_instance.decrypt_and_verify(c, tag)
 
         # Send E((usr-nonce, ser-nonce), pub.key)
-        c = rsa_instance.encrypt(m)
-        writer.write(str(len(c)).encode() + Client.EOM.encode())
-        writer.write(c)
-
         # Await response with symetric key
-        paylen = await reader.readuntil(Client.EOM.encode())
-        paylen = paylen.decode()[:-1]
+        answer = await session.handshake("LOGIN", rsa_instance.encrypt(m))
+        await session.close()
 
-        c_len, tag_len, nonce_len = paylen.split(";")
-        c = await reader.read(int(c_len))
-        tag = await reader.read(int(tag_len))
-        nonce = await reader.read(int(nonce_len))
+        if answer is None:
+            print(f"ERROR: Login of user '{username}' failed!")
+            return
+        c, tag, nonce = answer
 
         # Decrypt incoming aes_key
         aes_instance = AES.new(byte_pass, AES.MODE_EAX, nonce)
@@ -532,9 +873,6 @@ class Client:
                 f"DOWNLOAD_FOLDER={Path(os.path.expanduser('~/Downloads'))}"
             )
 
-        writer.close()
-        await writer.wait_closed()
-
         print("INFO: You are now logged in as " + username)
         return
 
@@ -665,3 +1003,442 @@ class Client:
         print("More on: https://github.com/martin-nohava/kryzbu")
         print("License: MIT\n")
         print("{:█^80}".format(" © 2022 – kryzbu "))
+
+
+class Progress:
+    """
+    Progress of one transfer. It is shown on its own loading bar, or added to shared loading bar
+    of the whole batch (see :py:class:`Scheduler <client.scheduler.Scheduler>`).
+
+    """
+
+    def __init__(self, description: str, total: int, bar: tqdm.tqdm = None):
+        if bar is None:
+            bar = tqdm.tqdm(
+                total=total,
+                desc=description,
+                unit="B",
+                unit_scale=True,
+                unit_divisor=1024,
+            )
+        else:
+            bar.total += total
+            bar.refresh()
+        self.bar: tqdm.tqdm = bar
+        self.done: int = 0  # Bytes of this transfer shown on the bar
+
+    def update(self, n: int):
+        """
+        Moves progress by *n* transferred bytes.
+
+        :param n: Number of bytes
+        :type n: int
+
+        """
+
+        self.done += n
+        self.bar.update(n)
+
+    def reset(self):
+        """
+        Takes back all bytes of this transfer, e.g. before interrupted transfer is resumed.
+
+        """
+
+        self.bar.update(-self.done)
+        self.done = 0
+
+
+class Tls_context(ssl.SSLContext):
+    """
+    | SSL context which offers TLS session of previous connection to the server, so following connections
+    | are resumed with abbreviated handshake (no certificate exchange and verification). Server issues
+    | session tickets after every full handshake, ticket is remembered when first reply arrives on the connection.
+    | If server does not accept the ticket, for example after its restart, full handshake is made as before.
+    |
+    | Python can not export TLS session out of the process, so sessions are kept only in memory and every run
+    | of the client starts with one full handshake. All further connections of the run (concurrent transfers,
+    | download stripes, resumed uploads) are resumed.
+    """
+
+    session: ssl.SSLSession = None  # Session offered to the server
+
+    def wrap_bio(
+        self,
+        incoming,
+        outgoing,
+        server_side=False,
+        server_hostname=None,
+        session=None,
+    ):
+        # Called by event loop for every new connection
+        return super().wrap_bio(
+            incoming, outgoing, server_side, server_hostname, session or self.session
+        )
+
+    def remember(self, writer: asyncio.StreamWriter):
+        """
+        Remembers TLS session of the connection, if server issued ticket for it.
+
+        :param writer: writer instance
+        :type writer: asyncio.StreamWriter
+
+        """
+
+        ssl_object = writer.get_extra_info("ssl_object")
+        if ssl_object is not None and ssl_object.session is not None:
+            if ssl_object.session.has_ticket:
+                self.session = ssl_object.session
+
+
+class Session:
+    """
+    Connection to the Kryzbu server carrying any number of requests. Requests are sent as binary frames
+    (see :py:class:`Frame <client.protocol.Frame>`) and connection is authenticated only once by *AUTH* frame,
+    so TCP and TLS handshake is paid only once. Every request has its own ID, server repeats it in the reply
+    so replies can be matched with requests.
+
+    If server does not support binary frames, session falls back to the old text protocol and opens
+    new connection for every request.
+
+    Session is used as async context manager:
+
+    .. code-block:: python
+
+        async with Session() as session:
+            await Client.upload("file.txt", session)
+
+    """
+
+    def __init__(self, authenticate: bool = True):
+        self.reader: asyncio.StreamReader = None
+        self.writer: asyncio.StreamWriter = None
+        self.request_id: int = 0
+        self.authenticate: bool = authenticate
+        self.buffer: bytes = b""  # Body already read from server (text protocol only)
+        self.validator: str = None  # File version of the last DOWNLOAD or STAT reply
+
+    async def __aenter__(self) -> "Session":
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def open(self):
+        """
+        Opens connection to the server, negotiates protocol and authenticates connection with user's AES key.
+        Authentication refused by busy server is repeated after :py:meth:`backoff() <client.client.Client.backoff>`.
+
+        """
+
+        if await self.negotiate() and self.authenticate:
+            c, tag, pad, nonce = Client.encrypt_request("AUTH")
+
+            # Receive answer: 'OK;Authenticated' or 'ERROR;NotAuthenticatedError'
+            status, _, _ = await self.exchange(
+                "AUTH", Client.get_username().encode(), c, tag, pad, nonce
+            )
+
+            if status != "OK":
+                print(
+                    f"User '{Client.get_username()}' can't be authenticated, CANNOT open session"
+                )
+                exit(1)
+
+    async def negotiate(self) -> bool:
+        """
+        Opens connection and asks server for binary frames. Result is remembered in *Client.PROTOCOL*,
+        so it is negotiated only once. Connection refused by busy server is opened again
+        after :py:meth:`backoff() <client.client.Client.backoff>`.
+
+        :returns: Whether binary frames are used.
+        :rtype: bool
+
+        """
+
+        if Client.PROTOCOL == "text":
+            return False
+
+        for attempt in range(Client.BUSY_RETRIES + 1):
+            self.reader, self.writer = await Client.open_connection()
+            self.writer.write(f"{Frame.HELLO};{Frame.VERSION}{Client.EOM}".encode())
+
+            # Receive answer: 'OK;HELLO;VERSION' or 'BUSY;REASON;RETRY_AFTER',
+            # old servers answer anything else or close connection
+            try:
+                data = await self.reader.readuntil(Client.EOM.encode())
+                answer = data.decode()[:-1]  # Decode and strip EOM symbol
+            except (asyncio.IncompleteReadError, ConnectionError):
+                answer = None
+
+            if answer is None or not answer.startswith("BUSY;"):
+                break
+
+            _, reason, retry_after = answer.split(";")
+            await self.close()
+            if attempt == Client.BUSY_RETRIES:
+                raise ConnectionError(f"Server is busy ({reason})")
+            await Client.backoff(attempt, int(retry_after) / 1000)
+
+        if answer == f"OK;{Frame.HELLO};{Frame.VERSION}":
+            # Ticket is sent by server right after handshake, so it already arrived
+            Client.SSL_CONTEXT.remember(self.writer)
+            Client.PROTOCOL = "frames"
+            return True
+
+        # Fall back to text protocol
+        Client.PROTOCOL = "text"
+        await self.close()
+        return False
+
+    async def handshake(self, type: str, *parts: bytes) -> list:
+        """
+        Sends one step of request not requireing authentication (GETKEY, LOGIN) and returns parts of server's answer.
+        Step refused by busy server is sent again after :py:meth:`backoff() <client.client.Client.backoff>` (frames only).
+
+        :param type: Type of request. (GETKEY, LOGIN)
+        :type type: str
+        :param parts: Parts of message sent to server
+        :type parts: bytes
+        :returns: Parts of answer, None if server refused the request.
+        :rtype: list[bytes]
+
+        """
+
+        self.request_id += 1
+
+        try:
+            if Client.PROTOCOL == "frames":
+                for attempt in range(Client.BUSY_RETRIES + 1):
+                    Frame.write(self.writer, Frame.Op[type], self.request_id, *parts)
+                    await self.writer.drain()
+
+                    op, _, fields = await Frame.read(self.reader)
+                    if op != Frame.Op.BUSY or attempt == Client.BUSY_RETRIES:
+                        return fields if op == Frame.Op.OK else None
+
+                    # Answer: 'BUSY;REASON;RETRY_AFTER', repeat the step later
+                    retry_after = Frame.U64.unpack(fields[1])[0] / 1000
+                    await Client.backoff(attempt, retry_after)
+                    self.request_id += 1
+
+            if self.writer is None:
+                # First step, request start of the exchange, answer: 'OK;...'
+                self.reader, self.writer = await Client.open_connection()
+                self.writer.write(f"{type}{Client.EOM}".encode())
+                data = await self.reader.readuntil(Client.EOM.encode())
+                if "OK" not in data.decode():
+                    return None
+                if type == "GETKEY":
+                    # Key is sent until connection is closed
+                    return [await self.reader.read()]
+
+            # Send parts announced by their lengths and receive answer the same way
+            self.writer.write(
+                ";".join(str(len(part)) for part in parts).encode()
+                + Client.EOM.encode()
+            )
+            self.writer.writelines(parts)
+            data = await self.reader.readuntil(Client.EOM.encode())
+            return [
+                await self.reader.readexactly(int(length))
+                for length in data.decode()[:-1].split(";")
+            ]
+        except asyncio.IncompleteReadError:
+            # Server closed connection, request refused
+            return None
+
+    async def request(
+        self,
+        type: str,
+        file_name: str = "empty",
+        size: int = 0,
+        offset: int = 0,
+        length: int = None,
+    ) -> Tuple:
+        """
+        Sends request to the server and waits for its reply. Request refused by busy server is sent again
+        after :py:meth:`backoff() <client.client.Client.backoff>`, up to *Client.BUSY_RETRIES* times.
+
+        :param type: Type of request. (UPLOAD, DOWNLOAD etc.)
+        :type type: str
+        :param file_name: File name the request applies to
+        :type file_name: str
+        :param size: Size of data client is going to send (UPLOAD)
+        :type size: int
+        :param offset: Position of first requested byte (DOWNLOAD, frames only)
+        :type offset: int
+        :param length: Number of requested bytes, None for rest of the file (DOWNLOAD, frames only)
+        :type length: int
+        :returns: Status, info and length of body following the reply.
+        :rtype: Tuple: (status, info, body_len)
+
+        """
+
+        if Client.PROTOCOL == "frames":
+            if type == "UPLOAD":
+                fields = (file_name.encode(), Frame.U64.pack(size))
+            elif type == "DOWNLOAD":
+                fields = (file_name.encode(), Frame.U64.pack(offset))
+                if length is not None:
+                    fields += (Frame.U64.pack(length),)
+            elif type == "LIST_DIR":
+                fields = ()
+            else:
+                fields = (file_name.encode(),)
+            return await self.exchange(type, *fields)
+
+        # Text protocol, every request needs its own connection
+        for attempt in range(Client.BUSY_RETRIES + 1):
+            await self.close()
+            self.reader, self.writer = await Client.open_connection()
+            Client.send_request(type, self.writer, file_name)
+
+            # Receive answer: 'OK;Authenticated', 'ERROR;NotAuthenticatedError' or 'BUSY;REASON;RETRY_AFTER'
+            data = await self.reader.readuntil(Client.EOM.encode())
+            answer = data.decode()[:-1]  # Decode and strip EOM symbol
+
+            if not answer.startswith("BUSY;"):
+                break
+            _, reason, retry_after = answer.split(";")
+            if attempt == Client.BUSY_RETRIES:
+                await self.close()
+                return "BUSY", reason, int(retry_after)
+            await Client.backoff(attempt, int(retry_after) / 1000)
+
+        if "OK" not in answer:
+            return "ERROR", "NotAuthenticatedError", 0
+        elif type == "UPLOAD":
+            # File is sent until connection is closed
+            return "OK", "Ready", 0
+        elif type == "LIST_DIR":
+            # List is sent until connection is closed
+            self.buffer = await self.reader.read()
+            return "OK", "Listing", len(self.buffer)
+
+        # Answer: 'FILENAME;SIZE', 'OK;FileDeleted;FILENAME' or 'ERROR;FileNotFoundError'
+        data = await self.reader.readuntil(Client.EOM.encode())
+        answer = data.decode()[:-1].split(";")
+
+        if answer[0] == "ERROR":
+            return "ERROR", answer[1], 0
+        elif type == "DOWNLOAD":
+            return "OK", answer[0], int(answer[1])
+        else:
+            return "OK", answer[1], 0
+
+    async def exchange(self, type: str, *fields: bytes) -> Tuple:
+        """
+        Sends request frame and waits for its reply (frames only). Request refused by busy server is sent again
+        after :py:meth:`backoff() <client.client.Client.backoff>`, up to *Client.BUSY_RETRIES* times.
+
+        :param type: Type of request. (UPLOAD_OPEN etc.)
+        :type type: str
+        :param fields: Fields of payload
+        :type fields: bytes
+        :returns: Status, info and length of body following the reply.
+        :rtype: Tuple: (status, info, body_len)
+
+        """
+
+        for attempt in range(Client.BUSY_RETRIES + 1):
+            request_id = self.send(type, *fields)
+            await self.writer.drain()
+
+            # Answer: 'BUSY;REASON;RETRY_AFTER' if server is busy
+            status, info, body_len = await self.response(request_id)
+            if status != "BUSY" or attempt == Client.BUSY_RETRIES:
+                return status, info, body_len
+            await Client.backoff(attempt, body_len / 1000)
+
+    def send(self, type: str, *fields: bytes) -> int:
+        """
+        Sends request frame without waiting for its reply, so more requests can be sent before replies
+        are read (frames only). Replies come in the same order as requests.
+
+        :param type: Type of request. (UPLOAD_CHUNK etc.)
+        :type type: str
+        :param fields: Fields of payload
+        :type fields: bytes
+        :returns: ID of the request
+        :rtype: int
+
+        """
+
+        self.request_id += 1
+        Frame.write(self.writer, Frame.Op[type], self.request_id, *fields)
+        return self.request_id
+
+    async def response(self, request_id: int = None) -> Tuple:
+        """
+        Reads reply to the request, reply carries status, info and optionally length of body following the reply.
+
+        :param request_id: ID of request the reply belongs to, the last request if not given
+        :type request_id: int
+        :returns: Status, info and length of body following the reply.
+        :rtype: Tuple: (status, info, body_len)
+
+        """
+
+        if request_id is None:
+            request_id = self.request_id
+
+        if Client.PROTOCOL != "frames":
+            # Text protocol confirms nothing, upload finishes by closing connection
+            await self.close()
+            return "OK", "Uploaded", 0
+
+        op, reply_id, fields = await Frame.read(self.reader)
+
+        if reply_id != request_id:
+            raise Exception(
+                f"Session reply does NOT match request, expected ID: {request_id}, received ID: {reply_id}"
+            )
+
+        body_len = Frame.U64.unpack(fields[1])[0] if len(fields) > 1 else 0
+        self.validator = fields[2].decode() if len(fields) > 2 else None
+        return op.name, fields[0].decode(), body_len
+
+    async def read(self, n: int) -> bytes:
+        """
+        Reads exactly *n* bytes of body following the reply.
+
+        :param n: Number of bytes
+        :type n: int
+        :returns: Body data
+        :rtype: bytes
+
+        """
+
+        if self.buffer:
+            data, self.buffer = self.buffer[:n], self.buffer[n:]
+            return data
+        return await self.reader.readexactly(n)
+
+    async def write(self, data: bytes):
+        """
+        Writes body data following the request and waits until they can be sent.
+
+        :param data: Body data
+        :type data: bytes
+
+        """
+
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def close(self):
+        """
+        Closes session connection.
+
+        """
+
+        if self.writer is not None:
+            Client.SSL_CONTEXT.remember(self.writer)
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+            self.writer = None
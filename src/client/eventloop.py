@@ -0,0 +1,63 @@
+# Eventloop is library for selecting asyncio event loop implementation of Kryzbu client
+#
+# Source code available on: https://github.com/martin-nohava/kryzbu.
+
+import asyncio
+
+
+class Event_loop:
+    """
+    | Selects implementation of event loop used by all following ``asyncio.run()`` calls. Must be same as in *server/eventloop.py*.
+    |
+    | **Supported loops:**
+    | *asyncio* – event loop of standard library
+    | *uvloop* – `uvloop <https://github.com/MagicStack/uvloop>`_, faster loop built on libuv, used only when installed
+    |
+    | **Global variables in this class:**
+    | **NAMES** (*tuple*) – names of supported loops, first one is default
+    """
+
+    NAMES = ("asyncio", "uvloop")
+
+    @staticmethod
+    def available() -> list:
+        """
+        Returns names of loops which can be used on this system.
+
+        :rtype: list[str]
+
+        """
+
+        names = ["asyncio"]
+        try:
+            import uvloop
+
+            names.append("uvloop")
+        except ImportError:
+            pass
+        return names
+
+    @staticmethod
+    def use(name: str) -> str:
+        """
+        Sets event loop implementation. When selected loop is not installed, standard asyncio loop is used.
+
+        :param name: Name of loop, one of *NAMES*
+        :type name: str
+        :returns: Name of loop actually used
+        :rtype: str
+
+        """
+
+        if name == "uvloop":
+            try:
+                import uvloop
+
+                asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+                return name
+            except ImportError:
+                print("WARNING, Event_loop: uvloop is not installed, using asyncio")
+
+        # Default policy creates standard asyncio loop
+        asyncio.set_event_loop_policy(None)
+        return "asyncio"
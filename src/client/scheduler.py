@@ -0,0 +1,119 @@
+# Scheduler is library for running transfers of Kryzbu client concurrently
+#
+# Source code available on: https://github.com/martin-nohava/kryzbu.
+
+import asyncio
+import tqdm
+from .client import Session
+
+
+class Scheduler:
+    """
+    | Runs operation (upload, download, remove) for batch of files with several transfers at once.
+    | Every job owns one session (connection) and takes files from shared queue until it is empty,
+    | all jobs run in a single event loop. Transfers report to one shared loading bar and failure
+    | of a file does not stop the rest of the batch.
+    |
+    | **Global variables in this class:**
+    | **JOBS** (*int*) – default number of concurrent transfers
+    """
+
+    JOBS = 4
+
+    @staticmethod
+    async def run(
+        operation, items: list, jobs: int = JOBS, progress: bool = True
+    ) -> list:
+        """
+        Runs operation for every item with up to *jobs* concurrent transfers and reports failed items.
+
+        :param operation: One of Client.upload, Client.download, Client.remove
+        :type operation: coroutine function
+        :param items: File paths or file names the operation is called with
+        :type items: list
+        :param jobs: Number of concurrent transfers
+        :type jobs: int
+        :param progress: Show shared loading bar of the whole batch
+        :type progress: bool
+        :returns: Items which failed
+        :rtype: list
+
+        """
+
+        queue = asyncio.Queue()
+        for index, item in enumerate(items):
+            queue.put_nowait((index, item))
+
+        bar = None
+        if progress:
+            bar = tqdm.tqdm(
+                total=0,
+                desc=f"{len(items)} files",
+                unit="B",
+                unit_scale=True,
+                unit_divisor=1024,
+            )
+
+        succeeded = set()
+        await asyncio.gather(
+            *(
+                Scheduler.job(operation, queue, succeeded, bar)
+                for _ in range(min(max(jobs, 1), len(items)))
+            )
+        )
+
+        if bar is not None:
+            bar.close()
+
+        failed = [item for index, item in enumerate(items) if index not in succeeded]
+        if failed:
+            print(
+                f"ERROR: {len(failed)} of {len(items)} files failed: {', '.join(failed)}"
+            )
+        return failed
+
+    @staticmethod
+    async def job(
+        operation, queue: asyncio.Queue, succeeded: set, bar: tqdm.tqdm = None
+    ):
+        """
+        Runs operation for items taken from queue over its own session until queue is empty.
+        Item whose operation raises is reported as failed and session is opened again for the next item.
+
+        :param operation: One of Client.upload, Client.download, Client.remove
+        :type operation: coroutine function
+        :param queue: Queue of (index, item) pairs
+        :type queue: asyncio.Queue
+        :param succeeded: Indexes of succeeded items are added here
+        :type succeeded: set
+        :param bar: Shared loading bar
+        :type bar: tqdm.tqdm
+
+        """
+
+        session = Session()
+        opened = False
+        try:
+            while not queue.empty():
+                index, item = queue.get_nowait()
+                if not opened:
+                    try:
+                        await session.open()
+                    except OSError as e:
+                        # Can't connect, files left in queue are taken by other jobs or reported as failed
+                        tqdm.tqdm.write(f"client.py: Job stopped, {e}")
+                        return
+                    opened = True
+
+                try:
+                    if await operation(item, session, bar):
+                        succeeded.add(index)
+                except Exception as e:
+                    # Session may be out of sync with server, next item gets a new one
+                    tqdm.tqdm.write(
+                        f"client.py: Transfer of '{item}' failed with {type(e).__name__}: {e}"
+                    )
+                    await session.close()
+                    opened = False
+        finally:
+            await session.close()
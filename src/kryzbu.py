@@ -8,6 +8,8 @@ import argparse
 import asyncio
 from multiprocessing.connection import Client
 from client import client
+from client import scheduler
+from client.eventloop import Event_loop
 
 client.Client.init()
 
@@ -65,23 +67,41 @@ group.add_argument(
 parser.add_argument(
     "--setfolder", metavar="/path/to/file", help="set download folder", type=str
 )
+parser.add_argument(
+    "-j",
+    "--jobs",
+    metavar="N",
+    help=f"number of concurrent transfers (default: {scheduler.Scheduler.JOBS})",
+    default=scheduler.Scheduler.JOBS,
+    type=int,
+)
+parser.add_argument(
+    "--loop",
+    help=f"event loop implementation (default: {Event_loop.NAMES[0]})",
+    choices=Event_loop.NAMES,
+    default=Event_loop.NAMES[0],
+)
 args = parser.parse_args()
+Event_loop.use(args.loop)
 
 if args.upload:
     # Upload file to a server
     client.Client.online_operation(True)
-    for file in args.upload:
-        asyncio.run(client.Client.upload(file))
+    asyncio.run(scheduler.Scheduler.run(client.Client.upload, args.upload, args.jobs))
 elif args.download:
     # Download file from server
     client.Client.online_operation(True)
-    for file in args.download:
-        asyncio.run(client.Client.download(file))
+    asyncio.run(
+        scheduler.Scheduler.run(client.Client.download, args.download, args.jobs)
+    )
 elif args.remove:
     # Remove file from server
     client.Client.online_operation(True)
-    for file in args.remove:
-        asyncio.run(client.Client.remove(file))
+    asyncio.run(
+        scheduler.Scheduler.run(
+            client.Client.remove, args.remove, args.jobs, progress=False
+        )
+    )
 elif args.list:
     # List available files on server
     client.Client.online_operation(True)
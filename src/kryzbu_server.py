@@ -5,10 +5,17 @@
 # as a standard command-line tool from everywhere.
 
 import os
+import json
 from pathlib import Path
 from server import server
-from server.db import User_db
+from server.db import Merkle_index, User_db
 from server.loglib import Log
+from server.merkle import Merkle
+from server.rsalib import Rsa
+from server.metrics import Metrics
+from server.bandwidth import Bandwidth
+from server.executor import Executor
+from server.eventloop import Event_loop
 import argparse
 
 
@@ -31,16 +38,122 @@ group.add_argument(
     "-i",
     "--integrity",
     metavar="FILE",
-    help="check log file integrity",
+    help="check integrity of log files, manifest and all log segments when no FILE is given",
     action="extend",
+    nargs="*",
+    type=str,
+)
+group.add_argument(
+    "-q",
+    "--query",
+    help="print structured log records matching --user, --event, --since and --until",
+    action="store_true",
+)
+group.add_argument(
+    "--proof",
+    metavar="INDEX",
+    help="print proof that log record is in the log, records are numbered from 0",
+    type=int,
+)
+group.add_argument(
+    "--consistency",
+    metavar="SIZE",
+    help="print proof that log of SIZE records is prefix of current log",
+    type=int,
+)
+group.add_argument(
+    "--check-proof",
+    metavar="FILE",
+    help="check proof with server public key, consistency proof against tree head of earlier proof in second FILE",
     nargs="+",
     type=str,
 )
+parser.add_argument(
+    "--user", metavar="NAME", help="query only records of user", type=str
+)
+parser.add_argument(
+    "--event",
+    help="query only records of event type",
+    choices=[event.name for event in Log.Event],
+)
+parser.add_argument(
+    "--since",
+    metavar="DATE",
+    help="check or query only log records since MM/DD/YYYY [HH:MM:SS]",
+    type=str,
+)
+parser.add_argument(
+    "--until",
+    metavar="DATE",
+    help="check or query only log records until MM/DD/YYYY [HH:MM:SS]",
+    type=str,
+)
+parser.add_argument(
+    "--metrics", help="show metrics of running server", action="store_true"
+)
+parser.add_argument(
+    "-w",
+    "--workers",
+    metavar="N",
+    help="number of server processes sharing the port",
+    type=int,
+    default=1,
+)
+parser.add_argument(
+    "--crypto-workers",
+    metavar="N",
+    help=f"number of processes for RSA operations of login, 0 runs them in event loop (default: {Executor.WORKERS['crypto']})",
+    type=int,
+    default=Executor.WORKERS["crypto"],
+)
+parser.add_argument(
+    "--loop",
+    help=f"event loop implementation (default: {Event_loop.NAMES[0]})",
+    choices=Event_loop.NAMES,
+    default=Event_loop.NAMES[0],
+)
+parser.add_argument(
+    "--bandwidth",
+    metavar="MBPS",
+    help="largest throughput of the server in MB/s (default: unlimited)",
+    type=float,
+    default=0,
+)
+parser.add_argument(
+    "--user-bandwidth",
+    metavar="MBPS",
+    help="largest throughput of one user in MB/s (default: unlimited)",
+    type=float,
+    default=0,
+)
+parser.add_argument(
+    "--shutdown-timeout",
+    metavar="SECONDS",
+    help=f"how long may running transfers take on shutdown (default: {server.Server.SHUTDOWN_TIMEOUT:g})",
+    type=float,
+    default=server.Server.SHUTDOWN_TIMEOUT,
+)
+parser.add_argument(
+    "--log-size",
+    metavar="MB",
+    help=f"rotate log when it reaches this size, 0 disables rotation by size (default: {Log.ROTATE_SIZE / 1000000:g})",
+    type=float,
+    default=Log.ROTATE_SIZE / 1000000,
+)
+parser.add_argument("--log-daily", help="rotate log every day", action="store_true")
+parser.add_argument(
+    "--log-format",
+    help=f"format of log records, json records can be queried (default: {Log.FORMAT})",
+    choices=("text", "json"),
+    default=Log.FORMAT,
+)
 args = parser.parse_args()
 
 if args.register:
     # Add new record to user database
     if len(args.register) == 2:
+        # Registration is logged, log records are added to Merkle tree
+        Merkle_index.init()
         # Add user to database
         User_db.add(args.register[0], args.register[1])
         # Create new folder for user on server
@@ -53,6 +166,7 @@ if args.register:
         )
 elif args.remove:
     # Remove user from useres database
+    Merkle_index.init()
     for user_name in args.remove:
         User_db.delete(user_name)
 elif args.list:
@@ -62,10 +176,40 @@ elif args.integrity:
     # Check integrity of selected logfile
     for file_name in args.integrity:
         Log.verify(file_name)
+elif args.integrity is not None:
+    # Check integrity of all log segments in given time range
+    Log.verify_all(args.since, args.until)
+elif args.query:
+    # Print log records matching the query
+    Log.query(args.user, args.event, args.since, args.until)
+elif args.proof is not None:
+    # Print inclusion proof of log record
+    Log.prove(index=args.proof)
+elif args.consistency is not None:
+    # Print consistency proof of older log
+    Log.prove(old_size=args.consistency)
+elif args.check_proof:
+    # Check proofs, only server public key is needed
+    proofs = [json.loads(Path(file_name).read_text()) for file_name in args.check_proof]
+    print(
+        Merkle.check(proofs[0], Rsa.get_pub_key_location().read_bytes(), *proofs[1:2])
+    )
+elif args.metrics:
+    # Show metrics dumped by running server
+    Metrics.show()
 elif args.version:
     # Show program version and info
     server.Server.version()
 else:
     print("[*] Kryzbu server starting...")
     server.Server.VERBOSITY = args.verbose
+    server.Server.WORKERS = args.workers
+    server.Server.SHUTDOWN_TIMEOUT = args.shutdown_timeout
+    Executor.WORKERS["crypto"] = args.crypto_workers
+    Bandwidth.RATE = int(args.bandwidth * 1000000)
+    Bandwidth.USER_RATE = int(args.user_bandwidth * 1000000)
+    Log.ROTATE_SIZE = int(args.log_size * 1000000)
+    Log.ROTATE_DAILY = args.log_daily
+    Log.FORMAT = args.log_format
+    Event_loop.use(args.loop)
     server.Server.start()
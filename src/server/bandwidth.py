@@ -0,0 +1,306 @@
+# Bandwidth is library for fair sharing of Kryzbu server bandwidth among users
+#
+# Source code available on: https://github.com/martin-nohava/kryzbu.
+
+import asyncio
+import itertools
+import time
+from .metrics import Metrics
+
+
+class Token_bucket:
+    """
+    | Token bucket limiting rate of transferred bytes. Bucket is refilled by *rate* tokens per second
+    | and holds at most *capacity* tokens, so short bursts are allowed. Transfer may take more tokens
+    | than bucket holds, following transfers then wait until the debt is paid.
+    """
+
+    def __init__(self, rate: int, capacity: int):
+        self.rate: int = rate  # Bytes per second, 0 means unlimited
+        self.capacity: int = capacity
+        self.tokens: float = capacity
+        self.stamp: float = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        """
+        Adds tokens for time passed since last refill.
+
+        :param now: Current time (monotonic)
+        :type now: float
+
+        """
+
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def delay(self, n: int, now: float) -> float:
+        """
+        Returns how long to wait until *n* bytes can be transferred.
+
+        :param n: Number of bytes
+        :type n: int
+        :param now: Current time (monotonic)
+        :type now: float
+        :rtype: float
+
+        """
+
+        if not self.rate:
+            return 0.0
+        self.refill(now)
+        missing = min(n, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def take(self, n: int) -> None:
+        """
+        Takes tokens for *n* transferred bytes.
+
+        :param n: Number of bytes
+        :type n: int
+
+        """
+
+        if self.rate:
+            self.tokens -= n
+
+
+class Bandwidth:
+    """
+    | Fair sharing of server bandwidth among users. Transfers of every user are limited by his own token bucket
+    | (*USER_RATE*) and all transfers together by global token bucket (*RATE*). When server runs out of bandwidth,
+    | waiting transfers are served by fair queuing: every user has virtual clock advanced by bytes he transferred
+    | and transfer of user with the earliest clock goes first. Every user gets the same share of bandwidth, no matter
+    | how many connections he opens or how large pieces he transfers, so one user can not starve the others.
+    | Unlike round robin over requests, user who sends small pieces does not get smaller share.
+    |
+    | Transfer accounts its bytes by :py:meth:`consume() <server.bandwidth.Bandwidth.consume>` after they are sent
+    | or received and waits for its turn there, slower transfer slows down TCP of the client.
+    | Throughput of every user is reported as gauge *bandwidth.user.USERNAME* (bytes per second).
+    |
+    | Caps are kept by every server process separately, with more worker processes
+    | (see :py:meth:`share() <server.bandwidth.Bandwidth.share>`) every worker gets its part of them.
+    |
+    | **Global variables in this class:**
+    | **RATE** (*int*) – largest throughput of the server (bytes per second), 0 for unlimited
+    | **USER_RATE** (*int*) – largest throughput of one user (bytes per second), 0 for unlimited
+    | **QUANTUM** (*int*) – largest slice of file sent at once when limited, waiting transfers get their turn between slices
+    | **BURST** (*float*) – how long may transfers exceed the rate after idle time (seconds)
+    | **REPORT_INTERVAL** (*float*) – how often is throughput of users reported (seconds)
+    """
+
+    RATE = 0
+    USER_RATE = 0
+    QUANTUM = 256 * 1024
+    BURST = 0.1
+    REPORT_INTERVAL = 1.0
+
+    _loop = None
+    _bucket: Token_bucket = None
+    _buckets: dict = {}
+    _clock: float = 0.0  # Virtual clock of transfer served last
+    _finish: dict = {}  # Virtual clock of every user
+    _waiting: list = []  # (start, order, user_name, n, future)
+    _order = itertools.count()
+    _scheduler: asyncio.Task = None
+    _arrived: asyncio.Event = None
+    _bytes: dict = {}
+
+    @staticmethod
+    def share(workers: int) -> None:
+        """
+        Divides caps among worker processes, called before workers are started.
+
+        :param workers: Number of worker processes
+        :type workers: int
+
+        """
+
+        Bandwidth.RATE = -(-Bandwidth.RATE // workers)
+        Bandwidth.USER_RATE = -(-Bandwidth.USER_RATE // workers)
+
+    @staticmethod
+    def limited() -> bool:
+        """
+        Returns whether any cap is set.
+
+        :rtype: bool
+
+        """
+
+        return bool(Bandwidth.RATE or Bandwidth.USER_RATE)
+
+    @staticmethod
+    def slice(count: int) -> int:
+        """
+        Returns how many of *count* bytes should be sent at once, so waiting transfers get their turn in time.
+
+        :param count: Number of bytes left to send
+        :type count: int
+        :rtype: int
+
+        """
+
+        return min(count, Bandwidth.QUANTUM) if Bandwidth.limited() else count
+
+    @staticmethod
+    def bucket(rate: int) -> Token_bucket:
+        """
+        Creates token bucket holding *BURST* seconds of *rate*, at least one *QUANTUM*.
+
+        :param rate: Bytes per second, 0 for unlimited
+        :type rate: int
+        :rtype: Token_bucket
+
+        """
+
+        return Token_bucket(rate, max(Bandwidth.QUANTUM, int(rate * Bandwidth.BURST)))
+
+    @staticmethod
+    async def consume(user_name: str, n: int) -> None:
+        """
+        Accounts *n* bytes transferred by user and waits until he may continue.
+        Transfer continues at once while neither bucket is empty and nobody waits.
+
+        :param user_name: Name of user
+        :type user_name: str
+        :param n: Number of bytes
+        :type n: int
+
+        """
+
+        Bandwidth._bytes[user_name] = Bandwidth._bytes.get(user_name, 0) + n
+        if not Bandwidth.limited():
+            return
+
+        loop = asyncio.get_running_loop()
+        if Bandwidth._loop is not loop:
+            # Waiting transfers and scheduler belong to the event loop
+            Bandwidth._loop = loop
+            Bandwidth._bucket = Bandwidth.bucket(Bandwidth.RATE)
+            Bandwidth._buckets.clear()
+            Bandwidth._clock = 0.0
+            Bandwidth._finish.clear()
+            Bandwidth._waiting.clear()
+            Bandwidth._scheduler = None
+            Bandwidth._arrived = asyncio.Event()
+
+        if user_name not in Bandwidth._buckets:
+            Bandwidth._buckets[user_name] = Bandwidth.bucket(Bandwidth.USER_RATE)
+        bucket = Bandwidth._buckets[user_name]
+
+        # Idle user does not save up clock, he starts at clock of the others
+        start = max(Bandwidth._clock, Bandwidth._finish.get(user_name, 0.0))
+        Bandwidth._finish[user_name] = start + n
+
+        now = time.monotonic()
+        if (
+            not Bandwidth._waiting
+            and not Bandwidth._bucket.delay(n, now)
+            and not bucket.delay(n, now)
+        ):
+            Bandwidth._clock = start
+            Bandwidth._bucket.take(n)
+            bucket.take(n)
+            return
+
+        # Wait for turn
+        future = loop.create_future()
+        Bandwidth._waiting.append((start, next(Bandwidth._order), user_name, n, future))
+        Bandwidth._arrived.set()
+        if Bandwidth._scheduler is None or Bandwidth._scheduler.done():
+            Bandwidth._scheduler = asyncio.create_task(Bandwidth.schedule())
+
+        waited = time.perf_counter()
+        await future
+        Metrics.timing("bandwidth.wait", time.perf_counter() - waited)
+
+    @staticmethod
+    async def schedule() -> None:
+        """
+        Serves waiting transfers until nobody waits. Transfer with the earliest virtual clock continues
+        as soon as buckets hold enough tokens, users over their own cap are skipped meanwhile.
+
+        """
+
+        while Bandwidth._waiting:
+            # Cancelled transfers do not wait any more
+            Bandwidth._waiting[:] = [
+                waiting for waiting in Bandwidth._waiting if not waiting[4].done()
+            ]
+            now = time.monotonic()
+            ready = [
+                waiting
+                for waiting in Bandwidth._waiting
+                if not Bandwidth._buckets[waiting[2]].delay(waiting[3], now)
+            ]
+
+            if not ready:
+                if Bandwidth._waiting:
+                    # Everybody is over his cap, wait for the first bucket to refill or for new transfer
+                    Bandwidth._arrived.clear()
+                    try:
+                        await asyncio.wait_for(
+                            Bandwidth._arrived.wait(),
+                            min(
+                                Bandwidth._buckets[user_name].delay(n, now)
+                                for _, _, user_name, n, _ in Bandwidth._waiting
+                            ),
+                        )
+                    except asyncio.TimeoutError:
+                        pass
+                continue
+
+            waiting = min(ready)
+            start, _, user_name, n, future = waiting
+            wait = Bandwidth._bucket.delay(n, now)
+            if wait:
+                # Server is out of bandwidth
+                await asyncio.sleep(wait)
+                continue
+
+            Bandwidth._waiting.remove(waiting)
+            Bandwidth._clock = start
+            Bandwidth._bucket.take(n)
+            Bandwidth._buckets[user_name].take(n)
+            future.set_result(None)
+
+    @staticmethod
+    async def report_periodically() -> None:
+        """
+        Reports throughput of every user and of the whole server every *REPORT_INTERVAL* seconds.
+        Forgets clocks and buckets of idle users meanwhile, so they do not pile up for every user ever seen.
+
+        """
+
+        reported = set()
+        while True:
+            await asyncio.sleep(Bandwidth.REPORT_INTERVAL)
+            transferred, Bandwidth._bytes = Bandwidth._bytes, {}
+
+            # Users who stopped transferring are reported once more with zero
+            for user_name in reported | set(transferred):
+                Metrics.gauge(
+                    f"bandwidth.user.{user_name}",
+                    int(transferred.get(user_name, 0) / Bandwidth.REPORT_INTERVAL),
+                )
+            Metrics.gauge(
+                "bandwidth.total",
+                int(sum(transferred.values()) / Bandwidth.REPORT_INTERVAL),
+            )
+            reported = set(transferred)
+
+            # Forget clocks of idle users, also of those ahead of the others who stopped transferring
+            waiting = {user_name for _, _, user_name, _, _ in Bandwidth._waiting}
+            for user_name, finish in list(Bandwidth._finish.items()):
+                if finish <= Bandwidth._clock or (
+                    user_name not in reported and user_name not in waiting
+                ):
+                    del Bandwidth._finish[user_name]
+
+            # Forget full buckets of users who do not wait, new bucket would be the same
+            now = time.monotonic()
+            for user_name, bucket in list(Bandwidth._buckets.items()):
+                if user_name not in waiting:
+                    bucket.refill(now)
+                    if bucket.tokens >= bucket.capacity:
+                        del Bandwidth._buckets[user_name]
@@ -8,6 +8,7 @@ from enum import Enum
 import datetime
 import sqlite3
 import os
+import threading
 from Crypto.Random import get_random_bytes
 
 
@@ -25,7 +26,7 @@ class User_db:
         """Initialize user database while server is starting."""
 
         if not User_db.table_exists():
-            con = sqlite3.connect(User_db.FOLDER / User_db.NAME)
+            con = Database.connect(User_db.FOLDER / User_db.NAME)
             cur = con.cursor()
             cur.execute(
                 f"CREATE TABLE {User_db.TABLE_NAME} (name text, pass_hash text, aes_key text, salt text)"
@@ -53,7 +54,7 @@ class User_db:
         aes_key = get_random_bytes(16)
 
         if not User_db.name_exists(user_name):
-            con = sqlite3.connect(User_db.FOLDER / User_db.NAME)
+            con = Database.connect(User_db.FOLDER / User_db.NAME)
             cur = con.cursor()
             cur.execute(
                 f"INSERT INTO {User_db.TABLE_NAME} VALUES (?,?,?,?)",
@@ -160,7 +161,7 @@ class File_index:
         """
 
         if not File_index.table_exists():
-            con = sqlite3.connect(File_index.FOLDER / File_index.NAME)
+            con = Database.connect(File_index.FOLDER / File_index.NAME)
             cur = con.cursor()
             cur.execute(
                 f"CREATE TABLE {File_index.TABLE_NAME} (name text, owner text, uploaded date, downloads int)"
@@ -186,20 +187,26 @@ class File_index:
 
         """
 
-        if not File_index.file_exists(file_name):
-            con = sqlite3.connect(File_index.FOLDER / File_index.NAME)
-            cur = con.cursor()
+        con = Database.connect(File_index.FOLDER / File_index.NAME)
+        cur = con.cursor()
+        # Lock database for writing before the check, so other process can not add the same file meanwhile
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute(
+            f"SELECT name FROM {File_index.TABLE_NAME} WHERE name=:name",
+            {"name": file_name},
+        )
+        if not cur.fetchone():
             cur.execute(
                 f"INSERT INTO {File_index.TABLE_NAME} VALUES (?,?,?,?)",
                 (file_name, user_name, datetime.datetime.now().strftime("%m/%d/%Y"), 0),
             )
-            con.commit()
-            con.close()
         else:
             # File with same name already exists
             print(
                 f"WARNING, File_index: Try add, but file '{file_name}' already exists. File was overwriten"
             )
+        con.commit()
+        con.close()
 
     @staticmethod
     def download(file_name: str):
@@ -211,15 +218,12 @@ class File_index:
 
         """
 
-        con = sqlite3.connect(File_index.FOLDER / File_index.NAME)
+        con = Database.connect(File_index.FOLDER / File_index.NAME)
         cur = con.cursor()
+        # Increment in single statement, concurrent downloads must not overwrite each other
         cur.execute(
-            f"SELECT downloads FROM {File_index.TABLE_NAME} WHERE name=:name",
-            {"name": file_name},
-        )
-        cur.execute(
-            "UPDATE file_index SET downloads=? WHERE name=?",
-            (cur.fetchone()[0] + 1, file_name),
+            f"UPDATE {File_index.TABLE_NAME} SET downloads=downloads+1 WHERE name=?",
+            (file_name,),
         )
         con.commit()
         con.close()
@@ -249,7 +253,7 @@ class File_index:
 
         """
 
-        con = sqlite3.connect(File_index.FOLDER / File_index.NAME)
+        con = Database.connect(File_index.FOLDER / File_index.NAME)
         cur = con.cursor()
 
         # Check for not indexed files
@@ -404,7 +408,7 @@ class Hmac_index:
         """
 
         if not Hmac_index.table_exists():
-            con = sqlite3.connect(Hmac_index.FOLDER / Hmac_index.NAME)
+            con = Database.connect(Hmac_index.FOLDER / Hmac_index.NAME)
             cur = con.cursor()
             cur.execute(f"CREATE TABLE {Hmac_index.TABLE_NAME} (name text, hmac text)")
             print("WARNING, Hmac_index: No table found, empty one created")
@@ -423,17 +427,19 @@ class Hmac_index:
 
         """
 
-        if not Hmac_index.file_exists(file_name):
-            con = sqlite3.connect(Hmac_index.FOLDER / Hmac_index.NAME)
-            cur = con.cursor()
+        con = Database.connect(Hmac_index.FOLDER / Hmac_index.NAME)
+        cur = con.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute(
+            f"UPDATE {Hmac_index.TABLE_NAME} SET hmac=? WHERE name=?", (hmac, file_name)
+        )
+        if cur.rowcount == 0:
+            # No entry for this file yet
             cur.execute(
                 f"INSERT INTO {Hmac_index.TABLE_NAME} VALUES (?,?)", (file_name, hmac)
             )
-            con.commit()
-            con.close()
-        else:
-            # File with same name already exists
-            Hmac_index.update(file_name, hmac)
+        con.commit()
+        con.close()
 
     @staticmethod
     def update(file_name: str, hmac: str):
@@ -444,10 +450,10 @@ class Hmac_index:
         :type file_name: str
         :param hmac: Hex string of HMAC hash
         :type hmac: str
-        
+
         """
 
-        con = sqlite3.connect(Hmac_index.FOLDER / Hmac_index.NAME)
+        con = Database.connect(Hmac_index.FOLDER / Hmac_index.NAME)
         cur = con.cursor()
         cur.execute(
             f"SELECT hmac FROM {Hmac_index.TABLE_NAME} WHERE name=:name",
@@ -496,13 +502,461 @@ class Hmac_index:
         return Database.name_exists(Database.Table.HMAC_INDEX, file_name)
 
 
+class Log_index:
+    """
+    Index of structured log records, so that records can be found without reading whole log. For every record
+    index holds **file** name of log (segment) and **offset** and **length** of record in it, **user**, **event** type
+    and time **bucket** (hours since epoch). For every log file index also holds its indexed **size**,
+    records written after it are not indexed yet.
+    """
+
+    FOLDER = Path("server/_data/")
+    TABLE_NAME = "log_index"
+    NAME = "logs.db"
+
+    @staticmethod
+    def init() -> None:
+        """
+        Check if *logs.db* database already exists, creates empty one if not.
+
+        """
+
+        if not Log_index.table_exists():
+            con = Database.connect(Log_index.FOLDER / Log_index.NAME)
+            cur = con.cursor()
+            cur.execute(
+                f"CREATE TABLE {Log_index.TABLE_NAME} (file text, offset int, length int, user text, event text, bucket int)"
+            )
+            cur.execute(
+                f"CREATE INDEX {Log_index.TABLE_NAME}_user ON {Log_index.TABLE_NAME} (user, bucket)"
+            )
+            cur.execute(
+                f"CREATE INDEX {Log_index.TABLE_NAME}_event ON {Log_index.TABLE_NAME} (event, bucket)"
+            )
+            cur.execute(
+                f"CREATE INDEX {Log_index.TABLE_NAME}_bucket ON {Log_index.TABLE_NAME} (bucket)"
+            )
+            cur.execute("CREATE TABLE log_size (file text, size int)")
+            print("WARNING, Log_index: No table found, empty one created")
+            con.commit()
+            con.close()
+
+    @staticmethod
+    def add(file_name: str, records: list, size: int):
+        """
+        Adds records of log file to the index and sets its indexed size, in single transaction.
+
+        :param file_name: Name of log file
+        :type file_name: str
+        :param records: Tuples of offset, length, user, event and bucket of every record
+        :type records: list[tuple]
+        :param size: Size of log file after the last record
+        :type size: int
+
+        """
+
+        con = Database.connect(Log_index.FOLDER / Log_index.NAME)
+        cur = con.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        cur.executemany(
+            f"INSERT INTO {Log_index.TABLE_NAME} VALUES (?,?,?,?,?,?)",
+            [(file_name, *record) for record in records],
+        )
+        cur.execute("UPDATE log_size SET size=? WHERE file=?", (size, file_name))
+        if cur.rowcount == 0:
+            # No entry for this file yet
+            cur.execute("INSERT INTO log_size VALUES (?,?)", (file_name, size))
+        con.commit()
+        con.close()
+
+    @staticmethod
+    def rename(file_name: str, new_name: str):
+        """
+        Moves records of renamed log file, called when log is rotated.
+
+        :param file_name: Name of log file
+        :type file_name: str
+        :param new_name: New name of log file
+        :type new_name: str
+
+        """
+
+        con = Database.connect(Log_index.FOLDER / Log_index.NAME)
+        cur = con.cursor()
+        cur.execute(
+            f"UPDATE {Log_index.TABLE_NAME} SET file=? WHERE file=?",
+            (new_name, file_name),
+        )
+        cur.execute("UPDATE log_size SET file=? WHERE file=?", (new_name, file_name))
+        con.commit()
+        con.close()
+
+    @staticmethod
+    def find(user: str = None, event: str = None, first: int = None, last: int = None):
+        """
+        Returns file name, offset and length of records matching all given conditions, ordered by file and offset.
+
+        :param user: User name
+        :type user: str
+        :param event: Name of event type
+        :type event: str
+        :param first: The first time bucket
+        :type first: int
+        :param last: The last time bucket
+        :type last: int
+        :rtype: list[tuple]
+
+        """
+
+        conditions = []
+        params = {"user": user, "event": event, "first": first, "last": last}
+        if user is not None:
+            conditions.append("user=:user")
+        if event is not None:
+            conditions.append("event=:event")
+        if first is not None:
+            conditions.append("bucket>=:first")
+        if last is not None:
+            conditions.append("bucket<=:last")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        con = Database.connect(Log_index.FOLDER / Log_index.NAME)
+        cur = con.cursor()
+        cur.execute(
+            f"SELECT file, offset, length FROM {Log_index.TABLE_NAME} {where} ORDER BY file, offset",
+            params,
+        )
+        records = cur.fetchall()
+        con.close()
+        return records
+
+    @staticmethod
+    def size(file_name: str):
+        """
+        Returns indexed size of log file.
+
+        :param file_name: Name of log file
+        :type file_name: str
+        :returns: Size in bytes, None if the file was never indexed
+        :rtype: int
+
+        """
+
+        con = Database.connect(Log_index.FOLDER / Log_index.NAME)
+        cur = con.cursor()
+        cur.execute("SELECT size FROM log_size WHERE file=?", (file_name,))
+        record = cur.fetchone()
+        con.close()
+        return record[0] if record is not None else None
+
+    @staticmethod
+    def table_exists() -> bool:
+        """
+        Check if *logs.db* already exists or not.
+
+        :return: True or False
+        :rtype: bool
+
+        """
+
+        return Database.table_exists(Database.Table.LOG_INDEX)
+
+
+class Merkle_index:
+    """
+    Database of Merkle tree over log records. Holds hashes of all complete subtrees (**level**, **index**),
+    **file** name and **offset** of every record (leaf) and signed tree head: **size** of tree, **root** hash,
+    **time** of signing, **signature** (both empty until the head is signed) and **offset** in current log up to which
+    records are in the tree.
+    """
+
+    FOLDER = Path("server/_data/")
+    TABLE_NAME = "merkle_node"
+    NAME = "merkle.db"
+
+    @staticmethod
+    def init() -> None:
+        """
+        Check if *merkle.db* database already exists, creates empty one if not.
+
+        """
+
+        if not Merkle_index.table_exists():
+            con = Database.connect(Merkle_index.FOLDER / Merkle_index.NAME)
+            cur = con.cursor()
+            cur.execute(
+                f"CREATE TABLE {Merkle_index.TABLE_NAME} (level int, idx int, hash blob, PRIMARY KEY (level, idx))"
+            )
+            cur.execute(
+                "CREATE TABLE merkle_leaf (idx int PRIMARY KEY, file text, offset int)"
+            )
+            cur.execute(
+                "CREATE TABLE merkle_head (size int, root blob, time text, signature blob, offset int)"
+            )
+            print("WARNING, Merkle_index: No table found, empty one created")
+            con.commit()
+            con.close()
+
+    @staticmethod
+    def add(nodes: dict, leaves: list, head: tuple):
+        """
+        Adds new subtrees and leaves and replaces tree head, in single transaction.
+
+        :param nodes: Hashes of subtrees by (level, index)
+        :type nodes: dict
+        :param leaves: Tuples of index, file name and offset of every new record
+        :type leaves: list[tuple]
+        :param head: Size, root hash, time, signature and offset in current log
+        :type head: tuple
+
+        """
+
+        con = Database.connect(Merkle_index.FOLDER / Merkle_index.NAME)
+        cur = con.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        cur.executemany(
+            f"INSERT OR REPLACE INTO {Merkle_index.TABLE_NAME} VALUES (?,?,?)",
+            [(level, idx, hash) for (level, idx), hash in nodes.items()],
+        )
+        cur.executemany("INSERT OR REPLACE INTO merkle_leaf VALUES (?,?,?)", leaves)
+        cur.execute("DELETE FROM merkle_head")
+        cur.execute("INSERT INTO merkle_head VALUES (?,?,?,?,?)", head)
+        con.commit()
+        con.close()
+
+    @staticmethod
+    def sign(size: int, time: str, signature: bytes):
+        """
+        Stores signature of tree head, unless the tree has grown since.
+
+        :param size: Size of signed tree
+        :type size: int
+        :param time: Time of signing
+        :type time: str
+        :param signature: Signature of tree head
+        :type signature: bytes
+
+        """
+
+        con = Database.connect(Merkle_index.FOLDER / Merkle_index.NAME)
+        cur = con.cursor()
+        cur.execute(
+            "UPDATE merkle_head SET time=?, signature=? WHERE size=? AND signature IS NULL",
+            (time, signature, size),
+        )
+        con.commit()
+        con.close()
+
+    @staticmethod
+    def nodes(keys: list) -> dict:
+        """
+        Returns hashes of subtrees.
+
+        :param keys: Subtrees as (level, index)
+        :type keys: list[tuple]
+        :returns: Hashes by (level, index), missing subtrees are left out
+        :rtype: dict
+
+        """
+
+        con = Database.connect(Merkle_index.FOLDER / Merkle_index.NAME)
+        cur = con.cursor()
+        nodes = {}
+        for key in keys:
+            cur.execute(
+                f"SELECT hash FROM {Merkle_index.TABLE_NAME} WHERE level=? AND idx=?",
+                key,
+            )
+            record = cur.fetchone()
+            if record is not None:
+                nodes[key] = record[0]
+        con.close()
+        return nodes
+
+    @staticmethod
+    def leaf(index: int):
+        """
+        Returns location of record in log.
+
+        :param index: Index of leaf
+        :type index: int
+        :returns: File name and offset, None if tree has no such leaf
+        :rtype: tuple
+
+        """
+
+        con = Database.connect(Merkle_index.FOLDER / Merkle_index.NAME)
+        cur = con.cursor()
+        cur.execute("SELECT file, offset FROM merkle_leaf WHERE idx=?", (index,))
+        record = cur.fetchone()
+        con.close()
+        return record
+
+    @staticmethod
+    def head():
+        """
+        Returns tree head.
+
+        :returns: Size, root hash, time, signature and offset in current log, None for empty tree,
+            time and signature are None until the head is signed
+        :rtype: tuple
+
+        """
+
+        con = Database.connect(Merkle_index.FOLDER / Merkle_index.NAME)
+        cur = con.cursor()
+        cur.execute("SELECT * FROM merkle_head")
+        record = cur.fetchone()
+        con.close()
+        return record
+
+    @staticmethod
+    def rename(file_name: str, new_name: str):
+        """
+        Moves leaves of rotated log file, new log file starts empty.
+
+        :param file_name: Name of log file
+        :type file_name: str
+        :param new_name: New name of log file
+        :type new_name: str
+
+        """
+
+        con = Database.connect(Merkle_index.FOLDER / Merkle_index.NAME)
+        cur = con.cursor()
+        cur.execute("UPDATE merkle_leaf SET file=? WHERE file=?", (new_name, file_name))
+        cur.execute("UPDATE merkle_head SET offset=0")
+        con.commit()
+        con.close()
+
+    @staticmethod
+    def table_exists() -> bool:
+        """
+        Check if *merkle.db* already exists or not.
+
+        :return: True or False
+        :rtype: bool
+
+        """
+
+        return Database.table_exists(Database.Table.MERKLE_INDEX)
+
+
+class Pooled_connection(sqlite3.Connection):
+    """
+    Connection of :py:meth:`Database.connect() <server.db.Database.connect>` pool. Closing it does not close database,
+    transaction which was not committed is rolled back and connection is returned to the pool for next use in the same thread.
+    """
+
+    def close(self) -> None:
+        if self.in_transaction:
+            self.rollback()
+        Database.release(self)
+
+
 class Database:
-    """Functions implementacion that are shared between all databases."""
+    """
+    | Functions implementacion that are shared between all databases.
+    |
+    | Databases are shared by all worker processes of the server. SQLite locks the database file for every write,
+    | connections wait up to *TIMEOUT* seconds for a lock held by other process instead of failing.
+    | Databases are in WAL mode, so readers do not wait for writer and writer does not wait for readers.
+    |
+    | Connections are pooled: closed connection stays open and next :py:meth:`connect() <server.db.Database.connect>`
+    | in the same thread returns it, with its cache of prepared statements. Every thread of every process
+    | has its own pool, connections are never shared by threads and forked processes start with empty pool.
+    |
+    | **Global variables in this class:**
+    | **TIMEOUT** (*float*) – how long waits connection for locked database (seconds)
+    | **PRAGMAS** (*tuple*) – statements run on every new connection
+    | **STATEMENTS** (*int*) – number of prepared statements cached by every connection
+    """
+
+    TIMEOUT = 30.0
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        # Commit does not wait for the disk, only checkpoint does, database stays consistent
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA temp_store=MEMORY",
+    )
+    STATEMENTS = 128
+
+    _pools = threading.local()  # Idle connections of thread by database file
 
     class Table(Enum):
         USER_DB = User_db.TABLE_NAME
         FILE_INDEX = File_index.TABLE_NAME
         HMAC_INDEX = Hmac_index.TABLE_NAME
+        LOG_INDEX = Log_index.TABLE_NAME
+        MERKLE_INDEX = Merkle_index.TABLE_NAME
+
+    @staticmethod
+    def connect(path: Path) -> sqlite3.Connection:
+        """
+        Returns idle connection to database file from pool of current thread, opens new one when there is none
+        (e.g. another connection to the same database is still used by caller). Connection waits for locks
+        held by other processes. Caller returns connection to the pool by closing it.
+
+        :param path: Location of database file
+        :type path: Path
+        :rtype: sqlite3.Connection
+
+        """
+
+        idle = Database.idle(os.fspath(path))
+        if idle:
+            return idle.pop()
+
+        con = sqlite3.connect(
+            path,
+            timeout=Database.TIMEOUT,
+            factory=Pooled_connection,
+            cached_statements=Database.STATEMENTS,
+        )
+        for pragma in Database.PRAGMAS:
+            con.execute(pragma)
+        con.pool = os.fspath(path)
+        return con
+
+    @staticmethod
+    def release(con: Pooled_connection) -> None:
+        """
+        Returns connection to pool of current thread, called when connection is closed.
+
+        :param con: Connection from :py:meth:`connect() <server.db.Database.connect>`
+        :type con: Pooled_connection
+
+        """
+
+        idle = Database.idle(con.pool)
+        # Connection closed twice is not returned twice
+        if all(connection is not con for connection in idle):
+            idle.append(con)
+
+    @staticmethod
+    def idle(path: str) -> list:
+        """
+        Returns idle connections of current thread to database file.
+
+        :param path: Location of database file
+        :type path: str
+        :rtype: list[Pooled_connection]
+
+        """
+
+        pools = getattr(Database._pools, "idle", None)
+        if pools is None:
+            pools = Database._pools.idle = {}
+        return pools.setdefault(path, [])
+
+    @staticmethod
+    def reset() -> None:
+        """
+        Empties pools after fork, connections of parent process must not be used by child.
+
+        """
+
+        Database._pools = threading.local()
 
     @staticmethod
     def delete(table: Table, name: str) -> int:
@@ -513,11 +967,11 @@ class Database:
 
         if Database.name_exists(table, name):
             if table == Database.Table.FILE_INDEX:
-                con = sqlite3.connect(File_index.FOLDER / File_index.NAME)
+                con = Database.connect(File_index.FOLDER / File_index.NAME)
             elif table == Database.Table.USER_DB:
-                con = sqlite3.connect(User_db.FOLDER / User_db.NAME)
+                con = Database.connect(User_db.FOLDER / User_db.NAME)
             else:
-                con = sqlite3.connect(User_db.FOLDER / Hmac_index.NAME)
+                con = Database.connect(User_db.FOLDER / Hmac_index.NAME)
             cur = con.cursor()
             cur.execute(f"DELETE FROM {table.value} WHERE name=:name", {"name": name})
             con.commit()
@@ -532,11 +986,11 @@ class Database:
         """Get record from specified table."""
 
         if table == Database.Table.FILE_INDEX:
-            con = sqlite3.connect(File_index.FOLDER / File_index.NAME)
+            con = Database.connect(File_index.FOLDER / File_index.NAME)
         elif table == Database.Table.USER_DB:
-            con = sqlite3.connect(User_db.FOLDER / User_db.NAME)
+            con = Database.connect(User_db.FOLDER / User_db.NAME)
         else:
-            con = sqlite3.connect(User_db.FOLDER / Hmac_index.NAME)
+            con = Database.connect(User_db.FOLDER / Hmac_index.NAME)
         cur = con.cursor()
         cur.execute(
             f"SELECT * FROM {table.value} WHERE name=:name", {"name": name}
@@ -550,11 +1004,11 @@ class Database:
         """Return all data from specified table."""
 
         if table == Database.Table.FILE_INDEX:
-            con = sqlite3.connect(File_index.FOLDER / File_index.NAME)
+            con = Database.connect(File_index.FOLDER / File_index.NAME)
         elif table == Database.Table.USER_DB:
-            con = sqlite3.connect(User_db.FOLDER / User_db.NAME)
+            con = Database.connect(User_db.FOLDER / User_db.NAME)
         else:
-            con = sqlite3.connect(User_db.FOLDER / Hmac_index.NAME)
+            con = Database.connect(User_db.FOLDER / Hmac_index.NAME)
         cur = con.cursor()
 
         list = []
@@ -573,11 +1027,11 @@ class Database:
         """Print out whole table."""
 
         if table == Database.Table.FILE_INDEX:
-            con = sqlite3.connect(File_index.FOLDER / File_index.NAME)
+            con = Database.connect(File_index.FOLDER / File_index.NAME)
         elif table == Database.Table.USER_DB:
-            con = sqlite3.connect(User_db.FOLDER / User_db.NAME)
+            con = Database.connect(User_db.FOLDER / User_db.NAME)
         else:
-            con = sqlite3.connect(User_db.FOLDER / Hmac_index.NAME)
+            con = Database.connect(User_db.FOLDER / Hmac_index.NAME)
         cur = con.cursor()
 
         for row in cur.execute(f"SELECT * FROM {table.value}"):
@@ -589,11 +1043,15 @@ class Database:
         """Check if table exists or not."""
 
         if table == Database.Table.FILE_INDEX:
-            con = sqlite3.connect(File_index.FOLDER / File_index.NAME)
+            con = Database.connect(File_index.FOLDER / File_index.NAME)
         elif table == Database.Table.USER_DB:
-            con = sqlite3.connect(User_db.FOLDER / User_db.NAME)
+            con = Database.connect(User_db.FOLDER / User_db.NAME)
+        elif table == Database.Table.LOG_INDEX:
+            con = Database.connect(Log_index.FOLDER / Log_index.NAME)
+        elif table == Database.Table.MERKLE_INDEX:
+            con = Database.connect(Merkle_index.FOLDER / Merkle_index.NAME)
         else:
-            con = sqlite3.connect(User_db.FOLDER / Hmac_index.NAME)
+            con = Database.connect(User_db.FOLDER / Hmac_index.NAME)
         cur = con.cursor()
         cur.execute(
             "SELECT name FROM sqlite_master WHERE type='table' AND name=:name",
@@ -611,16 +1069,20 @@ class Database:
         """Check if specified name exists in specified table."""
 
         if table == Database.Table.FILE_INDEX:
-            con = sqlite3.connect(File_index.FOLDER / File_index.NAME)
+            con = Database.connect(File_index.FOLDER / File_index.NAME)
         elif table == Database.Table.USER_DB:
-            con = sqlite3.connect(User_db.FOLDER / User_db.NAME)
+            con = Database.connect(User_db.FOLDER / User_db.NAME)
         else:
-            con = sqlite3.connect(User_db.FOLDER / Hmac_index.NAME)
+            con = Database.connect(User_db.FOLDER / Hmac_index.NAME)
         cur = con.cursor()
         cur.execute(f"SELECT name FROM {table.value} WHERE name=:name", {"name": name})
         if cur.fetchone():
-            cur.close()
+            con.close()
             return True
         else:
-            cur.close()
+            con.close()
             return False
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=Database.reset)
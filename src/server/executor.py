@@ -0,0 +1,223 @@
+# Executor is library for running blocking work of Kryzbu server outside of the event loop
+#
+# Source code available on: https://github.com/martin-nohava/kryzbu.
+
+import asyncio
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from .metrics import Metrics
+
+
+class Executor:
+    """
+    | Runs blocking calls in thread pools, so slow disk or database does not stall other clients.
+    | CPU bound calls run in pool of processes, so they do not hold the event loop and run on other CPU cores.
+    | Every handler of the server calls blocking code through this class.
+    |
+    | **Pools:**
+    | *disk* – file data: reading, writing, moving and deleting files
+    | *meta* – metadata: SQLite databases, log and upload session state
+    | *crypto* – processes for RSA operations of login handshake, see :py:meth:`crypto() <server.executor.Executor.crypto>`
+    |
+    | Number of calls waiting in every pool is limited, caller waits for free place in the queue.
+    | Queue depth (*executor.POOL.queue*) and time spent in queue (*executor.POOL.wait*) are recorded
+    | in :py:class:`Metrics <server.metrics.Metrics>`. Pool of processes can't report when call starts,
+    | its queue counts running calls as well and whole call is recorded (*executor.POOL.call*).
+    |
+    | **Global variables in this class:**
+    | **WORKERS** (*dict*) – number of threads (processes) of every pool, 0 processes runs calls in the event loop
+    | **QUEUE_LIMIT** (*int*) – largest number of calls waiting in one pool
+    | **PROCESSES** (*tuple*) – pools of processes
+    """
+
+    WORKERS = {"disk": 8, "meta": 4, "crypto": 2}
+    QUEUE_LIMIT = 256
+    PROCESSES = ("crypto",)
+
+    _pools: dict = {}
+    _slots: dict = {}
+    _loop = None
+    _queued: dict = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    async def disk(func, *args):
+        """
+        Runs blocking file operation in *disk* pool.
+
+        :param func: Blocking function
+        :type func: callable
+        :param args: Arguments of the function
+        :returns: Return value of the function
+
+        """
+
+        return await Executor.run("disk", func, *args)
+
+    @staticmethod
+    async def meta(func, *args):
+        """
+        Runs blocking metadata operation in *meta* pool.
+
+        :param func: Blocking function
+        :type func: callable
+        :param args: Arguments of the function
+        :returns: Return value of the function
+
+        """
+
+        return await Executor.run("meta", func, *args)
+
+    @staticmethod
+    async def crypto(func, *args):
+        """
+        Runs CPU bound operation in *crypto* pool of processes. When the pool is not started
+        (see :py:meth:`start_processes() <server.executor.Executor.start_processes>`) or it is broken,
+        function is called directly in the event loop. Function and its arguments must be picklable.
+
+        :param func: CPU bound function
+        :type func: callable
+        :param args: Arguments of the function
+        :returns: Return value of the function
+
+        """
+
+        if "crypto" not in Executor._pools:
+            return func(*args)
+        try:
+            return await Executor.run("crypto", func, *args)
+        except BrokenProcessPool:
+            # Process of the pool was killed, it can't be forked again safely once threads run
+            print(
+                "WARNING, Executor: Pool of crypto processes is broken, running calls in event loop"
+            )
+            Executor._pools.pop("crypto").shutdown(wait=False)
+            return func(*args)
+
+    @staticmethod
+    def start_processes(initializer=None) -> None:
+        """
+        Starts pools of *PROCESSES*, must be called before any thread pool is started, so that forked processes
+        do not inherit locks held by other threads. Processes are forked, so they inherit loaded server data,
+        then they run *initializer*. Processes ignore *Ctrl+C*, they are stopped by :py:meth:`shutdown() <server.executor.Executor.shutdown>`.
+
+        :param initializer: Function called in every new process, e.g. loading of keys
+        :type initializer: callable
+
+        """
+
+        if not hasattr(os, "fork"):
+            # Other start methods would import and run the server script again
+            return
+
+        for pool in Executor.PROCESSES:
+            if pool in Executor._pools or not Executor.WORKERS[pool]:
+                continue
+            Executor._pools[pool] = ProcessPoolExecutor(
+                Executor.WORKERS[pool],
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=Executor.init_process,
+                initargs=(initializer,),
+            )
+            Executor._queued[pool] = 0
+            # Forked pool starts all its processes on first call
+            Executor._pools[pool].submit(os.getpid)
+
+    @staticmethod
+    def init_process(initializer) -> None:
+        """
+        Prepares new process of pool.
+
+        :param initializer: Function called in the process, None for no call
+        :type initializer: callable
+
+        """
+
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        if initializer is not None:
+            initializer()
+
+    @staticmethod
+    async def run(pool: str, func, *args):
+        """
+        Runs blocking function in the pool and waits for its result.
+
+        :param pool: Name of pool, 'disk', 'meta' or 'crypto'
+        :type pool: str
+        :param func: Blocking function
+        :type func: callable
+        :param args: Arguments of the function
+        :returns: Return value of the function
+
+        """
+
+        loop = asyncio.get_running_loop()
+        if Executor._loop is not loop:
+            # Queue limits belong to the event loop
+            Executor._loop = loop
+            Executor._slots.clear()
+
+        if pool not in Executor._pools:
+            Executor._pools[pool] = ThreadPoolExecutor(
+                Executor.WORKERS[pool], thread_name_prefix=f"kryzbu-{pool}"
+            )
+            Executor._queued[pool] = 0
+        if pool not in Executor._slots:
+            Executor._slots[pool] = asyncio.Semaphore(
+                Executor.WORKERS[pool] + Executor.QUEUE_LIMIT
+            )
+
+        async with Executor._slots[pool]:
+            Executor.queued(pool, 1)
+            submitted = time.perf_counter()
+
+            if pool in Executor.PROCESSES:
+                # Process can't report back when call starts, whole call is measured
+                try:
+                    return await loop.run_in_executor(
+                        Executor._pools[pool], func, *args
+                    )
+                finally:
+                    Executor.queued(pool, -1)
+                    Metrics.timing(
+                        f"executor.{pool}.call", time.perf_counter() - submitted
+                    )
+
+            def call():
+                Executor.queued(pool, -1)
+                Metrics.timing(f"executor.{pool}.wait", time.perf_counter() - submitted)
+                return func(*args)
+
+            return await loop.run_in_executor(Executor._pools[pool], call)
+
+    @staticmethod
+    def queued(pool: str, change: int) -> None:
+        """
+        Updates number of calls waiting in the pool.
+
+        :param pool: Name of pool
+        :type pool: str
+        :param change: +1 when call is submitted, -1 when it starts
+        :type change: int
+
+        """
+
+        with Executor._lock:
+            Executor._queued[pool] += change
+            Metrics.gauge(f"executor.{pool}.queue", Executor._queued[pool])
+
+    @staticmethod
+    def shutdown() -> None:
+        """
+        Waits for running calls and stops all pools.
+
+        """
+
+        for pool in Executor._pools.values():
+            pool.shutdown(wait=True)
+        Executor._pools.clear()
@@ -0,0 +1,376 @@
+# Limits is library for protecting Kryzbu server against overload
+#
+# Source code available on: https://github.com/martin-nohava/kryzbu.
+
+import asyncio
+import collections
+import time
+from .bandwidth import Token_bucket
+from .loglib import Log
+from .metrics import Metrics
+
+
+class Admission:
+    """
+    | Admission control of the server. Every new connection and every upload or download is admitted only
+    | while server is under its limits, otherwise client gets fast *BUSY* answer with hint how long to wait
+    | (*RETRY_AFTER*) and backs off. Connections over limit are closed right away, so storm of clients can not
+    | exhaust file descriptors and memory of the server.
+    |
+    | Limits are counted by every server process separately, with more worker processes
+    | (see :py:meth:`share() <server.limits.Admission.share>`) every worker gets its part of them.
+    |
+    | **Reasons of refusal:**
+    | *TooManyConnections* – server holds *MAX_CONNECTIONS* connections
+    | *TooManyIpConnections* – server holds *MAX_IP_CONNECTIONS* connections from the same IP address
+    | *TooManyTransfers* – user runs *MAX_USER_TRANSFERS* uploads and downloads at the same time
+    |
+    | **Global variables in this class:**
+    | **MAX_CONNECTIONS** (*int*) – largest number of open connections
+    | **MAX_IP_CONNECTIONS** (*int*) – largest number of open connections from one IP address
+    | **MAX_USER_TRANSFERS** (*int*) – largest number of uploads and downloads of one user in progress
+    | **RETRY_AFTER** (*float*) – how long should refused client wait before next attempt (seconds)
+    | **HANDSHAKE_TIMEOUT** (*float*) – connection which does not finish TLS handshake in time is closed (seconds)
+    """
+
+    MAX_CONNECTIONS = 512
+    MAX_IP_CONNECTIONS = 64
+    MAX_USER_TRANSFERS = 16
+    RETRY_AFTER = 1.0
+    HANDSHAKE_TIMEOUT = 10.0
+
+    _connections: int = 0
+    _ip_connections: dict = {}
+    _user_transfers: dict = {}
+
+    @staticmethod
+    def share(workers: int) -> None:
+        """
+        Divides limits among worker processes, called before workers are started.
+
+        :param workers: Number of worker processes
+        :type workers: int
+
+        """
+
+        Admission.MAX_CONNECTIONS = -(-Admission.MAX_CONNECTIONS // workers)
+        Admission.MAX_IP_CONNECTIONS = -(-Admission.MAX_IP_CONNECTIONS // workers)
+        Admission.MAX_USER_TRANSFERS = -(-Admission.MAX_USER_TRANSFERS // workers)
+
+    @staticmethod
+    def connect(ip: str) -> str:
+        """
+        Admits new connection, admitted connection must be released by
+        :py:meth:`disconnect() <server.limits.Admission.disconnect>`.
+
+        :param ip: IP address of client
+        :type ip: str
+        :returns: None if connection is admitted, reason of refusal otherwise
+        :rtype: str
+
+        """
+
+        if Admission._connections >= Admission.MAX_CONNECTIONS:
+            reason = "TooManyConnections"
+        elif Admission._ip_connections.get(ip, 0) >= Admission.MAX_IP_CONNECTIONS:
+            reason = "TooManyIpConnections"
+        else:
+            Admission._connections += 1
+            Admission._ip_connections[ip] = Admission._ip_connections.get(ip, 0) + 1
+            Metrics.gauge("admission.connections", Admission._connections)
+            return None
+
+        Metrics.increment(f"admission.{reason}")
+        return reason
+
+    @staticmethod
+    def disconnect(ip: str) -> None:
+        """
+        Releases admitted connection.
+
+        :param ip: IP address of client
+        :type ip: str
+
+        """
+
+        Admission._connections -= 1
+        Admission._ip_connections[ip] -= 1
+        if not Admission._ip_connections[ip]:
+            del Admission._ip_connections[ip]
+        Metrics.gauge("admission.connections", Admission._connections)
+
+    @staticmethod
+    def start_transfer(user_name: str) -> bool:
+        """
+        Admits upload or download of the user, admitted transfer must be released by
+        :py:meth:`end_transfer() <server.limits.Admission.end_transfer>`.
+
+        :param user_name: Name of user
+        :type user_name: str
+        :returns: Whether transfer is admitted
+        :rtype: bool
+
+        """
+
+        if Admission._user_transfers.get(user_name, 0) >= Admission.MAX_USER_TRANSFERS:
+            Metrics.increment("admission.TooManyTransfers")
+            return False
+
+        Admission._user_transfers[user_name] = (
+            Admission._user_transfers.get(user_name, 0) + 1
+        )
+        return True
+
+    @staticmethod
+    def end_transfer(user_name: str) -> None:
+        """
+        Releases admitted transfer.
+
+        :param user_name: Name of user
+        :type user_name: str
+
+        """
+
+        Admission._user_transfers[user_name] -= 1
+        if not Admission._user_transfers[user_name]:
+            del Admission._user_transfers[user_name]
+
+    @staticmethod
+    def retry_after() -> int:
+        """
+        Returns hint for refused client how long to wait, in milliseconds.
+
+        :rtype: int
+
+        """
+
+        return int(Admission.RETRY_AFTER * 1000)
+
+
+class Timeouts:
+    """
+    | Deadlines of reads from clients, so client which opens connection and sends nothing, or sends
+    | data one byte a minute, can not hold connection, its coroutine and buffers forever.
+    | Connection which misses its deadline is closed and counted in metrics as *timeouts.KIND*.
+    |
+    | **Kinds of deadlines:**
+    | *header* – request line, frame of login handshake or encrypted request must arrive in *HEADER_TIMEOUT*
+    | *idle* – open session waits for next request, or for client reading the reply, at most *IDLE_TIMEOUT*
+    | *rate* – file data must flow at least *MIN_RATE* bytes per second, see :py:class:`Deadline <server.limits.Deadline>`
+    |
+    | **Global variables in this class:**
+    | **HEADER_TIMEOUT** (*float*) – longest wait for request header (seconds)
+    | **IDLE_TIMEOUT** (*float*) – longest wait for next request of open session (seconds)
+    | **MIN_RATE** (*int*) – slowest accepted transfer of file data (bytes per second)
+    | **RATE_GRACE** (*float*) – time every transfer gets on top of *MIN_RATE*, e.g. for TCP slow start (seconds)
+    """
+
+    HEADER_TIMEOUT = 10.0
+    IDLE_TIMEOUT = 120.0
+    MIN_RATE = 4 * 1024
+    RATE_GRACE = 10.0
+
+    @staticmethod
+    async def header(awaitable):
+        """
+        Waits for request header at most *HEADER_TIMEOUT*.
+
+        :param awaitable: Read from client
+        :type awaitable: awaitable
+        :returns: Result of the read
+        :raises asyncio.TimeoutError: Deadline was missed
+
+        """
+
+        return await Timeouts.wait(awaitable, Timeouts.HEADER_TIMEOUT, "header")
+
+    @staticmethod
+    async def idle(awaitable):
+        """
+        Waits for next request or for client reading the reply at most *IDLE_TIMEOUT*.
+
+        :param awaitable: Read from client or drain of writer
+        :type awaitable: awaitable
+        :returns: Result of the read
+        :raises asyncio.TimeoutError: Deadline was missed
+
+        """
+
+        return await Timeouts.wait(awaitable, Timeouts.IDLE_TIMEOUT, "idle")
+
+    @staticmethod
+    async def wait(awaitable, timeout: float, kind: str):
+        """
+        Waits for *awaitable* at most *timeout* seconds, missed deadline is counted as *timeouts.KIND*.
+
+        :param awaitable: Read from client or drain of writer
+        :type awaitable: awaitable
+        :param timeout: Longest wait (seconds)
+        :type timeout: float
+        :param kind: Kind of deadline
+        :type kind: str
+        :returns: Result of the awaitable
+        :raises asyncio.TimeoutError: Deadline was missed
+
+        """
+
+        try:
+            return await asyncio.wait_for(awaitable, max(0.0, timeout))
+        except asyncio.TimeoutError:
+            Metrics.increment(f"timeouts.{kind}")
+            raise
+
+
+class Deadline:
+    """
+    | Minimum transfer rate deadline of one file transfer. Client must have transferred
+    | *Timeouts.MIN_RATE* bytes for every second spent waiting for him, after *Timeouts.RATE_GRACE*,
+    | and no single read or write may wait longer than *Timeouts.IDLE_TIMEOUT*. Only time spent waiting
+    | for client counts, so waiting for disk or for bandwidth share of the user does not shorten the deadline.
+    """
+
+    def __init__(self):
+        self.transferred: int = 0  # Bytes transferred so far
+        self.waited: float = 0.0  # Seconds spent waiting for client
+
+    async def wait(self, awaitable, size: int = 0):
+        """
+        Waits for read or write of file data. Bytes of the read are counted from its result,
+        write announces them by *size* in advance, so their transfer has time in deadline.
+
+        :param awaitable: Read of file data, drain of writer or sendfile
+        :type awaitable: awaitable
+        :param size: Number of bytes written
+        :type size: int
+        :returns: Result of the awaitable
+        :raises asyncio.TimeoutError: Deadline was missed
+
+        """
+
+        timeout = (
+            Timeouts.RATE_GRACE
+            + (self.transferred + size) / Timeouts.MIN_RATE
+            - self.waited
+        )
+        start = time.monotonic()
+        try:
+            result = await Timeouts.wait(
+                awaitable, min(Timeouts.IDLE_TIMEOUT, timeout), "rate"
+            )
+        finally:
+            self.waited += time.monotonic() - start
+
+        self.transferred += len(result) if isinstance(result, bytes) else size
+        return result
+
+
+class Rate_limiter:
+    """
+    | Limits rate of requests by token buckets, every kind of request has its own budget. Every request
+    | is counted to IP address of the client and request of authenticated client to his user as well,
+    | so neither many users behind one address nor one user from many addresses get more than one budget.
+    | Request over budget of either bucket is refused with *BUSY* and time after which both buckets hold a token again.
+    |
+    | Buckets are kept in memory in LRU of at most *MAX_BUCKETS*, every request updates at most two buckets in O(1).
+    | Forgotten bucket starts full again, so only buckets of clients idle for a long time should be forgotten.
+    |
+    | First refused request of every series is written to the log as *ACCESS_DENIED* event,
+    | all refused requests are counted in metrics as *ratelimit.BUDGET*.
+    |
+    | **Budgets:**
+    | *login* – LOGIN, the strictest one, every login costs server two RSA decryptions
+    | *meta* – AUTH, GETKEY, LIST_DIR, REMOVE, STAT and UPLOAD_STATUS, every AUTH costs server lookup of the user and AES check
+    | *data* – UPLOAD, DOWNLOAD, UPLOAD_OPEN, UPLOAD_CHUNK and UPLOAD_COMMIT
+    |
+    | **Global variables in this class:**
+    | **BUDGETS** (*dict*) – requests per second and burst of every budget
+    | **REQUESTS** (*dict*) – budget of every request
+    | **MAX_BUCKETS** (*int*) – largest number of buckets kept in memory
+    """
+
+    BUDGETS = {"login": (0.2, 5), "meta": (10, 50), "data": (20, 100)}
+    REQUESTS = {
+        "LOGIN": "login",
+        "AUTH": "meta",
+        "GETKEY": "meta",
+        "LIST_DIR": "meta",
+        "REMOVE": "meta",
+        "STAT": "meta",
+        "UPLOAD_STATUS": "meta",
+        "UPLOAD": "data",
+        "DOWNLOAD": "data",
+        "UPLOAD_OPEN": "data",
+        "UPLOAD_CHUNK": "data",
+        "UPLOAD_COMMIT": "data",
+    }
+    MAX_BUCKETS = 100000
+
+    _buckets = collections.OrderedDict()
+    _denied: set = set()
+
+    @staticmethod
+    async def admit(request: str, user_name: str, peer: tuple) -> float:
+        """
+        Takes token for request from bucket of IP address of the client and from bucket of the user, if client
+        is authenticated. Refused request takes no token.
+
+        :param request: Type of request, e.g. LOGIN
+        :type request: str
+        :param user_name: Name of authenticated user, None for anonymous client
+        :type user_name: str
+        :param peer: IP address and port of client
+        :type peer: tuple
+        :returns: 0 if request is admitted, otherwise how long should client wait (seconds)
+        :rtype: float
+
+        """
+
+        budget = Rate_limiter.REQUESTS.get(request)
+        if budget is None:
+            return 0.0
+
+        keys = [(budget, "ip", peer[0])]
+        if user_name is not None:
+            keys.append((budget, "user", user_name))
+        buckets = [Rate_limiter.bucket(key) for key in keys]
+
+        now = time.monotonic()
+        delays = [bucket.delay(1, now) for bucket in buckets]
+        if not any(delays):
+            for key, bucket in zip(keys, buckets):
+                bucket.take(1)
+                Rate_limiter._denied.discard(key)
+            return 0.0
+
+        Metrics.increment(f"ratelimit.{budget}")
+        denied = [key for key, delay in zip(keys, delays) if delay]
+        if not Rate_limiter._denied.issuperset(denied):
+            Rate_limiter._denied.update(denied)
+            await Log.enqueue(
+                Log.Event.ACCESS_DENIED,
+                "TooManyRequests",
+                [request, user_name or "anonymous", f"{peer[0]}:{peer[1]}"],
+            )
+        return max(delays)
+
+    @staticmethod
+    def bucket(key: tuple) -> "Token_bucket":
+        """
+        Returns bucket of the key, new full bucket if the key has none, and marks it as recently used.
+
+        :param key: Budget, kind of client identity ("ip" or "user") and the identity
+        :type key: tuple
+        :rtype: Token_bucket
+
+        """
+
+        bucket = Rate_limiter._buckets.get(key)
+        if bucket is None:
+            bucket = Token_bucket(*Rate_limiter.BUDGETS[key[0]])
+            Rate_limiter._buckets[key] = bucket
+            if len(Rate_limiter._buckets) > Rate_limiter.MAX_BUCKETS:
+                forgotten, _ = Rate_limiter._buckets.popitem(last=False)
+                Rate_limiter._denied.discard(forgotten)
+        else:
+            Rate_limiter._buckets.move_to_end(key)
+        return bucket
@@ -3,23 +3,85 @@
 # Source code available on: https://github.com/martin-nohava/kryzbu.
 
 from pathlib import Path
+import asyncio
+import concurrent.futures
 import datetime
+import json
+import os
+import threading
 from enum import Enum
 from .rsalib import Rsa
+from .executor import Executor
+from .metrics import Metrics
+from .merkle import Merkle
 from . import db
 from Crypto.Hash import HMAC, SHA256
 
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where server always runs as single process
+    fcntl = None
+
 
 class Log:
     """
     | The Log class provides system log management and log file integrity.
     |
+    | Integrity is kept by HMAC chain: every record ends with HMAC of previous record's HMAC and its own text,
+    | so appending costs the same no matter how long the log is. HMAC of the last record is stored in
+    | Hmac_index database, so removed records at the end of log are detected as well. Records written
+    | before chaining was introduced are covered by HMAC of their whole text, chain starts from it.
+    |
+    | Server does not wait for log writes: handlers only queue their events
+    | (see :py:meth:`enqueue() <server.loglib.Log.enqueue>`) and background task writes them in batches,
+    | one file write and one Hmac_index update per batch.
+    |
+    | Log is rotated into numbered segments by size or by day. Every segment is sealed by HMAC of its last record,
+    | seals are chained in manifest, so segments can not be removed or reordered without notice. Segments
+    | are verified independently of each other (see :py:meth:`verify_all() <server.loglib.Log.verify_all>`).
+    |
+    | With *FORMAT* set to *json* events are written as structured records, JSON objects chained the same way.
+    | Structured records are indexed by user, event type and time bucket in Log_index database,
+    | so :py:meth:`query() <server.loglib.Log.query>` reads only matching records instead of whole log.
+    |
+    | All records are leaves of :py:class:`Merkle tree <server.merkle.Merkle>` with signed root, so the server
+    | proves to auditors that single record is in the log, or that log was only appended to (see :py:meth:`prove() <server.loglib.Log.prove>`).
+    |
     | **Global variables in this class:**
     | **LOG_FOLDER** (*Path*) – path to log folder location
+    | **READ_BLOCK** (*int*) – size of blocks in which log is read
+    | **QUEUE_LIMIT** (*int*) – largest number of queued events, handlers wait when the queue is full
+    | **BATCH** (*int*) – largest number of events written at once
+    | **FILE_NAME** (*str*) – name of current log file
+    | **SEGMENT** (*str*) – name pattern of rotated log files, numbered from 1
+    | **MANIFEST** (*str*) – name of manifest listing segments
+    | **LOCK_FILE** (*str*) – name of file locked by process writing the log
+    | **ROTATE_SIZE** (*int*) – log is rotated when it reaches this size in bytes, 0 disables rotation by size
+    | **ROTATE_DAILY** (*bool*) – log is rotated when the first event of the day is written
+    | **VERIFY_WORKERS** (*int*) – number of processes verifying segments
+    | **FORMAT** (*str*) – format of written events, *text* or *json*
+    | **BUCKET** (*int*) – length of time bucket of Log_index in seconds
 
     """
 
     LOG_FOLDER = Path("server/_data/logs/")
+    READ_BLOCK = 64 * 1024
+    QUEUE_LIMIT = 10000
+    BATCH = 512
+    FILE_NAME = "kryzbu.log"
+    SEGMENT = "kryzbu.{:06d}.log"
+    MANIFEST = "kryzbu.manifest"
+    LOCK_FILE = "kryzbu.lock"
+    ROTATE_SIZE = 64 * 1000000
+    ROTATE_DAILY = False
+    VERIFY_WORKERS = os.cpu_count()
+    FORMAT = "text"
+    BUCKET = 3600
+    LOCK = threading.Lock()  # Log is written from executor threads and worker processes
+
+    _loop = None
+    _queue: asyncio.Queue = None
 
     # Posible events
     class Event(Enum):
@@ -35,14 +97,126 @@ class Log:
         UNREGISTER = 5
         ACCESS_DENIED = 6
 
+    @staticmethod
+    def event(type: Event, status, payload: list) -> None:
+        """
+        Writes any event passed in the parameters to a log file at once. Server queues events by
+        :py:meth:`enqueue() <server.loglib.Log.enqueue>` instead.
+
+        :param type: an Enum from class Event defining type of event beeing logged
+        :type type: Event
+        :param status: if success 0, else pass an error message here
+        :type status: any
+        :param payload: list of required information to log, is different for every Event type, see :py:meth:`format() <server.loglib.Log.format>`
+        :type payload: list[str]
+
+        """
+
+        Log.write(Log.format(type, status, payload))
+
+    @staticmethod
+    async def enqueue(type: Event, status, payload: list) -> None:
+        """
+        Queues event for :py:meth:`writer <server.loglib.Log.write_queued>` and returns, waits only when the queue is full.
+        Without running writer the event is written in executor.
+
+        :param type: an Enum from class Event defining type of event beeing logged
+        :type type: Event
+        :param status: if success 0, else pass an error message here
+        :type status: any
+        :param payload: list of required information to log, see :py:meth:`format() <server.loglib.Log.format>`
+        :type payload: list[str]
+
+        """
+
+        # Time of the event is taken now, not when it is written
+        log = Log.format(type, status, payload)
+        if Log._loop is not asyncio.get_running_loop():
+            await Executor.meta(Log.write, log)
+            return
+        await Log._queue.put(log)
+
+    @staticmethod
+    async def write_queued() -> None:
+        """
+        Background task writing queued events. Waits for first event and writes it together with all events
+        queued meanwhile, at most *BATCH* of them. Queue depth is reported as gauge *log.queue*.
+
+        """
+
+        Log._loop = asyncio.get_running_loop()
+        Log._queue = asyncio.Queue(Log.QUEUE_LIMIT)
+        queue = Log._queue
+
+        while True:
+            logs = [await queue.get()]
+            while len(logs) < Log.BATCH and not queue.empty():
+                logs.append(queue.get_nowait())
+            Metrics.gauge("log.queue", queue.qsize() + len(logs))
+
+            try:
+                await Executor.meta(Log.write_batch, logs)
+            except Exception as e:
+                # Writer keeps running, following events may be written
+                print(f"WARNING, Log: {len(logs)} event(s) were not written: {e!r}")
+            finally:
+                for _ in logs:
+                    queue.task_done()
+
+    @staticmethod
+    async def flush() -> None:
+        """
+        Waits until all queued events are written, called on shutdown.
+
+        """
+
+        if Log._loop is asyncio.get_running_loop():
+            await Log._queue.join()
+
+    @staticmethod
+    def structured(type: Event, status, payload: list) -> str:
+        """
+        Returns structured record of event, JSON object with time of event, name of event type, user, other items
+        of payload and error message if event failed. Payload is the same as for :py:meth:`format() <server.loglib.Log.format>`.
+
+        :param type: an Enum from class Event defining type of event beeing logged
+        :type type: Event
+        :param status: if success 0, else pass an error message here
+        :type status: any
+        :param payload: list of required information to log
+        :type payload: list[str]
+        :rtype: str
+
+        """
+
+        record = {
+            "time": datetime.datetime.now().strftime("%m/%d/%Y %H:%M:%S"),
+            "event": type.name,
+        }
+        if type in (Log.Event.UPLOAD, Log.Event.DOWNLOAD, Log.Event.DELETE):
+            record["user"] = payload[1]
+            record["file"] = payload[0]
+        elif type in (Log.Event.REGISTER, Log.Event.UNREGISTER):
+            record["user"] = payload[0]
+        elif type == Log.Event.ACCESS_DENIED:
+            record["user"] = payload[1]
+            record["resource"] = payload[0]
+            record["source"] = payload[2]
+        if status != 0:
+            record["error"] = str(status)
+
+        # Non-ASCII characters and line breaks are escaped, record is always single line
+        return json.dumps(record, separators=(",", ":")) + "\n"
+
     @staticmethod
     # Function params definition:
     # type – type of log message, e.g. UPLOAD, DOWNLOAD, etc.
     # status – status, if success 0, else pass error message e here
     # payload – list of required information to log
-    def event(type: Event, status, payload: list) -> None:
+    def format(type: Event, status, payload: list) -> str:
         """
-        Writes any event passed in the parameters to a log file.
+        Returns line of log describing any event passed in the parameters. With *FORMAT* set to *json*
+        returns :py:meth:`structured <server.loglib.Log.structured>` record instead.
 
         :param type: an Enum from class Event defining type of event beeing logged
         :type type: Event
@@ -50,6 +224,7 @@ class Log:
         :type status: any
         :param payload: list of required information to log, is different for every Event type.
         :type payload: list[str]
+        :rtype: str
 
         .. attention::
            Each event requires different input data in the payload variable to be written to a file. This structure must be observed when passing data to the *write* function. **See below.**
@@ -80,6 +255,9 @@ class Log:
         | **payload** [2] - src socket
         """
 
+        if Log.FORMAT == "json":
+            return Log.structured(type, status, payload)
+
         # Switch for finding correct event type,
         # every event requires different data input
 
@@ -108,10 +286,10 @@ class Log:
             )
             # SUCESS
             if status == 0:
-                Log.write(suc)
+                return suc
             # ERROR
             else:
-                Log.write(err)
+                return err
 
         # DOWNLOAD: file was downloaded from the server
         # *********** payload ***********
@@ -138,10 +316,10 @@ class Log:
             )
             # SUCESS
             if status == 0:
-                Log.write(suc)
+                return suc
             # ERROR
             else:
-                Log.write(err)
+                return err
 
         # DELETE: file was deleted from the server
         # *********** payload ***********
@@ -168,10 +346,10 @@ class Log:
             )
             # SUCESS
             if status == 0:
-                Log.write(suc)
+                return suc
             # ERROR
             else:
-                Log.write(err)
+                return err
 
         # REGISTER: user registered
         # *********** payload ***********
@@ -193,10 +371,10 @@ class Log:
             )
             # SUCESS
             if status == 0:
-                Log.write(suc)
+                return suc
             # ERROR
             else:
-                Log.write(err)
+                return err
 
         # UNREGISTER: user un-registered (deleted)
         # *********** payload ***********
@@ -218,10 +396,10 @@ class Log:
             )
             # SUCESS
             if status == 0:
-                Log.write(suc)
+                return suc
             # ERROR
             else:
-                Log.write(err)
+                return err
 
         # ACCESS_DENIED: Access to resources denied, Unauthorized user
         # *********** payload ***********
@@ -235,6 +413,8 @@ class Log:
                 + payload[0]
                 + " denied for user: "
                 + payload[1]
+                + " from "
+                + payload[2]
                 + ".\n"
             )
             err = (
@@ -243,74 +423,633 @@ class Log:
                 + payload[0]
                 + " denied for user: "
                 + payload[1]
+                + " from "
+                + payload[2]
                 + " with error "
                 + str(status)
                 + ".\n"
             )
             # SUCESS
             if status == 0:
-                Log.write(suc)
+                return suc
             # ERROR
             else:
-                Log.write(err)
+                return err
 
     @staticmethod
     # Function for appending lines to logfile
     def write(log: str) -> None:
         """
-        Function for appending lines to a logfile. After each call new HMAC of updated log file is created and stored in Hmac_index database. Private server RSA key and SHA256 is used.
+        Function for appending lines to a logfile, see :py:meth:`write_batch() <server.loglib.Log.write_batch>`.
 
         :param log: Line of structured text to write to a file 
         :type log: str
 
         """
-        FILE_NAME = "kryzbu.log"
-        file_path = Log.LOG_FOLDER / FILE_NAME
 
-        # Write new data to file
-        with open(file_path, "a") as f:
-            f.write(log)
+        Log.write_batch([log])
 
-        # Create new HMAC instance
-        private_key = open(Rsa.get_priv_key_location()).read().encode()
-        hmac_instance = HMAC.new(private_key, digestmod=SHA256)
-        # Process entire file in chunks
-        with open(file_path, "rb") as f:
-            while True:
-                bytes_read = f.read(1024)
-                if not bytes_read:
-                    break
-                hmac_instance.update(bytes_read)
-            # Write new log HMAC to Hmac_index database
-            db.Hmac_index.add(FILE_NAME, hmac_instance.hexdigest())
+    @staticmethod
+    def write_batch(logs: list) -> None:
+        """
+        Appends lines to a logfile by single write, see :py:meth:`append() <server.loglib.Log.append>`. Log is rotated first
+        when it is due (see :py:meth:`rotation_due() <server.loglib.Log.rotation_due>`), structured records are indexed after
+        and records are added to :py:class:`Merkle tree <server.merkle.Merkle>`.
+        Only one thread of one server process writes the log at a time (lock file is locked for other processes),
+        so chain is never forked.
+
+        :param logs: Lines of structured text to write to a file
+        :type logs: list[str]
+
+        """
+
+        with Log.LOCK, open(Log.LOG_FOLDER / Log.LOCK_FILE, "ab") as lock_file:
+            if fcntl:
+                # Lock is released when the file is closed
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            file_path = Log.LOG_FOLDER / Log.FILE_NAME
+            if Log.rotation_due(file_path):
+                Log.rotate()
+            offset = file_path.stat().st_size if file_path.exists() else 0
+            Log.append(Log.FILE_NAME, logs)
+            if Log.FORMAT == "json":
+                Log.index(offset, logs)
+            Merkle.sync(file_path)
+
+    @staticmethod
+    def append(file_name: str, logs: list) -> str:
+        """
+        Appends lines to a file by single write. Every line is written as record ending with HMAC of previous record's HMAC
+        and the line, HMAC of the last record is stored in Hmac_index database. Private server RSA key and SHA256 is used.
+        Caller must hold the log lock.
+
+        :param file_name: Name of log file or manifest
+        :type file_name: str
+        :param logs: Lines of structured text to write to a file
+        :type logs: list[str]
+        :returns: Hex string of HMAC of the last record
+        :rtype: str
+
+        """
+
+        private_key = Rsa.private_pem()
+
+        with open(Log.LOG_FOLDER / file_name, "a+b") as log_file:
+            # Chain continues from the last record, possibly written by another process
+            head = Log.head(log_file)
+            records = []
+            for log in logs:
+                text = log.rstrip("\n").encode()
+                head = HMAC.new(private_key, head + text, digestmod=SHA256).digest()
+                records.append(text + b" " + head.hex().encode() + b"\n")
+
+            # Write new records to file, writes of 'a' mode always go to its end
+            log_file.write(b"".join(records))
+            log_file.flush()
+
+        # Write HMAC of the last record to Hmac_index database
+        db.Hmac_index.add(file_name, head.hex())
+        return head.hex()
+
+    @staticmethod
+    def index(offset: int, logs: list) -> None:
+        """
+        Adds structured records just appended to log to Log_index database. Records are not read back,
+        their offsets follow from lengths of lines and HMACs. Caller must hold the log lock.
+
+        :param offset: Size of log before records were appended
+        :type offset: int
+        :param logs: Lines appended to log
+        :type logs: list[str]
+
+        """
+
+        records = []
+        for log in logs:
+            text = log.rstrip("\n")
+            # Record is text, space, HMAC in hex and new line
+            length = len(text.encode()) + 2 * SHA256.digest_size + 2
+            try:
+                record = json.loads(text)
+                bucket = int(Log.parse_time(record["time"]).timestamp()) // Log.BUCKET
+                records.append(
+                    (offset, length, record.get("user"), record["event"], bucket)
+                )
+            except (ValueError, KeyError, TypeError):
+                # Not a structured record
+                pass
+            offset += length
+
+        db.Log_index.add(Log.FILE_NAME, records, offset)
+
+    @staticmethod
+    def rotation_due(file_path: Path) -> bool:
+        """
+        Checks whether log has to be rotated: it is at least *ROTATE_SIZE* bytes long, or with *ROTATE_DAILY*
+        its first record was written on another day. Only the first line of log is read.
+
+        :param file_path: Path to log file
+        :type file_path: Path
+        :rtype: bool
+
+        """
+
+        try:
+            with open(file_path, "rb") as log_file:
+                day = Log.record_time(log_file.readline())[: len("MM/DD/YYYY")]
+                size = log_file.seek(0, os.SEEK_END)
+        except FileNotFoundError:
+            return False
+
+        if not size:
+            return False
+        if Log.ROTATE_SIZE and size >= Log.ROTATE_SIZE:
+            return True
+        return Log.ROTATE_DAILY and day != datetime.datetime.now().strftime("%m/%d/%Y")
+
+    @staticmethod
+    def rotate() -> None:
+        """
+        Renames log to the next numbered segment and seals it: HMAC of its last record is stored in Hmac_index
+        database under segment's name and appended to the manifest together with time of the first and the last record.
+        Manifest is chained the same way as log, so segments can not be removed or reordered without notice.
+        Caller must hold the log lock, new log is created by the next write.
+
+        """
+
+        file_path = Log.LOG_FOLDER / Log.FILE_NAME
+        # Tree has to hold all records of segment, they are not read from current log anymore
+        Merkle.sync(file_path)
+        with open(file_path, "rb") as log_file:
+            seal = Log.head(log_file).hex()
+            first, last = Log.time_span(log_file)
+
+        number = len(Log.manifest()) + 1
+        while (Log.LOG_FOLDER / Log.SEGMENT.format(number)).exists():
+            # Never overwrite segment, even one missing in the manifest
+            number += 1
+        segment = Log.SEGMENT.format(number)
+
+        os.replace(file_path, Log.LOG_FOLDER / segment)
+        db.Hmac_index.add(segment, seal)
+        db.Log_index.rename(Log.FILE_NAME, segment)
+        db.Merkle_index.rename(Log.FILE_NAME, segment)
+        Log.append(Log.MANIFEST, [f"{segment} {first} {last} {seal}"])
+        print(f"INFO: Log was rotated to segment '{segment}'")
+
+    @staticmethod
+    def manifest() -> list:
+        """
+        Returns segments listed in the manifest, oldest first. Every segment is tuple of its name, time of the first
+        and the last record and HMAC sealing it. Manifest integrity is not checked.
+
+        :returns: List of segments, empty when log was never rotated
+        :rtype: list[tuple]
+
+        """
+
+        segments = []
+        try:
+            with open(Log.LOG_FOLDER / Log.MANIFEST, "rb") as f:
+                for line in f:
+                    text = line.rstrip(b"\n").rpartition(b" ")[0].decode()
+                    parts = text.split(" ")
+                    if len(parts) == 6:
+                        segments.append(
+                            (
+                                parts[0],
+                                " ".join(parts[1:3]),
+                                " ".join(parts[3:5]),
+                                parts[5],
+                            )
+                        )
+        except FileNotFoundError:
+            pass
+        return segments
+
+    @staticmethod
+    def time_span(log_file) -> tuple:
+        """
+        Returns time of the first and the last record of log, as written in them.
+
+        :param log_file: Log file opened for binary reading
+        :type log_file: BinaryIO
+        :rtype: tuple[str, str]
+
+        """
+
+        log_file.seek(0)
+        first = log_file.readline()
+        return Log.record_time(first), Log.record_time(Log.last_line(log_file))
+
+    @staticmethod
+    def record_time(line: bytes) -> str:
+        """
+        Returns time of event as written in line of log, in text or structured record.
+
+        :param line: Line of log file
+        :type line: bytes
+        :returns: Time in format *MM/DD/YYYY HH:MM:SS*, empty string if line holds none
+        :rtype: str
+
+        """
+
+        if line.startswith(b"{"):
+            try:
+                return json.loads(line.rstrip(b"\n").rpartition(b" ")[0])["time"]
+            except (ValueError, KeyError, TypeError):
+                return ""
+        return line[: len("MM/DD/YYYY HH:MM:SS")].decode(errors="replace")
+
+    @staticmethod
+    def parse_time(text: str, end: bool = False) -> datetime.datetime:
+        """
+        Parses time in format of log records, *MM/DD/YYYY HH:MM:SS* or just *MM/DD/YYYY*.
+
+        :param text: Time to parse
+        :type text: str
+        :param end: Date without time means the end of the day, not its start
+        :type end: bool
+        :raises ValueError: Text is not time in either format
+        :rtype: datetime.datetime
+
+        """
+
+        try:
+            return datetime.datetime.strptime(text, "%m/%d/%Y %H:%M:%S")
+        except ValueError:
+            day = datetime.datetime.strptime(text, "%m/%d/%Y")
+        if end:
+            return day + datetime.timedelta(days=1, seconds=-1)
+        return day
+
+    @staticmethod
+    def last_line(log_file) -> bytes:
+        """
+        Returns the last line of log, only the end of file is read.
+
+        :param log_file: Log file opened for binary reading
+        :type log_file: BinaryIO
+        :rtype: bytes
+
+        """
+
+        # Read blocks from the end until the whole last line is read
+        position = log_file.seek(0, os.SEEK_END)
+        tail = b""
+        while position > 0 and tail.count(b"\n") < 2:
+            size = min(position, Log.READ_BLOCK)
+            position -= size
+            log_file.seek(position)
+            tail = log_file.read(size) + tail
+
+        return tail.rstrip(b"\n").rpartition(b"\n")[2]
+
+    @staticmethod
+    def head(log_file) -> bytes:
+        """
+        Returns HMAC of the last record, chain continues from it. Only the end of file is read.
+        When log holds no record yet (it is empty or written before chaining), returns HMAC of its whole text.
+
+        :param log_file: Log file opened for binary reading
+        :type log_file: BinaryIO
+        :rtype: bytes
+
+        """
+
+        mac = Log.record_mac(Log.last_line(log_file))
+        if mac is not None:
+            return bytes.fromhex(mac)
+
+        log_file.seek(0)
+        hmac_instance = HMAC.new(Rsa.private_pem(), digestmod=SHA256)
+        while True:
+            bytes_read = log_file.read(Log.READ_BLOCK)
+            if not bytes_read:
+                break
+            hmac_instance.update(bytes_read)
+        return hmac_instance.digest()
+
+    @staticmethod
+    def record_mac(line: bytes) -> str:
+        """
+        Returns HMAC carried by record.
+
+        :param line: Line of log file
+        :type line: bytes
+        :returns: Hex string of HMAC, None if line is not a record (written before chaining)
+        :rtype: str
+
+        """
+
+        mac = line.rstrip(b"\n").rpartition(b" ")[2]
+        if len(mac) != 2 * SHA256.digest_size:
+            return None
+        try:
+            bytes.fromhex(mac.decode())
+        except ValueError:
+            return None
+        return mac.decode()
 
     @staticmethod
     def verify(file_name: str) -> None:
         """
-        Function for verifying log file integrity. Private server RSA key and SHA256 is used. Prints result to the console.
+        Function for verifying log file integrity, prints result of :py:meth:`check() <server.loglib.Log.check>` to the console.
+
+        :param file_name: Name of log file, segment or manifest
+        :type file_name: str
+
+        """
+
+        print(Log.check(file_name))
+
+    @staticmethod
+    def check(file_name: str, seal: str = None) -> str:
+        """
+        Checks log file integrity, log is read once from start to end. Private server RSA key and SHA256 is used.
+        Failed check names the first record which does not fit the chain (record itself or some record before it
+        was changed, removed or inserted). HMAC of the last record has to match *seal*, which is taken
+        from Hmac_index database when not given.
 
-        :param file_name: Name of log file
+        :param file_name: Name of log file, segment or manifest
         :type file_name: str
+        :param seal: Hex string of HMAC of the last record, e.g. from the manifest
+        :type seal: str
+        :returns: Result message
+        :rtype: str
 
         """
         file_path = Log.LOG_FOLDER / file_name
+        private_key = Rsa.private_pem()
 
-        # Create new HMAC instance
-        private_key = open(Rsa.get_priv_key_location()).read().encode()
+        # Lines written before chaining, chain starts from their HMAC
         hmac_instance = HMAC.new(private_key, digestmod=SHA256)
+        head = None
+        number = 0
+
+        try:
+            f = open(file_path, "rb")
+        except FileNotFoundError:
+            return f"ERROR: The log file '{file_name}' is missing!"
+        with f:
+            for number, line in enumerate(f, 1):
+                mac = Log.record_mac(line)
+                if head is None and mac is None:
+                    hmac_instance.update(line)
+                    continue
+                if head is None:
+                    head = hmac_instance.digest()
+
+                # Check record
+                text = line.rstrip(b"\n").rpartition(b" ")[0]
+                try:
+                    if mac is None:
+                        raise ValueError("Line is not a record")
+                    HMAC.new(private_key, head + text, digestmod=SHA256).hexverify(mac)
+                except ValueError:
+                    return f"ERROR: The log file '{file_name}' integrity check failed at line {number}!"
+                head = bytes.fromhex(mac)
+
+        # Check that no record is missing at the end
+        if seal is None:
+            record = db.Hmac_index.get_record(file_name)
+            seal = record[1] if record is not None else None
+        mac = head.hex() if head is not None else hmac_instance.hexdigest()
+        if seal != mac:
+            return f"ERROR: The log file '{file_name}' integrity check failed, records after line {number} are missing!"
+        return f"SUCCESS: The log file '{file_name}' integrity check succeded."
+
+    @staticmethod
+    def verify_all(since: str = None, until: str = None) -> None:
+        """
+        Verifies the manifest, all segments listed in it and the current log, checks run in *VERIFY_WORKERS* processes.
+        Segments are checked against seals in the manifest, missing segments and segments not listed in the manifest
+        are reported too. With time range given, only segments holding records from the range are checked.
+        Prints results to the console.
 
-        # Process entire file in chunks
-        with open(file_path, "rb") as f:
-            while True:
-                bytes_read = f.read(1024)
-                if not bytes_read:
-                    break
-                hmac_instance.update(bytes_read)
+        :param since: Check only records written since this time, *MM/DD/YYYY [HH:MM:SS]*
+        :type since: str
+        :param until: Check only records written until this time, *MM/DD/YYYY [HH:MM:SS]*
+        :type until: str
 
-            # Check file integrity
+        """
+
+        try:
+            start = Log.parse_time(since) if since else None
+            end = Log.parse_time(until, end=True) if until else None
+        except ValueError:
+            print("ERROR: Time has to be in format MM/DD/YYYY [HH:MM:SS]!")
+            return
+
+        def in_range(first: str, last: str) -> bool:
             try:
-                mac = db.Hmac_index.get_record(file_name)[1]
-                hmac_instance.hexverify(mac)
-                print(f"SUCCESS: The log file '{file_name}' integrity check succeded.")
+                return (start is None or Log.parse_time(last) >= start) and (
+                    end is None or Log.parse_time(first) <= end
+                )
             except ValueError:
-                print(f"ERROR: The log file '{file_name}' integrity check failed!")
+                # Time of records is unknown, segment is checked
+                return True
+
+        messages = []
+        checks = []
+        segments = Log.manifest()
+        if (Log.LOG_FOLDER / Log.MANIFEST).exists():
+            messages.append(Log.check(Log.MANIFEST))
+
+        for number, (segment, first, last, seal) in enumerate(segments, 1):
+            if segment != Log.SEGMENT.format(number):
+                messages.append(
+                    f"ERROR: Segment '{segment}' is listed in the manifest out of order!"
+                )
+            if in_range(first, last):
+                checks.append((segment, seal))
+
+        listed = {segment[0] for segment in segments}
+        for path in sorted(Log.LOG_FOLDER.glob("kryzbu.*.log")):
+            if path.name not in listed:
+                messages.append(
+                    f"ERROR: Segment '{path.name}' is not listed in the manifest!"
+                )
+
+        file_path = Log.LOG_FOLDER / Log.FILE_NAME
+        if file_path.exists():
+            with open(file_path, "rb") as log_file:
+                first, last = Log.time_span(log_file)
+            if in_range(first, last):
+                checks.append((Log.FILE_NAME, None))
+
+        for message in messages:
+            print(message)
+        if not checks:
+            print("INFO: No log file holds records from given time range.")
+            return
+
+        names, seals = zip(*checks)
+        if len(checks) > 1 and Log.VERIFY_WORKERS > 1:
+            with concurrent.futures.ProcessPoolExecutor(
+                min(Log.VERIFY_WORKERS, len(checks))
+            ) as pool:
+                for message in pool.map(Log.check, names, seals):
+                    print(message)
+        else:
+            for message in map(Log.check, names, seals):
+                print(message)
+
+    @staticmethod
+    def query(
+        user: str = None, event: str = None, since: str = None, until: str = None
+    ) -> None:
+        """
+        Prints structured records matching all given conditions, oldest first. Records are looked up in Log_index
+        database, so only matching records are read, and records written after the index was last updated (by crashed server).
+        Every printed record is checked to fit HMAC chain after record preceding it, records that do not fit
+        are reported instead. Removed records are found by :py:meth:`verify_all() <server.loglib.Log.verify_all>`.
+
+        :param user: Only records of this user
+        :type user: str
+        :param event: Only records of this event type, e.g. DOWNLOAD
+        :type event: str
+        :param since: Only records written since this time, *MM/DD/YYYY [HH:MM:SS]*
+        :type since: str
+        :param until: Only records written until this time, *MM/DD/YYYY [HH:MM:SS]*
+        :type until: str
+
+        """
+
+        try:
+            start = Log.parse_time(since) if since else None
+            end = Log.parse_time(until, end=True) if until else None
+        except ValueError:
+            print("ERROR: Time has to be in format MM/DD/YYYY [HH:MM:SS]!")
+            return
+
+        def matches(record: dict) -> bool:
+            try:
+                time = Log.parse_time(record["time"])
+            except (ValueError, KeyError, TypeError):
+                return False
+            return (
+                (user is None or record.get("user") == user)
+                and (event is None or record.get("event") == event)
+                and (start is None or time >= start)
+                and (end is None or time <= end)
+            )
+
+        private_key = Rsa.private_pem()
+        count = 0
+
+        def show(file_name: str, offset: int, head: bytes, line: bytes) -> bytes:
+            # Prints matching record, returns its HMAC which the next record is chained to
+            nonlocal count
+            text, _, mac = line.rstrip(b"\n").rpartition(b" ")
+            try:
+                HMAC.new(private_key, head + text, digestmod=SHA256).hexverify(mac)
+            except ValueError:
+                print(
+                    f"ERROR: Record at offset {offset} of log file '{file_name}' does not fit the chain!"
+                )
+                return None
+            try:
+                record = json.loads(text)
+            except ValueError:
+                # Text record
+                record = None
+            if isinstance(record, dict) and matches(record):
+                print(text.decode())
+                count += 1
+            return bytes.fromhex(mac.decode())
+
+        found = {}
+        first = int(start.timestamp()) // Log.BUCKET if start else None
+        last = int(end.timestamp()) // Log.BUCKET if end else None
+        for file_name, offset, length in db.Log_index.find(user, event, first, last):
+            found.setdefault(file_name, []).append((offset, length))
+
+        files = {segment[0] for segment in Log.manifest()} | {Log.FILE_NAME}
+        for file_name in sorted(files | found.keys()):
+            size = db.Log_index.size(file_name)
+            if size is None and file_name not in found:
+                # Never written with structured records
+                continue
+            try:
+                f = open(Log.LOG_FOLDER / file_name, "rb")
+            except FileNotFoundError:
+                print(f"ERROR: The log file '{file_name}' is missing!")
+                continue
+
+            with f:
+                for offset, length in found.get(file_name, []):
+                    head = Log.previous_mac(f, offset)
+                    f.seek(offset)
+                    show(file_name, offset, head, f.read(length))
+
+                if size is None:
+                    continue
+                # Records not indexed yet are read one by one
+                head = Log.previous_mac(f, size)
+                offset = f.seek(size)
+                for line in f:
+                    head = show(file_name, offset, head, line)
+                    if head is None:
+                        break
+                    offset += len(line)
+
+        if not count:
+            print(
+                "INFO: No structured record matches the query, server writes them with --log-format json."
+            )
+
+    @staticmethod
+    def previous_mac(log_file, offset: int) -> bytes:
+        """
+        Returns HMAC which record at *offset* is chained to, carried by the end of previous line.
+        For the first record returns HMAC of all text before it (empty or written before chaining).
+
+        :param log_file: Log file opened for binary reading
+        :type log_file: BinaryIO
+        :param offset: Position of record in log file
+        :type offset: int
+        :rtype: bytes
+
+        """
+
+        size = 2 * SHA256.digest_size + 1
+        if offset >= size:
+            log_file.seek(offset - size)
+            mac = Log.record_mac(log_file.read(size))
+            if mac is not None:
+                return bytes.fromhex(mac)
+
+        log_file.seek(0)
+        hmac_instance = HMAC.new(Rsa.private_pem(), digestmod=SHA256)
+        while offset > 0:
+            bytes_read = log_file.read(min(offset, Log.READ_BLOCK))
+            if not bytes_read:
+                break
+            hmac_instance.update(bytes_read)
+            offset -= len(bytes_read)
+        return hmac_instance.digest()
+
+    @staticmethod
+    def prove(index: int = None, old_size: int = None) -> None:
+        """
+        Prints proof that record *index* is in the log, or that log of *old_size* records is prefix of current log,
+        as JSON to the console. Proofs are checked by :py:meth:`Merkle.check() <server.merkle.Merkle.check>`.
+
+        :param index: Index of record, the first record in Merkle tree is 0
+        :type index: int
+        :param old_size: Size of older log in records
+        :type old_size: int
+
+        """
+
+        try:
+            if index is not None:
+                proof = Merkle.inclusion(index, Log.LOG_FOLDER)
+            else:
+                proof = Merkle.consistency(old_size)
+        except (ValueError, FileNotFoundError) as e:
+            print(f"ERROR: Proof can't be made: {e}")
+            return
+        print(json.dumps(proof, indent=2))
@@ -0,0 +1,448 @@
+# Merkle is library for Merkle tree proofs of Kryzbu server log
+#
+# Source code available on: https://github.com/martin-nohava/kryzbu.
+
+import datetime
+from pathlib import Path
+from Crypto.Hash import SHA256
+from .rsalib import Rsa
+from . import db
+
+
+class Merkle:
+    """
+    | Merkle tree over log records, hashed as specified by `RFC 6962 <https://www.rfc-editor.org/rfc/rfc6962#section-2.1>`_.
+    | Every record of log is leaf of the tree, tree grows with every write of log and its root is signed
+    | by server private RSA key (signed tree head) when a proof asks for it, so log writes are not slowed down
+    | by RSA. Only hashes of complete subtrees are stored in Merkle_index
+    | database, hash of any other subtree is computed from at most log n of them.
+    |
+    | Server proves that a record is in the log (inclusion proof) and that log of older size is prefix of current log
+    | (consistency proof) by O(log n) hashes. Auditor checks proofs with server public key only, without reading the log
+    | (see :py:meth:`check() <server.merkle.Merkle.check>`).
+    |
+    | **Global variables in this class:**
+    | **HEAD** (*bytes*) – prefix of signed tree head
+    """
+
+    HEAD = b"kryzbu tree head"
+
+    @staticmethod
+    def leaf_hash(record: bytes) -> bytes:
+        """
+        Returns hash of leaf, record is hashed without line break.
+
+        :param record: Line of log
+        :type record: bytes
+        :rtype: bytes
+
+        """
+
+        return SHA256.new(b"\x00" + record.rstrip(b"\n")).digest()
+
+    @staticmethod
+    def node_hash(left: bytes, right: bytes) -> bytes:
+        """
+        Returns hash of inner node.
+
+        :param left: Hash of left child
+        :type left: bytes
+        :param right: Hash of right child
+        :type right: bytes
+        :rtype: bytes
+
+        """
+
+        return SHA256.new(b"\x01" + left + right).digest()
+
+    @staticmethod
+    def subtrees(lo: int, hi: int) -> list:
+        """
+        Returns complete subtrees which tree of leaves *lo* to *hi* is built from, the largest first.
+        Subtree of 2^level leaves starting at leaf index * 2^level is (level, index).
+
+        :param lo: The first leaf
+        :type lo: int
+        :param hi: Leaf after the last one
+        :type hi: int
+        :rtype: list[tuple]
+
+        """
+
+        subtrees = []
+        while lo < hi:
+            # The largest power of 2 not greater than size
+            level = (hi - lo).bit_length() - 1
+            subtrees.append((level, lo >> level))
+            lo += 1 << level
+        return subtrees
+
+    @staticmethod
+    def hash(nodes: dict, lo: int, hi: int) -> bytes:
+        """
+        Returns hash of tree of leaves *lo* to *hi*, computed from hashes of its complete subtrees.
+
+        :param nodes: Hashes of subtrees by (level, index)
+        :type nodes: dict
+        :param lo: The first leaf
+        :type lo: int
+        :param hi: Leaf after the last one
+        :type hi: int
+        :rtype: bytes
+
+        """
+
+        subtrees = Merkle.subtrees(lo, hi)
+        if not subtrees:
+            # Empty tree
+            return SHA256.new(b"").digest()
+        digest = nodes[subtrees[-1]]
+        for key in reversed(subtrees[:-1]):
+            digest = Merkle.node_hash(nodes[key], digest)
+        return digest
+
+    @staticmethod
+    def hashes(ranges: list) -> list:
+        """
+        Returns hashes of trees of leaves in *ranges*, all needed subtrees are read from database at once.
+
+        :param ranges: Tuples of the first leaf and leaf after the last one
+        :type ranges: list[tuple]
+        :rtype: list[bytes]
+
+        """
+
+        keys = {key for lo, hi in ranges for key in Merkle.subtrees(lo, hi)}
+        nodes = db.Merkle_index.nodes(list(keys))
+        return [Merkle.hash(nodes, lo, hi) for lo, hi in ranges]
+
+    @staticmethod
+    def inclusion_path(m: int, lo: int, hi: int) -> list:
+        """
+        Returns ranges of leaves whose hashes prove that leaf *m* is in tree of leaves *lo* to *hi*,
+        the lowest first (PATH of RFC 6962).
+
+        :rtype: list[tuple]
+
+        """
+
+        if hi - lo <= 1:
+            return []
+        k = 1 << ((hi - lo - 1).bit_length() - 1)
+        if m < lo + k:
+            return Merkle.inclusion_path(m, lo, lo + k) + [(lo + k, hi)]
+        return Merkle.inclusion_path(m, lo + k, hi) + [(lo, lo + k)]
+
+    @staticmethod
+    def consistency_path(m: int, lo: int, hi: int, complete: bool = True) -> list:
+        """
+        Returns ranges of leaves whose hashes prove that tree of leaves *lo* to *m* is prefix of tree of leaves
+        *lo* to *hi*, the lowest first (SUBPROOF of RFC 6962).
+
+        :rtype: list[tuple]
+
+        """
+
+        if m == hi:
+            return [] if complete else [(lo, hi)]
+        k = 1 << ((hi - lo - 1).bit_length() - 1)
+        if m <= lo + k:
+            return Merkle.consistency_path(m, lo, lo + k, complete) + [(lo + k, hi)]
+        return Merkle.consistency_path(m, lo + k, hi, False) + [(lo, lo + k)]
+
+    @staticmethod
+    def head_message(size: int, root: bytes, time: str) -> bytes:
+        """
+        Returns tree head as signed by server.
+
+        :rtype: bytes
+
+        """
+
+        return Merkle.HEAD + f" {size} {root.hex()} {time}".encode()
+
+    @staticmethod
+    def sync(file_path: Path) -> None:
+        """
+        Adds records of current log not in the tree yet as new leaves and stores new tree head unsigned, it is signed
+        by :py:meth:`signed_head() <server.merkle.Merkle.signed_head>`. Only new records are read, so records written
+        by crashed server are added with the next write. Caller must hold the log lock.
+
+        :param file_path: Path to current log
+        :type file_path: Path
+
+        """
+
+        head = db.Merkle_index.head()
+        size, offset = (head[0], head[4]) if head is not None else (0, 0)
+
+        try:
+            f = open(file_path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(offset)
+            records = []
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Record is just being written
+                    break
+                records.append(line)
+        if not records:
+            return
+
+        # New leaves hang on complete subtrees of current tree
+        nodes = db.Merkle_index.nodes(Merkle.subtrees(0, size))
+        new_nodes = {}
+        leaves = []
+        for record in records:
+            level, index = 0, size
+            digest = Merkle.leaf_hash(record)
+            new_nodes[(level, index)] = nodes[(level, index)] = digest
+            while index % 2:
+                # Right child completes its parent
+                digest = Merkle.node_hash(nodes[(level, index - 1)], digest)
+                level, index = level + 1, index // 2
+                new_nodes[(level, index)] = nodes[(level, index)] = digest
+
+            leaves.append((size, file_path.name, offset))
+            size += 1
+            offset += len(record)
+
+        root = Merkle.hash(nodes, 0, size)
+        db.Merkle_index.add(new_nodes, leaves, (size, root, None, None, offset))
+
+    @staticmethod
+    def signed_head() -> dict:
+        """
+        Returns current signed tree head. Head is signed on the first request after the tree has grown and the signature
+        is stored, so signing does not hold the log lock. When the tree grows meanwhile, the signed head is still valid
+        for proofs, only it is not stored.
+
+        :returns: Size, root hash, time and signature, hashes in hex
+        :rtype: dict
+
+        """
+
+        head = db.Merkle_index.head()
+        if head is None:
+            raise ValueError("Log tree is empty")
+        size, root, time, signature, _ = head
+        if signature is None:
+            time = datetime.datetime.now().strftime("%m/%d/%Y %H:%M:%S")
+            signature = Rsa.sign(Merkle.head_message(size, root, time))
+            db.Merkle_index.sign(size, time, signature)
+        return {
+            "size": size,
+            "root": root.hex(),
+            "time": time,
+            "signature": signature.hex(),
+        }
+
+    @staticmethod
+    def inclusion(index: int, log_folder: Path) -> dict:
+        """
+        Returns inclusion proof of record in current signed tree.
+
+        :param index: Index of record, the first record in tree is 0
+        :type index: int
+        :param log_folder: Location of log files
+        :type log_folder: Path
+        :raises ValueError: Tree has no such record
+        :returns: Proof with record, signed tree head and path of hashes in hex
+        :rtype: dict
+
+        """
+
+        head = Merkle.signed_head()
+        leaf = db.Merkle_index.leaf(index)
+        if not 0 <= index < head["size"] or leaf is None:
+            raise ValueError(f"Log tree has {head['size']} records, no record {index}")
+
+        file_name, offset = leaf
+        with open(log_folder / file_name, "rb") as f:
+            f.seek(offset)
+            record = f.readline().rstrip(b"\n")
+
+        path = Merkle.hashes(Merkle.inclusion_path(index, 0, head["size"]))
+        return {
+            "type": "inclusion",
+            "index": index,
+            "file": file_name,
+            "record": record.decode(errors="surrogateescape"),
+            **head,
+            "path": [digest.hex() for digest in path],
+        }
+
+    @staticmethod
+    def consistency(old_size: int) -> dict:
+        """
+        Returns consistency proof of tree of *old_size* records and current signed tree.
+
+        :param old_size: Size of older tree
+        :type old_size: int
+        :raises ValueError: Current tree is smaller or older tree is empty
+        :returns: Proof with root of older tree, signed tree head and path of hashes in hex
+        :rtype: dict
+
+        """
+
+        head = Merkle.signed_head()
+        if not 0 < old_size <= head["size"]:
+            raise ValueError(
+                f"Log tree has {head['size']} records, no tree of {old_size}"
+            )
+
+        old_root, *path = Merkle.hashes(
+            [(0, old_size)] + Merkle.consistency_path(old_size, 0, head["size"])
+        )
+        return {
+            "type": "consistency",
+            "old_size": old_size,
+            "old_root": old_root.hex(),
+            **head,
+            "path": [digest.hex() for digest in path],
+        }
+
+    @staticmethod
+    def verify_inclusion(
+        index: int, size: int, leaf: bytes, path: list, root: bytes
+    ) -> bool:
+        """
+        Checks inclusion proof, as specified by `RFC 9162 <https://www.rfc-editor.org/rfc/rfc9162#section-2.1.3.2>`_.
+
+        :param index: Index of leaf
+        :type index: int
+        :param size: Size of tree
+        :type size: int
+        :param leaf: Hash of leaf
+        :type leaf: bytes
+        :param path: Hashes of inclusion proof
+        :type path: list[bytes]
+        :param root: Root hash of tree
+        :type root: bytes
+        :rtype: bool
+
+        """
+
+        if index >= size:
+            return False
+        fn, sn = index, size - 1
+        digest = leaf
+        for p in path:
+            if sn == 0:
+                return False
+            if fn % 2 or fn == sn:
+                digest = Merkle.node_hash(p, digest)
+                while fn % 2 == 0 and fn:
+                    fn, sn = fn >> 1, sn >> 1
+            else:
+                digest = Merkle.node_hash(digest, p)
+            fn, sn = fn >> 1, sn >> 1
+        return sn == 0 and digest == root
+
+    @staticmethod
+    def verify_consistency(
+        old_size: int, size: int, old_root: bytes, root: bytes, path: list
+    ) -> bool:
+        """
+        Checks consistency proof, as specified by `RFC 9162 <https://www.rfc-editor.org/rfc/rfc9162#section-2.1.4.2>`_.
+
+        :param old_size: Size of older tree
+        :type old_size: int
+        :param size: Size of newer tree
+        :type size: int
+        :param old_root: Root hash of older tree
+        :type old_root: bytes
+        :param root: Root hash of newer tree
+        :type root: bytes
+        :param path: Hashes of consistency proof
+        :type path: list[bytes]
+        :rtype: bool
+
+        """
+
+        if not 0 < old_size <= size:
+            return False
+        if old_size == size:
+            return not path and old_root == root
+        if old_size & (old_size - 1) == 0:
+            # Older tree is complete subtree of newer one, its root is not in the proof
+            path = [old_root] + path
+        if not path:
+            return False
+
+        fn, sn = old_size - 1, size - 1
+        while fn % 2:
+            fn, sn = fn >> 1, sn >> 1
+        old_digest = digest = path[0]
+        for c in path[1:]:
+            if sn == 0:
+                return False
+            if fn % 2 or fn == sn:
+                old_digest = Merkle.node_hash(c, old_digest)
+                digest = Merkle.node_hash(c, digest)
+                while fn % 2 == 0 and fn:
+                    fn, sn = fn >> 1, sn >> 1
+            else:
+                digest = Merkle.node_hash(digest, c)
+            fn, sn = fn >> 1, sn >> 1
+        return sn == 0 and old_digest == old_root and digest == root
+
+    @staticmethod
+    def check(proof: dict, public_pem: bytes, old_head: dict = None) -> str:
+        """
+        Checks proof made by :py:meth:`inclusion() <server.merkle.Merkle.inclusion>`
+        or :py:meth:`consistency() <server.merkle.Merkle.consistency>`, only server public key is needed.
+        Signature of tree head is checked first. Consistency proof is checked against *old_head*,
+        tree head auditor saved before (any earlier proof), otherwise against root of older tree sent by server.
+
+        :param proof: Proof
+        :type proof: dict
+        :param public_pem: Server public key in PEM format
+        :type public_pem: bytes
+        :param old_head: Earlier proof or tree head
+        :type old_head: dict
+        :returns: Result message
+        :rtype: str
+
+        """
+
+        def signed(head: dict) -> bool:
+            message = Merkle.head_message(
+                head["size"], bytes.fromhex(head["root"]), head["time"]
+            )
+            return Rsa.verify(message, bytes.fromhex(head["signature"]), public_pem)
+
+        try:
+            if not signed(proof):
+                return "ERROR: Tree head is not signed by server!"
+            root = bytes.fromhex(proof["root"])
+            path = [bytes.fromhex(digest) for digest in proof["path"]]
+
+            if proof["type"] == "inclusion":
+                leaf = Merkle.leaf_hash(
+                    proof["record"].encode(errors="surrogateescape")
+                )
+                if not Merkle.verify_inclusion(
+                    proof["index"], proof["size"], leaf, path, root
+                ):
+                    return f"ERROR: Record {proof['index']} is not in the log of {proof['size']} records!"
+                return f"SUCCESS: Record {proof['index']} is in the log of {proof['size']} records signed {proof['time']}."
+
+            old_size, old_root = proof["old_size"], bytes.fromhex(proof["old_root"])
+            if old_head is not None:
+                if not signed(old_head):
+                    return "ERROR: Older tree head is not signed by server!"
+                if (
+                    old_head["size"] != old_size
+                    or old_head["root"] != proof["old_root"]
+                ):
+                    return "ERROR: Proof is not made for the older tree head!"
+            if not Merkle.verify_consistency(
+                old_size, proof["size"], old_root, root, path
+            ):
+                return f"ERROR: The log of {old_size} records is not prefix of the log of {proof['size']} records!"
+            return f"SUCCESS: The log of {old_size} records is prefix of the log of {proof['size']} records signed {proof['time']}."
+        except (KeyError, TypeError, ValueError) as e:
+            return f"ERROR: Proof is malformed: {e!r}"
@@ -0,0 +1,236 @@
+# Metrics is library for collecting runtime metrics of Kryzbu server
+#
+# Source code available on: https://github.com/martin-nohava/kryzbu.
+
+import asyncio
+import json
+import math
+import os
+import threading
+from pathlib import Path
+
+
+class Metrics:
+    """
+    | Runtime metrics of the server process: counters, gauges and timings. Metrics are kept in memory
+    | and dumped as JSON to *FOLDER* every *DUMP_INTERVAL* seconds, one file per server process.
+    | Metrics can be recorded from any thread.
+    |
+    | **Types of metrics:**
+    | *counter* – number of events, e.g. timed out connections
+    | *gauge* – current value and its maximum, e.g. queue depth
+    | *timing* – count, total, maximum and histogram of measured durations in seconds, percentiles are computed from the histogram
+    |
+    | **Global variables in this class:**
+    | **FOLDER** (*Path*) – location of dumped metrics
+    | **DUMP_INTERVAL** (*int*) – how often are metrics dumped (seconds)
+    | **BUCKETS** (*int*) – histogram buckets of timings per doubling of duration, more buckets give more precise percentiles
+    | **PERCENTILES** (*tuple*) – percentiles of timings shown by :py:meth:`show() <server.metrics.Metrics.show>`
+    """
+
+    FOLDER = Path("server/_data/metrics/")
+    DUMP_INTERVAL = 10
+    BUCKETS = 4
+    PERCENTILES = (50, 95, 99)
+
+    _lock = threading.Lock()
+    _counters: dict = {}
+    _gauges: dict = {}
+    _timings: dict = {}
+
+    @staticmethod
+    def increment(name: str, value: int = 1) -> None:
+        """
+        Increments counter.
+
+        :param name: Name of metric
+        :type name: str
+        :param value: Increment
+        :type value: int
+
+        """
+
+        with Metrics._lock:
+            Metrics._counters[name] = Metrics._counters.get(name, 0) + value
+
+    @staticmethod
+    def gauge(name: str, value: float) -> None:
+        """
+        Sets current value of gauge, its maximum is remembered.
+
+        :param name: Name of metric
+        :type name: str
+        :param value: Current value
+        :type value: float
+
+        """
+
+        with Metrics._lock:
+            maximum = Metrics._gauges.get(name, {"max": value})["max"]
+            Metrics._gauges[name] = {"value": value, "max": max(maximum, value)}
+
+    @staticmethod
+    def timing(name: str, seconds: float) -> None:
+        """
+        Records one measured duration.
+
+        :param name: Name of metric
+        :type name: str
+        :param seconds: Duration
+        :type seconds: float
+
+        """
+
+        with Metrics._lock:
+            timing = Metrics._timings.setdefault(
+                name, {"count": 0, "total": 0.0, "max": 0.0, "buckets": {}}
+            )
+            timing["count"] += 1
+            timing["total"] += seconds
+            timing["max"] = max(timing["max"], seconds)
+            # Bucket of durations between two powers of microseconds, keys are strings in JSON
+            bucket = str(math.floor(math.log2(max(seconds * 1e6, 1)) * Metrics.BUCKETS))
+            timing["buckets"][bucket] = timing["buckets"].get(bucket, 0) + 1
+
+    @staticmethod
+    def percentile(timing: dict, percent: float) -> float:
+        """
+        Returns estimated percentile of timing, upper bound of histogram bucket it falls into.
+
+        :param timing: Timing with histogram
+        :type timing: dict
+        :param percent: Percentile, 0 to 100
+        :type percent: float
+        :returns: Duration in seconds
+        :rtype: float
+
+        """
+
+        rank = timing["count"] * percent / 100
+        seen = 0
+        for bucket, count in sorted(
+            (int(bucket), count) for bucket, count in timing["buckets"].items()
+        ):
+            seen += count
+            if seen >= rank:
+                # Bucket bound may exceed the longest duration
+                return min(2 ** ((bucket + 1) / Metrics.BUCKETS) / 1e6, timing["max"])
+        return timing["max"]
+
+    @staticmethod
+    def snapshot() -> dict:
+        """
+        Returns copy of all metrics of this process.
+
+        :rtype: dict
+
+        """
+
+        with Metrics._lock:
+            return json.loads(
+                json.dumps(
+                    {
+                        "counters": Metrics._counters,
+                        "gauges": Metrics._gauges,
+                        "timings": Metrics._timings,
+                    }
+                )
+            )
+
+    @staticmethod
+    def dump() -> None:
+        """
+        Writes metrics of this process to *FOLDER/PID.json*.
+
+        """
+
+        file_path = Metrics.FOLDER / f"{os.getpid()}.json"
+        with open(file_path.with_suffix(".tmp"), "w") as f:
+            json.dump(Metrics.snapshot(), f)
+        os.replace(file_path.with_suffix(".tmp"), file_path)
+
+    @staticmethod
+    def remove(pid: int) -> None:
+        """
+        Deletes dumped metrics of server process which is no longer running.
+
+        :param pid: Process ID
+        :type pid: int
+
+        """
+
+        (Metrics.FOLDER / f"{pid}.json").unlink(missing_ok=True)
+
+    @staticmethod
+    async def dump_periodically() -> None:
+        """
+        Dumps metrics every *DUMP_INTERVAL* seconds.
+
+        """
+
+        while True:
+            await asyncio.sleep(Metrics.DUMP_INTERVAL)
+            Metrics.dump()
+
+    @staticmethod
+    def clear() -> None:
+        """
+        Deletes dumped metrics of previous server run.
+
+        """
+
+        Metrics.FOLDER.mkdir(parents=True, exist_ok=True)
+        for file in os.listdir(Metrics.FOLDER):
+            os.remove(Metrics.FOLDER / file)
+
+    @staticmethod
+    def show() -> None:
+        """
+        Prints metrics dumped by all server processes, values of all processes are added together.
+
+        """
+
+        merged = {"counters": {}, "gauges": {}, "timings": {}}
+        files = (
+            [file for file in os.listdir(Metrics.FOLDER) if file.endswith(".json")]
+            if os.path.exists(Metrics.FOLDER)
+            else []
+        )
+
+        for file in files:
+            with open(Metrics.FOLDER / file, "r") as f:
+                metrics = json.load(f)
+            for name, value in metrics["counters"].items():
+                merged["counters"][name] = merged["counters"].get(name, 0) + value
+            for name, value in metrics["gauges"].items():
+                gauge = merged["gauges"].setdefault(name, {"value": 0, "max": 0})
+                gauge["value"] += value["value"]
+                gauge["max"] += value["max"]
+            for name, value in metrics["timings"].items():
+                timing = merged["timings"].setdefault(
+                    name, {"count": 0, "total": 0.0, "max": 0.0, "buckets": {}}
+                )
+                timing["count"] += value["count"]
+                timing["total"] += value["total"]
+                timing["max"] = max(timing["max"], value["max"])
+                for bucket, count in value.get("buckets", {}).items():
+                    timing["buckets"][bucket] = timing["buckets"].get(bucket, 0) + count
+
+        if not files:
+            print("INFO: No metrics found, is the server running?")
+            return
+
+        print(f"Metrics of {len(files)} server process(es):")
+        for name, value in sorted(merged["counters"].items()):
+            print(f"{name:<40} {value}")
+        for name, value in sorted(merged["gauges"].items()):
+            print(f"{name:<40} {value['value']} (max {value['max']})")
+        for name, value in sorted(merged["timings"].items()):
+            average = value["total"] / value["count"] if value["count"] else 0
+            percentiles = "".join(
+                f", p{percent} {Metrics.percentile(value, percent) * 1000:.2f} ms"
+                for percent in Metrics.PERCENTILES
+            )
+            print(
+                f"{name:<40} count {value['count']}, avg {average * 1000:.2f} ms{percentiles}, max {value['max'] * 1000:.2f} ms"
+            )
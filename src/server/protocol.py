@@ -0,0 +1,155 @@
+# Protocol is library for binary framing of messages between Kryzbu server and client
+#
+# Source code available on: https://github.com/martin-nohava/kryzbu.
+
+import asyncio
+import struct
+from enum import IntEnum
+from typing import Tuple
+
+
+class Frame:
+    """
+    | Versioned binary length-prefixed frame format. Frame layout must be same as in *client/protocol.py*.
+    |
+    | Client starts every connection with text line 'HELLO;VERSION'. Server supporting this version
+    | answers 'OK;HELLO;VERSION' and from now on both sides exchange only frames. Old servers do not
+    | understand the line and close the connection, so client falls back to the old text protocol.
+    | Server over its connection limits answers 'BUSY;REASON;RETRY_AFTER' and closes the connection.
+    |
+    | **Frame structure:**
+    | *header* – fixed 14 bytes: version (1 B), opcode (1 B), request ID (4 B), payload length (8 B)
+    | *payload* – sequence of fields, every field is prefixed with its length (4 B)
+    |
+    | File data are not part of frames, they follow *UPLOAD* request or *OK* reply as raw bytes
+    | of length announced in the frame, so they can be streamed without copying.
+    |
+    | **Global variables in this class:**
+    | **VERSION** (*int*) – version of frame format
+    | **HELLO** (*str*) – negotiation line sent by client before first frame
+    | **HEADER** (*Struct*) – layout of frame header
+    | **FIELD** (*Struct*) – layout of field length prefix
+    | **U64** (*Struct*) – layout of numeric fields
+    | **MAX_PAYLOAD** (*int*) – largest accepted payload, protects against memory exhaustion
+    """
+
+    VERSION: int = 1
+    HELLO: str = "HELLO"
+    HEADER: struct.Struct = struct.Struct("!BBIQ")
+    FIELD: struct.Struct = struct.Struct("!I")
+    U64: struct.Struct = struct.Struct("!Q")
+    MAX_PAYLOAD: int = 1024 * 1024
+
+    class Op(IntEnum):
+        """
+        Opcode table of all defined frames.
+
+        """
+
+        GETKEY = 1
+        LOGIN = 2
+        AUTH = 3
+        UPLOAD = 4
+        DOWNLOAD = 5
+        REMOVE = 6
+        LIST_DIR = 7
+        UPLOAD_OPEN = 8
+        UPLOAD_STATUS = 9
+        UPLOAD_CHUNK = 10
+        UPLOAD_COMMIT = 11
+        STAT = 12
+        OK = 128
+        ERROR = 129
+        BUSY = 130
+
+    @staticmethod
+    def pack(op: Op, request_id: int, *fields: bytes) -> bytes:
+        """
+        Builds frame from opcode, request ID and fields.
+
+        :param op: Opcode of frame
+        :type op: Frame.Op
+        :param request_id: ID of request, reply carries ID of request it belongs to
+        :type request_id: int
+        :param fields: Fields of payload
+        :type fields: bytes
+        :returns: Frame ready to be sent
+        :rtype: bytes
+
+        """
+
+        payload = b"".join(Frame.FIELD.pack(len(field)) + field for field in fields)
+        return Frame.HEADER.pack(Frame.VERSION, op, request_id, len(payload)) + payload
+
+    @staticmethod
+    def write(
+        writer: asyncio.StreamWriter, op: Op, request_id: int, *fields: bytes
+    ) -> None:
+        """
+        Writes frame to the stream.
+
+        :param writer: writer instance
+        :type writer: asyncio.StreamWriter
+        :param op: Opcode of frame
+        :type op: Frame.Op
+        :param request_id: ID of request
+        :type request_id: int
+        :param fields: Fields of payload
+        :type fields: bytes
+
+        """
+
+        writer.write(Frame.pack(op, request_id, *fields))
+
+    @staticmethod
+    async def read(reader: asyncio.StreamReader) -> Tuple:
+        """
+        Reads exactly one frame from the stream.
+
+        :param reader: reader instance
+        :type reader: asyncio.StreamReader
+        :returns: Opcode, request ID and fields of payload, unknown opcode is returned as *int*
+        :rtype: Tuple: (op, request_id, fields)
+        :raises ValueError: Frame of unsupported version, or payload over *MAX_PAYLOAD* or not split to fields
+
+        """
+
+        header = await reader.readexactly(Frame.HEADER.size)
+        version, op, request_id, length = Frame.HEADER.unpack(header)
+
+        if version != Frame.VERSION:
+            raise ValueError(f"Frame: Unsupported frame version {version}")
+        if length > Frame.MAX_PAYLOAD:
+            raise ValueError(f"Frame: Payload of {length} bytes exceeds limit")
+
+        try:
+            op = Frame.Op(op)
+        except ValueError:
+            # Unknown opcode, it is up to receiver how to answer it
+            pass
+        return op, request_id, Frame.fields(await reader.readexactly(length))
+
+    @staticmethod
+    def fields(payload: bytes) -> list:
+        """
+        Splits payload to fields.
+
+        :param payload: Payload of frame
+        :type payload: bytes
+        :returns: Fields of payload
+        :rtype: list[bytes]
+
+        """
+
+        fields = []
+        offset = 0
+        while offset < len(payload):
+            if offset + Frame.FIELD.size > len(payload):
+                raise ValueError("Frame: Field exceeds payload")
+            (length,) = Frame.FIELD.unpack_from(payload, offset)
+            offset += Frame.FIELD.size
+            if offset + length > len(payload):
+                raise ValueError("Frame: Field exceeds payload")
+            fields.append(payload[offset : offset + length])
+            offset += length
+        return fields
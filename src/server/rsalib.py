@@ -1,11 +1,18 @@
 import os
+import threading
 from pathlib import Path
 from Crypto.PublicKey import RSA
+from Crypto.Cipher import PKCS1_OAEP
+from Crypto.Hash import SHA256
+from Crypto.Signature import pkcs1_15
 
 
 class Rsa:
     """
     | Class containing logic for RSA key pair generation, storing and manimulation on server.
+    | Key pair is loaded into memory once, private key is parsed once and its cipher is reused by every login
+    | (see :py:meth:`cipher() <server.rsalib.Rsa.cipher>`), the same holds for its signer. When key files are replaced
+    | (key rotation), keys are loaded again on next use.
     |
     | **Global variables in this class:**
     | **KEY_SIZE** (*int*) – size of generated keys in bits
@@ -18,6 +25,10 @@ class Rsa:
     KEY_PATH = Path("server/_data/keys/")
     KEY_FILE_NAMES = ("priv.pem", "publ.pem")
 
+    _lock = threading.Lock()
+    _stamp: tuple = None  # Modification times of loaded key files
+    _keys: tuple = None  # (private key PEM, cipher, public key PEM, signer)
+
     @staticmethod
     def init()->None:
         """
@@ -61,3 +72,139 @@ class Rsa:
 
         """
         return Rsa.KEY_PATH / Rsa.KEY_FILE_NAMES[0]
+
+    @staticmethod
+    def load() -> None:
+        """
+        Loads key pair from files, parses private key and creates its cipher and signer. Keys already in memory
+        are replaced, so it may be called after keys were rotated.
+        Key pair which can't be parsed (e.g. file is just being written) is not loaded,
+        keys in memory are kept and loading is tried again on next use.
+
+        """
+
+        with Rsa._lock:
+            stamp = Rsa.stamp()
+            try:
+                private_pem = Rsa.get_priv_key_location().read_bytes()
+                public_pem = Rsa.get_pub_key_location().read_bytes()
+                private_key = RSA.import_key(private_pem)
+                cipher = PKCS1_OAEP.new(private_key)
+                signer = pkcs1_15.new(private_key)
+            except ValueError:
+                if Rsa._keys is None:
+                    raise
+                print("WARNING, Rsa: RSA key-pair can't be loaded, using previous keys")
+                return
+            Rsa._keys = (private_pem, cipher, public_pem, signer)
+            Rsa._stamp = stamp
+
+    @staticmethod
+    def stamp() -> tuple:
+        """
+        Returns modification times of key files, they change when keys are rotated.
+
+        :rtype: tuple
+
+        """
+
+        return tuple(
+            os.stat(Rsa.KEY_PATH / name).st_mtime_ns for name in Rsa.KEY_FILE_NAMES
+        )
+
+    @staticmethod
+    def keys() -> tuple:
+        """
+        Returns loaded keys, loads them first when they were not loaded yet or key files changed.
+
+        :returns: Private key PEM, cipher of private key, public key PEM, signer of private key
+        :rtype: tuple
+
+        """
+
+        if Rsa._keys is None or Rsa._stamp != Rsa.stamp():
+            Rsa.load()
+        return Rsa._keys
+
+    @staticmethod
+    def cipher():
+        """
+        Returns PKCS#1 OAEP cipher of server private key, used for decryption of login handshake.
+
+        :rtype: PKCS1OAEP_Cipher
+
+        """
+
+        return Rsa.keys()[1]
+
+    @staticmethod
+    def decrypt(c: bytes) -> bytes:
+        """
+        Decrypts cyphertext *c* encrypted with server public key. CPU bound, server runs it
+        in :py:meth:`crypto pool <server.executor.Executor.crypto>`.
+
+        :param c: Cyphertext
+        :type c: bytes
+        :rtype: bytes
+
+        """
+
+        return Rsa.cipher().decrypt(c)
+
+    @staticmethod
+    def sign(message: bytes) -> bytes:
+        """
+        Signs SHA256 hash of *message* with server private key (PKCS#1 v1.5).
+
+        :param message: Message to sign
+        :type message: bytes
+        :rtype: bytes
+
+        """
+
+        return Rsa.keys()[3].sign(SHA256.new(message))
+
+    @staticmethod
+    def verify(message: bytes, signature: bytes, public_pem: bytes) -> bool:
+        """
+        Checks signature made by :py:meth:`sign() <server.rsalib.Rsa.sign>`, only public key is needed.
+
+        :param message: Signed message
+        :type message: bytes
+        :param signature: Signature of message
+        :type signature: bytes
+        :param public_pem: Public key in PEM format
+        :type public_pem: bytes
+        :rtype: bool
+
+        """
+
+        try:
+            pkcs1_15.new(RSA.import_key(public_pem)).verify(
+                SHA256.new(message), signature
+            )
+        except ValueError:
+            return False
+        return True
+
+    @staticmethod
+    def private_pem() -> bytes:
+        """
+        Returns server private key in PEM format.
+
+        :rtype: bytes
+
+        """
+
+        return Rsa.keys()[0]
+
+    @staticmethod
+    def public_pem() -> bytes:
+        """
+        Returns server public key in PEM format, as sent to clients.
+
+        :rtype: bytes
+
+        """
+
+        return Rsa.keys()[2]
@@ -4,13 +4,23 @@ import os
 import pickle
 import asyncio
 import uuid
+import signal
+import struct
+import sys
+import time
+import traceback
 from pathlib import Path
 import ssl
 from .loglib import Log
-from .db import File_index, Hmac_index, User_db
+from .db import File_index, Hmac_index, Log_index, Merkle_index, User_db
 from .rsalib import Rsa
-from Crypto.PublicKey import RSA
-from Crypto.Cipher import PKCS1_OAEP, AES
+from .protocol import Frame
+from .uploads import Upload_session
+from .executor import Executor
+from .metrics import Metrics
+from .limits import Admission, Deadline, Rate_limiter, Timeouts
+from .bandwidth import Bandwidth
+from Crypto.Cipher import AES
 import climage
 
 
@@ -23,7 +33,16 @@ class Server:
     | **PORT** (*int*) – server binds to this port on the host system
     | **EOM** (*str*) – End of Message sign, should be same as in *client.py*, helps in byte stream signaling
     | **SERVER_FOLDER** (*Path*) – defines where to store user files on server
+    | **UPLOAD_FOLDER** (*Path*) – unfinished uploads are stored here, file is moved to *SERVER_FOLDER* when complete
+    | **RECV_BUFFER** (*int*) – largest chunk of uploaded file held in memory per connection
     | **VERBOSITY** (*int*) – verbosity level set by user
+    | **SEND_BUFFER** (*tuple*) – smallest and largest buffer for sending files, when *sendfile* is not available
+    | **DRAIN_TARGET** (*float*) – send buffer grows while client drains it faster than this (seconds)
+    | **WORKERS** (*int*) – number of worker processes accepting connections on *PORT*, set by user
+    | **RESTART_DELAY** (*float*) – worker which died sooner than this after start is restarted after this delay (seconds)
+    | **TLS_TICKETS** (*int*) – number of TLS session tickets issued after full handshake
+    | **SSL_CONTEXT** (*SSLContext*) – SSL context of the server, shared by all worker processes
+    | **SHUTDOWN_TIMEOUT** (*float*) – how long may running transfers take after shutdown was requested (seconds)
     """
 
     IP: str = "127.0.0.1"
@@ -32,41 +51,470 @@ class Server:
     SERVER_FOLDER: Path = Path(
         "server/_data/files/"
     )  # Universal Path object for multi OS path declaration
+    UPLOAD_FOLDER: Path = Path("server/_data/uploads/")
+    RECV_BUFFER: int = 64 * 1024
     VERBOSITY: int = None  # Verbosity level set by console-app (kryzbu_server.py)
+    SEND_BUFFER: tuple = (64 * 1024, 4 * 1024 * 1024)
+    DRAIN_TARGET: float = 0.05
+    WORKERS: int = 1
+    RESTART_DELAY: float = 1.0
+    TLS_TICKETS: int = 2
+    SSL_CONTEXT: ssl.SSLContext = None
+    SHUTDOWN_TIMEOUT: float = 30.0
+
+    _stopping: asyncio.Event = None
+    _connections: set = set()  # Tasks of open connections
+    _idle: set = set()  # Tasks of connections waiting for request
 
     @staticmethod
     def start():
         """
         Starts Kryzbu server, calls initialization checks before it continues.
+        With more than one *WORKERS* starts :py:meth:`supervisor <server.server.Server.supervise>` of worker processes instead.
+        Server stops gracefully on *SIGTERM* or *Ctrl+C*, see :py:meth:`stop() <server.server.Server.stop>`.
 
         """
 
         Server.init()
+        # Created before workers are forked, so they share keys of session tickets
+        Server.SSL_CONTEXT = Server.create_ssl_context()
+        if Server.WORKERS > 1:
+            if hasattr(os, "fork"):
+                Admission.share(Server.WORKERS)
+                Bandwidth.share(Server.WORKERS)
+                Server.supervise()
+                return
+            print(
+                "WARNING, Server: Worker processes are not supported on this platform, running single process"
+            )
+            Server.WORKERS = 1
+
         try:
             asyncio.run(Server.run())
         except KeyboardInterrupt:
+            # Platform without signal handlers, server stops at once
             print("\nShutting down server...")
-            print("Bye!")
+        finally:
+            # Waits for pending index and log writes
+            Executor.shutdown()
+        print("Bye!")
 
     @staticmethod
     async def run():
         """
-        Creates server instance, SSL context and starts listening for connections on selected port and IP address. Handles establishing new secure connections with clients.
+        Creates server instance, SSL context (unless already created by :py:meth:`start() <server.server.Server.start>`) and starts listening for connections on selected port and IP address. Handles establishing new secure connections with clients.
+        Returns after :py:meth:`stop() <server.server.Server.stop>` when all connections are closed and queued log events are written.
 
         """
-        ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
-        ssl_context.check_hostname = False
-        ssl_context.load_cert_chain("server.cert", "server.key")
+        ssl_context = Server.SSL_CONTEXT or Server.create_ssl_context()
+        # Forked before any thread is started, processes have server keys loaded
+        Executor.start_processes(Rsa.keys)
 
+        # Every worker process binds its own socket to the same port, kernel spreads connections among them
         server = await asyncio.start_server(
-            Server.handle_connection, Server.IP, Server.PORT, ssl=ssl_context
+            Server.accept,
+            Server.IP,
+            Server.PORT,
+            ssl=ssl_context,
+            ssl_handshake_timeout=Admission.HANDSHAKE_TIMEOUT,
+            reuse_port=Server.WORKERS > 1,
         )
 
         addrs = ", ".join(str(sock.getsockname()) for sock in server.sockets)
         print(f"Serving on {addrs}")
 
+        # Write log, delete expired upload sessions, report throughput and dump metrics periodically
+        tasks = [
+            asyncio.create_task(Log.write_queued()),
+            asyncio.create_task(Server.expire_uploads()),
+            asyncio.create_task(Bandwidth.report_periodically()),
+            asyncio.create_task(Metrics.dump_periodically()),
+        ]
+
+        Server._stopping = asyncio.Event()
+        Server._connections = set()
+        Server._idle = set()
+        # Workers are stopped by supervisor, Ctrl+C in terminal reaches every process of the group
+        signals = [signal.SIGTERM] + ([signal.SIGINT] if Server.WORKERS == 1 else [])
+        loop = asyncio.get_running_loop()
+        try:
+            for signum in signals:
+                loop.add_signal_handler(signum, Server.stop)
+        except NotImplementedError:
+            # Windows, Ctrl+C raises KeyboardInterrupt
+            pass
+
         async with server:
-            await server.serve_forever()
+            await Server._stopping.wait()
+            # Stop accepting new connections and finish accepted ones
+            server.close()
+            await Server.drain()
+
+        await Log.flush()
+        for task in tasks:
+            task.cancel()
+        Metrics.dump()
+
+    @staticmethod
+    def stop():
+        """
+        Starts graceful shutdown, called on *SIGTERM* or *SIGINT*. Server stops accepting connections,
+        running transfers are finished (see :py:meth:`drain() <server.server.Server.drain>`) and
+        :py:meth:`run() <server.server.Server.run>` returns. Second signal interrupts running transfers at once.
+
+        """
+
+        if Server._stopping.is_set():
+            print("INFO: Interrupting running transfers")
+            for task in Server._connections:
+                task.cancel()
+            return
+
+        if Server.WORKERS == 1:
+            print("\nShutting down server...")
+        Server._stopping.set()
+
+    @staticmethod
+    async def drain():
+        """
+        Closes connections waiting for request and waits for the others to finish their running request.
+        Requests which do not finish in *SHUTDOWN_TIMEOUT* are cancelled, partly uploaded file is deleted
+        (chunked upload can be resumed after restart).
+
+        """
+
+        for task in Server._idle:
+            task.cancel()
+
+        busy = Server._connections - Server._idle
+        if busy:
+            print(f"INFO: Waiting for {len(busy)} running request(s) to finish")
+        if Server._connections:
+            _, pending = await asyncio.wait(
+                Server._connections, timeout=Server.SHUTDOWN_TIMEOUT
+            )
+            if pending:
+                print(
+                    f"WARNING, Server: {len(pending)} request(s) did not finish in time, interrupting them"
+                )
+                for task in pending:
+                    task.cancel()
+                await asyncio.wait(pending)
+
+    @staticmethod
+    async def wait_request(awaitable):
+        """
+        Awaits next request of connection. Connection is idle meanwhile and it is closed at once on shutdown.
+
+        :param awaitable: Read of request
+        :type awaitable: Awaitable
+        :returns: Result of *awaitable*
+
+        """
+
+        task = asyncio.current_task()
+        if Server._stopping.is_set():
+            # Request would not be served
+            task.cancel()
+        Server._idle.add(task)
+        try:
+            return await awaitable
+        finally:
+            Server._idle.discard(task)
+
+    @staticmethod
+    def create_ssl_context() -> ssl.SSLContext:
+        """
+        Creates SSL context of the server. Context issues *TLS_TICKETS* session tickets after every full handshake,
+        clients present them on following connections and skip certificate exchange and key agreement.
+        Tickets are encrypted with keys generated together with the context, so tickets are accepted by every
+        process which inherited this context.
+
+        :rtype: ssl.SSLContext
+
+        """
+
+        ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ssl_context.check_hostname = False
+        ssl_context.load_cert_chain("server.cert", "server.key")
+        ssl_context.options &= ~ssl.OP_NO_TICKET
+        ssl_context.num_tickets = Server.TLS_TICKETS
+        return ssl_context
+
+    @staticmethod
+    def supervise():
+        """
+        Forks *WORKERS* worker processes, each running its own event loop and accepting connections on *PORT*
+        (sockets are bound with *SO_REUSEPORT*). Worker which dies is replaced by new one, workers which keep dying
+        right after start are restarted no more often than once per *RESTART_DELAY*.
+        On *SIGTERM* or *Ctrl+C* all workers are stopped gracefully and supervisor waits for them,
+        second signal interrupts their running transfers.
+
+        """
+
+        workers = {}  # PID: start time
+        # Stop on SIGTERM the same way as on Ctrl+C
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+        try:
+            while True:
+                while len(workers) < Server.WORKERS:
+                    # Do not let worker inherit unwritten output
+                    sys.stdout.flush()
+                    pid = os.fork()
+                    if pid == 0:
+                        Server.work()
+                    workers[pid] = time.monotonic()
+                    print(f"INFO: Worker {pid} started")
+
+                pid, status = os.wait()
+                if pid not in workers:
+                    continue
+                uptime = time.monotonic() - workers.pop(pid)
+                print(
+                    f"WARNING, Server: Worker {pid} died with status {status}, starting new one"
+                )
+                Metrics.remove(pid)
+                if uptime < Server.RESTART_DELAY:
+                    time.sleep(Server.RESTART_DELAY)
+        except KeyboardInterrupt:
+            print("\nShutting down server...")
+            Server.signal_workers(workers)
+            while workers:
+                try:
+                    pid, _ = os.wait()
+                    workers.pop(pid, None)
+                except KeyboardInterrupt:
+                    # Second signal, workers interrupt running transfers
+                    Server.signal_workers(workers)
+                except ChildProcessError:
+                    break
+            print("Bye!")
+
+    @staticmethod
+    def signal_workers(workers: dict):
+        """
+        Sends *SIGTERM* to worker processes.
+
+        :param workers: PIDs of worker processes
+        :type workers: dict
+
+        """
+
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    @staticmethod
+    def work():
+        """
+        Runs server in forked worker process, never returns.
+
+        """
+
+        status = 0
+        # Ctrl+C reaches supervisor as well, it stops workers by SIGTERM
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        try:
+            asyncio.run(Server.run())
+        except KeyboardInterrupt:
+            pass
+        except Exception:
+            traceback.print_exc()
+            status = 1
+        finally:
+            Executor.shutdown()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+    @staticmethod
+    async def expire_uploads():
+        """
+        Deletes expired upload sessions every *Upload_session.CLEANUP_INTERVAL* seconds.
+
+        """
+
+        while True:
+            await asyncio.sleep(Upload_session.CLEANUP_INTERVAL)
+            await Executor.meta(Upload_session.expire)
+
+    @staticmethod
+    async def accept(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Admits new connection (see :py:class:`Admission <server.limits.Admission>`) and hands it over to
+        :py:meth:`handle_connection() <server.server.Server.handle_connection>`. Connection over limits
+        is refused with *BUSY* line, connection which misses any read deadline (see :py:class:`Timeouts <server.limits.Timeouts>`)
+        is closed.
+
+        :param reader: reader instance
+        :type reader: asyncio.StreamReader
+        :param writer: writer instance
+        :type writer: asyncio.StreamWriter
+
+        """
+
+        ip = writer.get_extra_info("peername")[0]
+        reason = Admission.connect(ip)
+        if reason is not None:
+            await Server.reject(reader, writer, reason)
+            return
+
+        task = asyncio.current_task()
+        Server._connections.add(task)
+        try:
+            await Server.handle_connection(reader, writer)
+        except ConnectionError:
+            # Client dropped connection in the middle of request, e.g. throttled download
+            pass
+        except asyncio.TimeoutError:
+            # Client sends nothing or too slowly
+            if Server.VERBOSITY > 0:
+                addr = writer.get_extra_info("peername")
+                print(f"Connection from {addr} timed out")
+        except asyncio.CancelledError:
+            # Interrupted by shutdown, see drain()
+            pass
+        finally:
+            # Connection may be closed by shutdown as well
+            writer.close()
+            Server._connections.discard(task)
+            Admission.disconnect(ip)
+
+    @staticmethod
+    async def reject(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter, reason: str
+    ):
+        """
+        Refuses connection without serving any request. First line sent by client is answered by
+        'BUSY;REASON;RETRY_AFTER' (milliseconds) and connection is closed.
+        Client which does not send its first line in *Admission.RETRY_AFTER* is disconnected.
+
+        :param reader: reader instance
+        :type reader: asyncio.StreamReader
+        :param writer: writer instance
+        :type writer: asyncio.StreamWriter
+        :param reason: Reason of refusal
+        :type reason: str
+
+        """
+
+        if Server.VERBOSITY > 0:
+            addr = writer.get_extra_info("peername")
+            print(f"Connection from {addr} refused: {reason}")
+
+        try:
+            # Answer after client's request, unread request could reset the connection
+            await asyncio.wait_for(
+                reader.readuntil(Server.EOM.encode()), Admission.RETRY_AFTER
+            )
+            Server.busy(writer, None, reason)
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        writer.close()
+
+    @staticmethod
+    def busy(
+        writer: asyncio.StreamWriter,
+        request_id: int,
+        reason: str,
+        retry_after: float = None,
+    ) -> None:
+        """
+        Answers request refused by admission control or rate limiter, with *BUSY* frame (reason, retry after in milliseconds).
+        Request sent as text is answered with line 'BUSY;REASON;RETRY_AFTER'.
+
+        :param writer: writer instance
+        :type writer: asyncio.StreamWriter
+        :param request_id: ID of request sent as frame, None if request was sent as text
+        :type request_id: int
+        :param reason: Reason of refusal
+        :type reason: str
+        :param retry_after: How long should client wait (seconds), *Admission.RETRY_AFTER* if not given
+        :type retry_after: float
+
+        """
+
+        if retry_after is None:
+            milliseconds = Admission.retry_after()
+        else:
+            milliseconds = int(retry_after * 1000)
+
+        if request_id is None:
+            writer.write(f"BUSY;{reason};{milliseconds}{Server.EOM}".encode())
+        else:
+            Frame.write(
+                writer,
+                Frame.Op.BUSY,
+                request_id,
+                reason.encode(),
+                Frame.U64.pack(milliseconds),
+            )
+
+    @staticmethod
+    async def transfer(
+        user_name: str,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        request_id: int,
+        handler,
+        *args,
+        discard: int = 0,
+    ):
+        """
+        Runs upload or download handler, if user has not reached his limit of transfers in progress.
+        Otherwise the request is answered with *BUSY* and *discard* bytes of data following the request are skipped.
+        Refused text upload sends data until connection is closed, so none of them are read.
+
+        :param user_name: Name of user making request
+        :type user_name: str
+        :param reader: reader instance
+        :type reader: asyncio.StreamReader
+        :param writer: writer instance
+        :type writer: asyncio.StreamWriter
+        :param request_id: ID of request sent as frame, None if request was sent as text
+        :type request_id: int
+        :param handler: Coroutine function serving the request
+        :type handler: coroutine function
+        :param args: Arguments of the handler
+        :param discard: Length of data client sends right after the request
+        :type discard: int
+
+        """
+
+        if not Admission.start_transfer(user_name):
+            await Server.discard(reader, discard)
+            Server.busy(writer, request_id, "TooManyTransfers")
+            return
+
+        try:
+            await handler(*args)
+        finally:
+            Admission.end_transfer(user_name)
+
+    @staticmethod
+    async def discard(reader: asyncio.StreamReader, length: int):
+        """
+        Reads and drops data client sent with refused request, to stay in sync with client.
+
+        :param reader: reader instance
+        :type reader: asyncio.StreamReader
+        :param length: Length of data
+        :type length: int
+
+        """
+
+        deadline = Deadline()
+        while length > 0:
+            bytes_read = await deadline.wait(
+                reader.read(min(length, Server.RECV_BUFFER))
+            )
+            if not bytes_read:
+                return
+            length -= len(bytes_read)
 
     @staticmethod
     async def handle_connection(
@@ -86,8 +534,9 @@ class Server:
         | *DOWNLOAD:* client requests to download a file
         | *REMOVE:* client requests to delete a file
         | *LIST_DIR:* client requests to list all files he owns
+        | *HELLO:* client supports binary frames, see :py:meth:`serve_frames() <server.server.Server.serve_frames>`
 
-        Authenticated clients own *Session ID* in form of symetric user unique AES key. This key is used for *request* encryption. 
+        Authenticated clients own *Session ID* in form of symetric user unique AES key. This key is used for *request* encryption.
         If client requests any action from server, he encrypts this request using AES key and sends this cyphertext *c* and his username.
 
         .. math::
@@ -105,71 +554,396 @@ class Server:
 
         """
 
-        # Recieve encrypted request from client
-        data = await reader.readuntil(Server.EOM.encode())
+        # Recieve first line of request from client
+        data = await Server.wait_request(
+            Timeouts.header(reader.readuntil(Server.EOM.encode()))
+        )
         request = data.decode()[:-1]  # Decode and strip EOM symbol
+        addr = writer.get_extra_info("peername")
 
         if Server.VERBOSITY > 0:
-            addr = writer.get_extra_info("peername")
             print(f"Incoming request: '{request}', from: {addr}")
 
+        # Requests of anonymous clients are limited by IP address
+        retry_after = 0.0
+        if request in ("GETKEY", "LOGIN"):
+            retry_after = await Rate_limiter.admit(request, None, addr)
+
+        if retry_after:
+            # Over rate limit, client should repeat request later
+            Server.busy(writer, None, "TooManyRequests", retry_after)
+        elif request == f"{Frame.HELLO};{Frame.VERSION}":
+            # Client supports binary frames, switch protocol
+            writer.write(f"OK;{request}{Server.EOM}".encode())
+            await Server.serve_frames(reader, writer)
+        elif request.startswith(f"{Frame.HELLO};"):
+            # Client requests frame version server does not support
+            writer.write(f"ERROR;UnsupportedVersionError{Server.EOM}".encode())
         # Requests not requireing authentication
-        if "GETKEY" in request:
+        elif request == "GETKEY":
             # Request to get server public key
             await Server.send_pubkey(reader, writer)
-            return
-        elif "LOGIN" in request:
+        elif request == "LOGIN":
             # Start login handshake with client
             await Server.autenticate(reader, writer)
-            return
+        else:
+            user_name, c_len, tag_len, pad_len, nonce_len = request.split(";")
+            c, tag, pad, nonce = [
+                await Timeouts.header(reader.readexactly(int(length)))
+                for length in (c_len, tag_len, pad_len, nonce_len)
+            ]
+
+            m = await Executor.meta(
+                Server.decrypt_request, user_name, c, tag, pad, nonce
+            )
+            if m is not None:
+                command, file_name = m.split(";")
+                retry_after = await Rate_limiter.admit(command, user_name, addr)
+
+            if m is None:
+                # Not Authenticated
+                writer.write(f"ERROR;NotAuthenticatedError{Server.EOM}".encode())
+            elif retry_after:
+                # Over rate limit, client should repeat request later
+                Server.busy(writer, None, "TooManyRequests", retry_after)
+            elif command in ("UPLOAD", "DOWNLOAD"):
+                # Transfers count to user's limit of transfers, the same as with frames
+                await Server.transfer(
+                    user_name,
+                    reader,
+                    writer,
+                    None,
+                    Server.serve_text,
+                    command,
+                    file_name,
+                    user_name,
+                    reader,
+                    writer,
+                )
+            else:
+                await Server.serve_text(command, file_name, user_name, reader, writer)
 
-        user_name, c_len, tag_len, pad_len, nonce_len = request.split(";")
-        c = await reader.read(int(c_len))
-        tag = await reader.read(int(tag_len))
-        pad = await reader.read(int(pad_len))
-        nonce = await reader.read(int(nonce_len))
+        writer.close()
+        await writer.wait_closed()
+
+    @staticmethod
+    async def serve_text(
+        command: str,
+        file_name: str,
+        user_name: str,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ):
+        """
+        Serves authenticated request sent as text, confirms authentication first.
+
+        :param command: Decrypted request type
+        :type command: str
+        :param file_name: Name of file the request applies to
+        :type file_name: str
+        :param user_name: Name of authenticated user
+        :type user_name: str
+        :param reader: reader instance
+        :type reader: asyncio.StreamReader
+        :param writer: writer instance
+        :type writer: asyncio.StreamWriter
+
+        """
+
+        # Authenticated
+        writer.write(f"OK;Authenticated{Server.EOM}".encode())
+
+        if command == "UPLOAD":
+            # Request to upload file, structure: 'UPLOAD FILENAME USERNAME'
+            await Server.recieve_file(file_name, user_name, reader, writer)
+        elif command == "DOWNLOAD":
+            # Request to download file, structure: 'DOWNLOAD FILENAME USERNAME'
+            await Server.serve_file(file_name, user_name, reader, writer)
+        elif command == "REMOVE":
+            # Request to delete file, structure: 'REMOVE FILENAME USERNAME'
+            await Server.remove_file(file_name, user_name, reader, writer)
+        elif command == "LIST_DIR":
+            # Request to list available file for download, structure: 'LIST_DIR'
+            await Server.list_files(user_name, reader, writer)
+        else:
+            writer.write(
+                f"UN-KNOWN request, use [UPLOAD, DOWNLOAD, LIST_DIR]{Server.EOM}".encode()
+            )
+            await writer.drain()
+
+    @staticmethod
+    def decrypt_request(
+        user_name: str, c: bytes, tag: bytes, pad: bytes, nonce: bytes
+    ) -> str:
+        """
+        Decrypts request of the user with his AES key and checks decrypted pad.
+
+        :param user_name: Name of user making request
+        :type user_name: str
+        :param c: Encrypted request
+        :type c: bytes
+        :param tag: Authentication tag of encrypted request
+        :type tag: bytes
+        :param pad: Random pad, must match first 8 bytes of decrypted request
+        :type pad: bytes
+        :param nonce: Nonce used for encryption
+        :type nonce: bytes
+        :returns: Decrypted request, structure: 'COMMAND;FILENAME', None if user can't be authenticated
+        :rtype: str
+
+        """
 
         # Decrypt request with aes_key linked to the user
         if User_db.name_exists(user_name):
             aes_key = User_db.get_record(user_name)[2]
         else:
-            writer.write(f"ERROR;NotAuthenticatedError{Server.EOM}".encode())
-            return
-        aes_instance = AES.new(aes_key, AES.MODE_EAX, nonce)
-        m = aes_instance.decrypt_and_verify(c, tag)
+            return None
+        try:
+            aes_instance = AES.new(aes_key, AES.MODE_EAX, nonce)
+            m = aes_instance.decrypt_and_verify(c, tag)
+        except ValueError:
+            # Encrypted with other key or damaged
+            return None
 
         # Get firt 8 bytes of message = pad
         decryped_pad = m[0:8]
 
         # Decide if pad was successfully decripted
-        if decryped_pad == pad:
-            # Authenticated
-            writer.write(f"OK;Authenticated{Server.EOM}".encode())
-            command, file_name = m[8:].decode().split(";")
-
-            if "UPLOAD" in command:
-                # Request to upload file, structure: 'UPLOAD FILENAME USERNAME'
-                await Server.recieve_file(file_name, user_name, reader, writer)
-            elif "DOWNLOAD" in command:
-                # Request to download file, structure: 'DOWNLOAD FILENAME USERNAME'
-                await Server.serve_file(file_name, user_name, reader, writer)
-            elif "REMOVE" in command:
-                # Request to delete file, structure: 'REMOVE FILENAME USERNAME'
-                await Server.remove_file(file_name, user_name, reader, writer)
-            elif "LIST_DIR" in command:
-                # Request to list available file for download, structure: 'LIST_DIR'
-                await Server.list_files(user_name, reader, writer)
-            else:
-                writer.write(
-                    f"UN-KNOWN request, use [UPLOAD, DOWNLOAD, LIST_DIR]{Server.EOM}".encode()
+        if decryped_pad != pad:
+            return None
+
+        return m[8:].decode()
+
+    @staticmethod
+    async def serve_frames(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serves requests sent as binary frames (see :py:class:`Frame <server.protocol.Frame>`) until client closes the connection.
+        Connection is authenticated once by *AUTH* frame, carrying the same encrypted request as the text protocol,
+        and then serves any number of requests, so client pays for TCP and TLS handshake only once.
+        Every reply carries ID of the request it belongs to. Session waiting for next request longer than
+        *Timeouts.IDLE_TIMEOUT* is closed, on shutdown it is closed once its running request is finished.
+
+        | **Requests and replies:** (fields of payload)
+        | *GETKEY* () → *OK* (key)
+        | *LOGIN* (c) → *OK* (c, tag, nonce, salt), *LOGIN* (c) → *OK* (c, tag, nonce)
+        | *AUTH* (username, c, tag, pad, nonce) → *OK* (info)
+        | *UPLOAD* (filename, size) → *OK* (info) + file → *OK* (info)
+        | *DOWNLOAD* (filename, [offset, [length]]) → *OK* (filename, size, validator) + range of file
+        | *REMOVE* (filename) → *OK* (info)
+        | *LIST_DIR* () → *OK* (info, length) + pickled list
+        | *UPLOAD_OPEN* (filename, size, chunk size, fingerprint) → *OK* (session ID)
+        | *UPLOAD_STATUS* (session ID) → *OK* (info, length) + bitmap of stored chunks
+        | *UPLOAD_CHUNK* (session ID, index, length) + chunk → *OK* (info)
+        | *UPLOAD_COMMIT* (session ID) → *OK* (info)
+        | *STAT* (filename) → *OK* (filename, size, validator)
+        | Any failed request is answered with *ERROR* (error name).
+        | Frame which can't be parsed is answered with *ERROR* (MalformedFrameError) and session is closed.
+        | *UPLOAD*, *DOWNLOAD* and *UPLOAD_CHUNK* over user's limit of transfers are answered with *BUSY* (reason, retry after).
+        | Requests over rate limit (see :py:class:`Rate_limiter <server.limits.Rate_limiter>`) are answered with *BUSY* as well.
+
+        :param reader: reader instance
+        :type reader: asyncio.StreamReader
+        :param writer: writer instance
+        :type writer: asyncio.StreamWriter
+
+        """
+
+        user_name = None
+
+        while True:
+            try:
+                op, request_id, fields = await Server.wait_request(
+                    Timeouts.idle(Frame.read(reader))
+                )
+            except asyncio.IncompleteReadError:
+                # Client closed the connection
+                break
+            except ValueError:
+                # Header can't be trusted, so neither can be the rest of the stream
+                Server.malformed(writer, 0)
+                break
+
+            request = op.name if isinstance(op, Frame.Op) else str(op)
+            if Server.VERBOSITY > 0:
+                print(f"Incoming frame: '{request}', from: {user_name}")
+
+            try:
+                retry_after = await Rate_limiter.admit(
+                    request, user_name, writer.get_extra_info("peername")
                 )
-                await writer.drain()
-        else:
-            # Not Authenticated
-            writer.write(f"ERROR;NotAuthenticatedError{Server.EOM}".encode())
 
-        writer.close()
-        await writer.wait_closed()
+                if retry_after:
+                    # Over rate limit, client should repeat request later
+                    if op == Frame.Op.UPLOAD_CHUNK:
+                        # Chunk follows the request, skip it to stay in sync with client
+                        await Server.discard(reader, Frame.U64.unpack(fields[2])[0])
+                    Server.busy(writer, request_id, "TooManyRequests", retry_after)
+                # Requests not requireing authentication
+                elif op == Frame.Op.GETKEY:
+                    await Server.send_pubkey(reader, writer, request_id)
+                elif op == Frame.Op.LOGIN:
+                    await Server.autenticate(reader, writer, request_id, fields[0])
+                elif op == Frame.Op.AUTH:
+                    if len(fields) != 5:
+                        # Expected username, c, tag, pad and nonce
+                        Server.malformed(writer, request_id)
+                        break
+                    name = fields[0].decode()
+                    m = await Executor.meta(Server.decrypt_request, name, *fields[1:])
+                    if m is None:
+                        user_name = None
+                        Frame.write(
+                            writer, Frame.Op.ERROR, request_id, b"NotAuthenticatedError"
+                        )
+                    else:
+                        user_name = name
+                        Frame.write(writer, Frame.Op.OK, request_id, b"Authenticated")
+                # Requests for authenticated clients only
+                elif user_name is None:
+                    Frame.write(
+                        writer, Frame.Op.ERROR, request_id, b"NotAuthenticatedError"
+                    )
+                elif op == Frame.Op.UPLOAD:
+                    (file_size,) = Frame.U64.unpack(fields[1])
+                    await Server.transfer(
+                        user_name,
+                        reader,
+                        writer,
+                        request_id,
+                        Server.recieve_file,
+                        fields[0].decode(),
+                        user_name,
+                        reader,
+                        writer,
+                        request_id,
+                        file_size,
+                    )
+                elif op == Frame.Op.DOWNLOAD:
+                    # Optional range of file, offset and length
+                    bounds = [Frame.U64.unpack(field)[0] for field in fields[1:3]]
+                    offset = bounds[0] if len(bounds) > 0 else 0
+                    length = bounds[1] if len(bounds) > 1 else None
+                    await Server.transfer(
+                        user_name,
+                        reader,
+                        writer,
+                        request_id,
+                        Server.serve_file,
+                        fields[0].decode(),
+                        user_name,
+                        reader,
+                        writer,
+                        request_id,
+                        offset,
+                        length,
+                    )
+                elif op == Frame.Op.REMOVE:
+                    await Server.remove_file(
+                        fields[0].decode(), user_name, reader, writer, request_id
+                    )
+                elif op == Frame.Op.LIST_DIR:
+                    await Server.list_files(user_name, reader, writer, request_id)
+                elif op == Frame.Op.STAT:
+                    await Server.stat_file(
+                        fields[0].decode(), user_name, writer, request_id
+                    )
+                elif op == Frame.Op.UPLOAD_OPEN:
+                    size, chunk_size, fingerprint = [
+                        Frame.U64.unpack(field)[0] for field in fields[1:4]
+                    ]
+                    session_id, error = await Executor.meta(
+                        Upload_session.open,
+                        user_name,
+                        fields[0].decode(),
+                        size,
+                        chunk_size,
+                        fingerprint,
+                    )
+                    if session_id is None:
+                        Frame.write(writer, Frame.Op.ERROR, request_id, error.encode())
+                    else:
+                        Frame.write(
+                            writer, Frame.Op.OK, request_id, session_id.encode()
+                        )
+                elif op == Frame.Op.UPLOAD_STATUS:
+                    session_id = fields[0].decode()
+                    meta = None
+                    if Upload_session.valid_id(session_id):
+                        meta = await Executor.meta(
+                            Upload_session.get, session_id, user_name
+                        )
+                    if meta is None:
+                        Frame.write(
+                            writer,
+                            Frame.Op.ERROR,
+                            request_id,
+                            b"UploadSessionNotFoundError",
+                        )
+                    else:
+                        bitmap = await Executor.meta(
+                            Upload_session.chunks, session_id, meta
+                        )
+                        Frame.write(
+                            writer,
+                            Frame.Op.OK,
+                            request_id,
+                            b"Chunks",
+                            Frame.U64.pack(len(bitmap)),
+                        )
+                        writer.write(bitmap)
+                elif op == Frame.Op.UPLOAD_CHUNK:
+                    index, length = [
+                        Frame.U64.unpack(field)[0] for field in fields[1:3]
+                    ]
+                    await Server.transfer(
+                        user_name,
+                        reader,
+                        writer,
+                        request_id,
+                        Server.recieve_chunk,
+                        fields[0].decode(),
+                        index,
+                        length,
+                        user_name,
+                        reader,
+                        writer,
+                        request_id,
+                        discard=length,
+                    )
+                elif op == Frame.Op.UPLOAD_COMMIT:
+                    await Server.commit_upload(
+                        fields[0].decode(), user_name, writer, request_id
+                    )
+                else:
+                    Frame.write(
+                        writer, Frame.Op.ERROR, request_id, b"UnknownRequestError"
+                    )
+            except (ValueError, IndexError, struct.error, UnicodeDecodeError):
+                # Fields of frame are missing or can't be decoded
+                Server.malformed(writer, request_id)
+                break
+            try:
+                await Timeouts.idle(writer.drain())
+            except ConnectionError:
+                # Client closed the connection after reading the reply
+                break
+
+    @staticmethod
+    def malformed(writer: asyncio.StreamWriter, request_id: int) -> None:
+        """
+        Answers frame which can't be parsed with *ERROR* (MalformedFrameError), session is closed afterwards.
+
+        :param writer: writer instance
+        :type writer: asyncio.StreamWriter
+        :param request_id: ID of request, 0 if frame header can't be parsed
+        :type request_id: int
+
+        """
+
+        if Server.VERBOSITY > 0:
+            addr = writer.get_extra_info("peername")
+            print(f"Malformed frame from {addr}")
+        Frame.write(writer, Frame.Op.ERROR, request_id, b"MalformedFrameError")
 
     @staticmethod
     def init() -> None:
@@ -177,19 +951,28 @@ class Server:
         Runs initialization checks before starting Kryzbu server instace.
 
         | 1. Checks if required folder structure for server exists, if not creates new one.
-        | 2. Initializes *hmac.db* database.
+        | 2. Initializes *hmac.db*, *logs.db* and *merkle.db* databases.
         | 3. Checks integrity of filesystem for every user, makes sure all files are either indexed or deleted.
         | 4. Initializes *users.db* database.
         | 5. Initializes RSA key-pair
+        | 6. Deletes unfinished uploads left by crashed server and expired upload sessions
+        | 7. Deletes metrics of previous run
         """
 
-        PATHS = ("server/_data/files/", "server/_data/logs/", "server/_data/keys/")
+        PATHS = (
+            "server/_data/files/",
+            "server/_data/logs/",
+            "server/_data/keys/",
+            "server/_data/uploads/sessions/",
+        )
         for path in PATHS:
             # Any missing parents of this path are created as needed, if folder already exists nothing happens
             Path(path).mkdir(parents=True, exist_ok=True)
 
         # Initiate user database
         Hmac_index.init()
+        Log_index.init()
+        Merkle_index.init()
 
         # Initiate file index
         for user in User_db.return_all():
@@ -202,6 +985,15 @@ class Server:
         # Initialize RSA key-pair
         Rsa.init()
 
+        # Delete unfinished uploads, they can't be completed anymore (upload sessions can)
+        for file in os.listdir(Server.UPLOAD_FOLDER):
+            if os.path.isfile(Server.UPLOAD_FOLDER / file):
+                os.remove(Server.UPLOAD_FOLDER / file)
+                print(f"WARNING, Server: Unfinished upload '{file}' was deleted")
+        Upload_session.expire()
+
+        Metrics.clear()
+
         print("[*] Kryzbu server started successfully...")
 
     @staticmethod
@@ -210,9 +1002,14 @@ class Server:
         user_name: str,
         reader: asyncio.StreamReader,
         writer: asyncio.StreamWriter,
+        request_id: int = None,
+        file_size: int = None,
     ):
         """
         Function receiving files from client, storing them on server filesystem and indexing.
+        File is received in chunks of at most *RECV_BUFFER* bytes into temporary file in *UPLOAD_FOLDER*,
+        which is moved to user folder only when all announced bytes arrive. Interrupted upload never
+        replaces or creates file in user folder. Received bytes are accounted to user's :py:class:`Bandwidth <server.bandwidth.Bandwidth>`.
 
         :param file_name: Name of uploaded file
         :type file_name: str
@@ -222,20 +1019,168 @@ class Server:
         :type reader: asyncio.StreamReader
         :param writer: writer instance
         :type writer: asyncio.StreamWriter
+        :param request_id: ID of request sent as frame, None if request was sent as text
+        :type request_id: int
+        :param file_size: Size of uploaded file, required for frames, otherwise file is read until connection is closed
+        :type file_size: int
 
         """
 
         file_path = Server.SERVER_FOLDER / user_name / file_name
+        temp_path = Server.UPLOAD_FOLDER / f"{uuid.uuid4().hex}.part"
 
-        with open(file_path, "wb") as f:
-            while True:
-                bytes_read = await reader.read()
+        if request_id is not None:
+            # Inform client that server is ready to receive announced bytes
+            Frame.write(writer, Frame.Op.OK, request_id, b"Ready")
+            await writer.drain()
+
+        received = 0
+        deadline = Deadline()
+        try:
+            f = await Executor.disk(open, temp_path, "wb")
+            try:
+                while file_size is None or received < file_size:
+                    chunk = Server.RECV_BUFFER
+                    if file_size is not None:
+                        chunk = min(chunk, file_size - received)
+                    bytes_read = await deadline.wait(reader.read(chunk))
+                    if not bytes_read:
+                        # Connection closed, text protocol ends upload this way
+                        break
+                    await Executor.disk(f.write, bytes_read)
+                    received += len(bytes_read)
+                    await Bandwidth.consume(user_name, len(bytes_read))
+            finally:
+                await Executor.disk(f.close)
+
+            if file_size is None or received == file_size:
+                await Executor.disk(os.replace, temp_path, file_path)
+        finally:
+            if await Executor.disk(os.path.exists, temp_path):
+                await Executor.disk(os.remove, temp_path)
+
+        if file_size is not None and received != file_size:
+            # Upload interrupted, file is not stored
+            await Log.enqueue(
+                Log.Event.UPLOAD,
+                f"IncompleteUploadError {received}/{file_size} B",
+                [file_name, user_name],
+            )
+            Frame.write(writer, Frame.Op.ERROR, request_id, b"IncompleteUploadError")
+            return
+
+        if request_id is not None:
+            Frame.write(writer, Frame.Op.OK, request_id, b"Uploaded")
+
+        await Log.enqueue(Log.Event.UPLOAD, 0, [file_name, user_name])
+        await Executor.meta(File_index.add, file_name, user_name)
+
+    @staticmethod
+    async def recieve_chunk(
+        session_id: str,
+        index: int,
+        length: int,
+        user_name: str,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        request_id: int,
+    ):
+        """
+        Receives one chunk of upload session (see :py:class:`Upload_session <server.uploads.Upload_session>`)
+        and writes it to its place in session data file. Chunk is marked as stored only when all its bytes arrive.
+
+        :param session_id: ID of upload session
+        :type session_id: str
+        :param index: Chunk number
+        :type index: int
+        :param length: Length of chunk following the request
+        :type length: int
+        :param user_name: Name of user making request
+        :type user_name: str
+        :param reader: reader instance
+        :type reader: asyncio.StreamReader
+        :param writer: writer instance
+        :type writer: asyncio.StreamWriter
+        :param request_id: ID of request
+        :type request_id: int
+
+        """
+
+        meta = None
+        if Upload_session.valid_id(session_id):
+            meta = await Executor.meta(Upload_session.get, session_id, user_name)
+        chunk = None if meta is None else Upload_session.chunk_range(meta, index)
+
+        if chunk is None or chunk[1] != length:
+            # Unknown session or chunk, read the data anyway to stay in sync with client
+            await Server.discard(reader, length)
+            error = (
+                b"UploadSessionNotFoundError" if meta is None else b"InvalidChunkError"
+            )
+            Frame.write(writer, Frame.Op.ERROR, request_id, error)
+            return
+
+        deadline = Deadline()
+        f = await Executor.disk(open, Upload_session.data_path(session_id), "r+b")
+        try:
+            await Executor.disk(f.seek, chunk[0])
+            while length > 0:
+                bytes_read = await deadline.wait(
+                    reader.read(min(length, Server.RECV_BUFFER))
+                )
                 if not bytes_read:
-                    break
-                f.write(bytes_read)
+                    # Connection closed, chunk stays missing
+                    return
+                await Executor.disk(f.write, bytes_read)
+                length -= len(bytes_read)
+                await Bandwidth.consume(user_name, len(bytes_read))
+        finally:
+            await Executor.disk(f.close)
 
-        Log.event(Log.Event.UPLOAD, 0, [file_name, user_name])
-        File_index.add(file_name, user_name)
+        await Executor.meta(Upload_session.mark, session_id, index)
+        Frame.write(writer, Frame.Op.OK, request_id, b"Stored")
+
+    @staticmethod
+    async def commit_upload(
+        session_id: str,
+        user_name: str,
+        writer: asyncio.StreamWriter,
+        request_id: int,
+    ):
+        """
+        Finishes upload session, stores uploaded file in user folder and indexes it.
+
+        :param session_id: ID of upload session
+        :type session_id: str
+        :param user_name: Name of user making request
+        :type user_name: str
+        :param writer: writer instance
+        :type writer: asyncio.StreamWriter
+        :param request_id: ID of request
+        :type request_id: int
+
+        """
+
+        meta = None
+        if Upload_session.valid_id(session_id):
+            meta = await Executor.meta(Upload_session.get, session_id, user_name)
+
+        if meta is None:
+            Frame.write(
+                writer, Frame.Op.ERROR, request_id, b"UploadSessionNotFoundError"
+            )
+        elif not await Executor.disk(
+            Upload_session.commit,
+            session_id,
+            meta,
+            Server.SERVER_FOLDER / user_name / meta["file_name"],
+        ):
+            # Client must send missing chunks first
+            Frame.write(writer, Frame.Op.ERROR, request_id, b"IncompleteUploadError")
+        else:
+            Frame.write(writer, Frame.Op.OK, request_id, b"Uploaded")
+            await Log.enqueue(Log.Event.UPLOAD, 0, [meta["file_name"], user_name])
+            await Executor.meta(File_index.add, meta["file_name"], user_name)
 
     @staticmethod
     async def serve_file(
@@ -243,9 +1188,16 @@ class Server:
         user_name: str,
         reader: asyncio.StreamReader,
         writer: asyncio.StreamWriter,
+        request_id: int = None,
+        offset: int = 0,
+        length: int = None,
     ):
         """
-        Function for sending files to client.
+        Function for sending files to client. Client can request only range of file (frames only),
+        e.g. to resume interrupted download. Every request reads the file with its own file descriptor
+        at explicit offset, so client can download several ranges of the same file in parallel.
+        Reply carries validator of the file (see :py:meth:`validator() <server.server.Server.validator>`),
+        so client joins only ranges of the same version of file.
 
         :param file_name: Name of requested file
         :type file_name: str
@@ -255,31 +1207,179 @@ class Server:
         :type reader: asyncio.StreamReader
         :param writer: writer instance
         :type writer: asyncio.StreamWriter
-        
+        :param request_id: ID of request sent as frame, None if request was sent as text
+        :type request_id: int
+        :param offset: Position of first requested byte
+        :type offset: int
+        :param length: Number of requested bytes, None for rest of the file
+        :type length: int
+
         """
 
         file_path = Server.SERVER_FOLDER / user_name / file_name
 
-        if os.path.exists(file_path):
+        if await Executor.disk(os.path.exists, file_path):
+            file_stat = await Executor.disk(os.stat, file_path)
+            file_size = file_stat.st_size
+            if offset > file_size:
+                # Requested range starts behind end of file
+                Frame.write(writer, Frame.Op.ERROR, request_id, b"InvalidRangeError")
+                return
+
+            count = file_size - offset
+            if length is not None:
+                count = min(count, length)
+
             # Send file info
-            file_size = os.path.getsize(file_path)
-            writer.write(f"{file_name};{file_size}{Server.EOM}".encode())
+            if request_id is None:
+                writer.write(f"{file_name};{file_size}{Server.EOM}".encode())
+            else:
+                Frame.write(
+                    writer,
+                    Frame.Op.OK,
+                    request_id,
+                    file_name.encode(),
+                    Frame.U64.pack(count),
+                    Server.validator(file_stat),
+                )
             await writer.drain()
 
             # Send file
-            with open(file_path, "rb") as f:
-                while True:
-                    bytes_read = f.read(1024)
-                    if not bytes_read:
-                        break
-                    writer.write(bytes_read)
-                    await writer.drain()
+            await Server.send_file(file_path, user_name, writer, offset, count)
 
-            Log.event(Log.Event.DOWNLOAD, 0, [file_name, user_name])
-            File_index.download(file_name)
+            if offset + count == file_size:
+                # Count download only once, when its last byte is sent
+                await Log.enqueue(Log.Event.DOWNLOAD, 0, [file_name, user_name])
+                await Executor.meta(File_index.download, file_name)
         else:
             # Requested file does NOT exist
-            writer.write(f"ERROR;FileNotFoundError{Server.EOM}".encode())
+            if request_id is None:
+                writer.write(f"ERROR;FileNotFoundError{Server.EOM}".encode())
+            else:
+                Frame.write(writer, Frame.Op.ERROR, request_id, b"FileNotFoundError")
+
+    @staticmethod
+    async def stat_file(
+        file_name: str, user_name: str, writer: asyncio.StreamWriter, request_id: int
+    ):
+        """
+        Sends size and validator of file, so client can split its download to ranges requested in parallel
+        and check that it resumes download of the same version of file.
+
+        :param file_name: Name of requested file
+        :type file_name: str
+        :param user_name: Name of user making request
+        :type user_name: str
+        :param writer: writer instance
+        :type writer: asyncio.StreamWriter
+        :param request_id: ID of request
+        :type request_id: int
+
+        """
+
+        file_path = Server.SERVER_FOLDER / user_name / file_name
+
+        if await Executor.disk(os.path.exists, file_path):
+            file_stat = await Executor.disk(os.stat, file_path)
+            Frame.write(
+                writer,
+                Frame.Op.OK,
+                request_id,
+                file_name.encode(),
+                Frame.U64.pack(file_stat.st_size),
+                Server.validator(file_stat),
+            )
+        else:
+            Frame.write(writer, Frame.Op.ERROR, request_id, b"FileNotFoundError")
+
+    @staticmethod
+    def validator(file_stat: os.stat_result) -> bytes:
+        """
+        Returns validator of file version made of its size and modification time. Replaced file gets
+        new modification time, so client can tell it from the file it started to download.
+
+        :param file_stat: Status of file
+        :type file_stat: os.stat_result
+        :returns: Validator, e.g. *2dc6c0-17f5a0c3b2e1d400*
+        :rtype: bytes
+
+        """
+
+        return f"{file_stat.st_size:x}-{file_stat.st_mtime_ns:x}".encode()
+
+    @staticmethod
+    async def send_file(
+        file_path: Path,
+        user_name: str,
+        writer: asyncio.StreamWriter,
+        offset: int,
+        count: int,
+    ):
+        """
+        Sends *count* bytes of file starting at *offset*. Zero-copy `sendfile <https://docs.python.org/3/library/asyncio-eventloop.html#asyncio.loop.sendfile>`_
+        is used when transport allows it (plain TCP). TLS transport has to encrypt data in user space, so the file
+        is sent in buffers instead. Buffer starts at *SEND_BUFFER[0]* and doubles while client drains it faster
+        than *DRAIN_TARGET*, up to *SEND_BUFFER[1]*, slow clients get it halved again.
+        Sent bytes are accounted to user's :py:class:`Bandwidth <server.bandwidth.Bandwidth>`, with bandwidth
+        caps set the file is sent in slices of at most *Bandwidth.QUANTUM* bytes. Client which does not read
+        the file fast enough misses its :py:class:`Deadline <server.limits.Deadline>`.
+
+        :param file_path: Path to file
+        :type file_path: Path
+        :param user_name: Name of user making request
+        :type user_name: str
+        :param writer: writer instance
+        :type writer: asyncio.StreamWriter
+        :param offset: Position of first byte to send
+        :type offset: int
+        :param count: Number of bytes to send
+        :type count: int
+
+        """
+
+        loop = asyncio.get_running_loop()
+        deadline = Deadline()
+
+        f = await Executor.disk(open, file_path, "rb")
+        try:
+            if writer.get_extra_info("sslcontext") is None:
+                try:
+                    while count > 0:
+                        size = Bandwidth.slice(count)
+                        await deadline.wait(
+                            loop.sendfile(
+                                writer.transport, f, offset, size, fallback=False
+                            ),
+                            size,
+                        )
+                        offset += size
+                        count -= size
+                        await Bandwidth.consume(user_name, size)
+                    return
+                except (asyncio.SendfileNotAvailableError, NotImplementedError):
+                    # Platform or event loop without sendfile, send file in buffers
+                    pass
+
+            await Executor.disk(f.seek, offset)
+            buffer_size = Server.SEND_BUFFER[0]
+            while count > 0:
+                bytes_read = await Executor.disk(
+                    f.read, Bandwidth.slice(min(buffer_size, count))
+                )
+                if not bytes_read:
+                    break
+                writer.write(bytes_read)
+                count -= len(bytes_read)
+                await Bandwidth.consume(user_name, len(bytes_read))
+
+                start = loop.time()
+                await deadline.wait(writer.drain(), len(bytes_read))
+                if loop.time() - start < Server.DRAIN_TARGET:
+                    buffer_size = min(buffer_size * 2, Server.SEND_BUFFER[1])
+                else:
+                    buffer_size = max(buffer_size // 2, Server.SEND_BUFFER[0])
+        finally:
+            await Executor.disk(f.close)
 
     @staticmethod
     async def remove_file(
@@ -287,6 +1387,7 @@ class Server:
         user_name: str,
         reader: asyncio.StreamReader,
         writer: asyncio.StreamWriter,
+        request_id: int = None,
     ):
         """
         Function for removing files from server filesystem.
@@ -299,25 +1400,36 @@ class Server:
         :type reader: asyncio.StreamReader
         :param writer: writer instance
         :type writer: asyncio.StreamWriter
-        
+        :param request_id: ID of request sent as frame, None if request was sent as text
+        :type request_id: int
+
         """
 
         file_path = Server.SERVER_FOLDER / user_name / file_name
 
-        if os.path.exists(file_path):
+        if await Executor.disk(os.path.exists, file_path):
             # Delete file
-            os.remove(file_path)
-            writer.write(f"OK;FileDeleted;{file_name}{Server.EOM}".encode())
+            await Executor.disk(os.remove, file_path)
+            if request_id is None:
+                writer.write(f"OK;FileDeleted;{file_name}{Server.EOM}".encode())
+            else:
+                Frame.write(writer, Frame.Op.OK, request_id, b"FileDeleted")
 
-            Log.event(Log.Event.DELETE, 0, [file_name, user_name])
-            File_index.delete(file_name)
+            await Log.enqueue(Log.Event.DELETE, 0, [file_name, user_name])
+            await Executor.meta(File_index.delete, file_name)
         else:
             # Requested file does NOT exist
-            writer.write(f"ERROR;FileNotFoundError{Server.EOM}".encode())
+            if request_id is None:
+                writer.write(f"ERROR;FileNotFoundError{Server.EOM}".encode())
+            else:
+                Frame.write(writer, Frame.Op.ERROR, request_id, b"FileNotFoundError")
 
     @staticmethod
     async def list_files(
-        user_name: str, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+        user_name: str,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        request_id: int = None,
     ):
         """
         Function for sending list of available files to a user.
@@ -328,14 +1440,25 @@ class Server:
         :type reader: asyncio.StreamReader
         :param writer: writer instance
         :type writer: asyncio.StreamWriter
-        
+        :param request_id: ID of request sent as frame, None if request was sent as text
+        :type request_id: int
+
         """
 
         # Send file database data
-        writer.write(pickle.dumps(File_index.user_files(user_name)))
+        data = pickle.dumps(await Executor.meta(File_index.user_files, user_name))
+        if request_id is not None:
+            Frame.write(
+                writer, Frame.Op.OK, request_id, b"Listing", Frame.U64.pack(len(data))
+            )
+        writer.write(data)
 
     @staticmethod
-    async def send_pubkey(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    async def send_pubkey(
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        request_id: int = None,
+    ):
         """
         Function for sending server's RSA public key to client on request.
 
@@ -343,30 +1466,39 @@ class Server:
         :type reader: asyncio.StreamReader
         :param writer: writer instance
         :type writer: asyncio.StreamWriter
-        
+        :param request_id: ID of request sent as frame, None if request was sent as text
+        :type request_id: int
+
         """
 
+        key = Rsa.public_pem()
+
+        if request_id is not None:
+            # Send key in single frame
+            Frame.write(writer, Frame.Op.OK, request_id, key)
+            return
+
         # Inform client about authentication
         writer.write(f"OK;{Server.EOM}".encode())
         await writer.drain()
 
         # Send file
-        with open(Rsa.get_pub_key_location(), "rb") as f:
-            while True:
-                bytes_read = f.read(1024)
-                if not bytes_read:
-                    break
-                writer.write(bytes_read)
-                await writer.drain()
+        writer.write(key)
+        await writer.drain()
 
     @staticmethod
-    async def autenticate(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    async def autenticate(
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        request_id: int = None,
+        c: bytes = None,
+    ):
         """
         This function handles users authentication on *LOGIN* request from client via custom defined handshake using symetric and asymetric cryptography.
 
         **Client–Server handshake:** (servers point of view)
 
-        1. Server sends 'OK' ready to the client
+        1. Server sends 'OK' ready to the client (text protocol only, *LOGIN* frame already carries *c*)
         2. Awaits encryped response *c* from client
 
             .. math::
@@ -400,32 +1532,43 @@ class Server:
         :type reader: asyncio.StreamReader
         :param writer: writer instance
         :type writer: asyncio.StreamWriter
-        
+        :param request_id: ID of *LOGIN* frame, None if request was sent as text
+        :type request_id: int
+        :param c: Cyphertext *c* carried by *LOGIN* frame
+        :type c: bytes
+
         """
 
-        # Inform client that server is ready for handshake
-        writer.write(f"OK;Ready{Server.EOM}".encode())
-        await writer.drain()
+        if request_id is None:
+            # Inform client that server is ready for handshake
+            writer.write(f"OK;Ready{Server.EOM}".encode())
+            await writer.drain()
 
-        # Await c = E(username, usr-nonce) from client
-        paylen = await reader.readuntil(Server.EOM.encode())
-        paylen = paylen.decode()[:-1]
-        c = await reader.read(int(paylen))
+            # Await c = E(username, usr-nonce) from client
+            paylen = await Timeouts.header(reader.readuntil(Server.EOM.encode()))
+            paylen = paylen.decode()[:-1]
+            c = await Timeouts.header(reader.readexactly(int(paylen)))
 
-        # Import server private key from file
-        private_key = RSA.import_key(open(Rsa.get_priv_key_location()).read())
+        started = time.perf_counter()
 
-        # Create new instance of RSA cypher
-        rsa_instance = PKCS1_OAEP.new(private_key)
-        m = rsa_instance.decrypt(c)
+        # Decrypt with cached server private key, in pool of processes
+        m = await Executor.crypto(Rsa.decrypt, c)
         m = m.decode()
 
         # Prepare information about user requesting login
         username, usr_nonce = m.split(";")
-        password = User_db.get_record(username)[1]
+        record = await Executor.meta(User_db.get_record, username)
+        if record is None:
+            # User is not registered
+            print(f"WARNING: User {username} has failed to loged in from client.")
+            if request_id is not None:
+                Frame.write(
+                    writer, Frame.Op.ERROR, request_id, b"NotAuthenticatedError"
+                )
+            return
+        _, password, aes_key, salt = record
         byte_pas = bytes.fromhex(password)
         ser_nonce = uuid.uuid4().hex
-        salt = User_db.get_record(username)[3]
         byte_salt = bytes.fromhex(salt)
 
         # Responde with E((usr-nonce, ser-nonce), hash(password)), salt
@@ -435,27 +1578,37 @@ class Server:
 
         payload = (c, tag, aes_instance.nonce, byte_salt)
 
-        # Send data
-        writer.write(
-            f"{len(c)};{len(tag)};{len(aes_instance.nonce)};{len(byte_salt)}".encode()
-            + Server.EOM.encode()
-        )
-        writer.writelines(payload)
+        # Send data and await response E((usr-nonce, ser-nonce), pub.key)
+        if request_id is None:
+            writer.write(
+                f"{len(c)};{len(tag)};{len(aes_instance.nonce)};{len(byte_salt)}".encode()
+                + Server.EOM.encode()
+            )
+            writer.writelines(payload)
 
-        # Await response and D((usr-nonce, ser-nonce), pub.key)
-        paylen = await reader.readuntil(Server.EOM.encode())
-        paylen = paylen.decode()[:-1]
-        c = await reader.read(int(paylen))
+            paylen = await Timeouts.header(reader.readuntil(Server.EOM.encode()))
+            paylen = paylen.decode()[:-1]
+            c = await Timeouts.header(reader.readexactly(int(paylen)))
+        else:
+            Frame.write(writer, Frame.Op.OK, request_id, *payload)
+            await writer.drain()
+
+            op, request_id, fields = await Timeouts.header(Frame.read(reader))
+            if op != Frame.Op.LOGIN or len(fields) != 1:
+                # Answered with MalformedFrameError by serve_frames()
+                raise ValueError("Frame: Expected LOGIN frame with one field")
+            (c,) = fields
 
         # Decypher message (usr-nonce, ser-nonce)
-        m = rsa_instance.decrypt(c)
+        m = await Executor.crypto(Rsa.decrypt, c)
         m = m.decode()
 
         # Compare original ser-nonce and received ser-nonce from client
         _, rec_ser_nonce = m.split(";")
         if rec_ser_nonce == str(ser_nonce):
             print(f"INFO: User {username} has successfully loged in from client.")
-            aes_key = User_db.get_record(username)[2]
+            # Latency of the handshake without waiting for the first message of the client
+            Metrics.timing("login.latency", time.perf_counter() - started)
 
             # Encrypt aes_key with password
             aes_instance = AES.new(byte_pas, AES.MODE_EAX)
@@ -464,14 +1617,21 @@ class Server:
             payload = (c, tag, aes_instance.nonce)
 
             # Send aes_key to client
-            writer.write(
-                f"{len(c)};{len(tag)};{len(aes_instance.nonce)}".encode()
-                + Server.EOM.encode()
-            )
-            writer.writelines(payload)
+            if request_id is None:
+                writer.write(
+                    f"{len(c)};{len(tag)};{len(aes_instance.nonce)}".encode()
+                    + Server.EOM.encode()
+                )
+                writer.writelines(payload)
+            else:
+                Frame.write(writer, Frame.Op.OK, request_id, *payload)
 
         else:
             print(f"WARNING: User {username} has failed to loged in from client.")
+            if request_id is not None:
+                Frame.write(
+                    writer, Frame.Op.ERROR, request_id, b"NotAuthenticatedError"
+                )
 
     @staticmethod
     def version():
@@ -0,0 +1,285 @@
+# Uploads is library for resumable chunked uploads to Kryzbu server
+#
+# Source code available on: https://github.com/martin-nohava/kryzbu.
+
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Tuple
+
+
+class Upload_session:
+    """
+    | Server-side state of resumable uploads. Client opens upload session for a file, sends it in numbered
+    | chunks in any order and commits the session when server holds all of them. Chunks are written directly
+    | to their place in session data file, every stored chunk is confirmed by empty marker file, so session
+    | survives dropped connections and server restarts.
+    |
+    | **Session folder structure:**
+    | *meta.json* – owner, file name, size, chunk size and fingerprint of uploaded file
+    | *data* – uploaded file, moved to user folder on commit
+    | *INDEX.chunk* – marker of stored chunk
+    |
+    | **Global variables in this class:**
+    | **FOLDER** (*Path*) – location of upload sessions
+    | **CHUNK_LIMITS** (*tuple*) – smallest and largest accepted chunk size
+    | **MAX_UPLOAD_SIZE** (*int*) – largest file accepted by upload session, session data file is allocated at once
+    | **MAX_SESSIONS** (*int*) – largest number of unfinished sessions of one user
+    | **EXPIRE_AFTER** (*int*) – session is deleted after this many seconds without receiving a chunk
+    | **CLEANUP_INTERVAL** (*int*) – how often are expired sessions looked for (seconds)
+    """
+
+    FOLDER = Path("server/_data/uploads/sessions/")
+    CHUNK_LIMITS = (64 * 1024, 64 * 1024 * 1024)
+    MAX_UPLOAD_SIZE = 64 * 1024 * 1024 * 1024
+    MAX_SESSIONS = 16
+    EXPIRE_AFTER = 24 * 60 * 60
+    CLEANUP_INTERVAL = 10 * 60
+
+    @staticmethod
+    def open(
+        user_name: str, file_name: str, size: int, chunk_size: int, fingerprint: int
+    ) -> Tuple:
+        """
+        Opens new upload session. If user already has unfinished session of the same file (same name, size,
+        chunk size and fingerprint), that session is returned instead, so client can resume it.
+        New session is refused when file is larger than *MAX_UPLOAD_SIZE* or user already has *MAX_SESSIONS* sessions.
+
+        :param user_name: Name of owner
+        :type user_name: str
+        :param file_name: Name of uploaded file
+        :type file_name: str
+        :param size: Size of uploaded file
+        :type size: int
+        :param chunk_size: Size of every chunk except the last one
+        :type chunk_size: int
+        :param fingerprint: Value identifying version of the file on client, e.g. modification time
+        :type fingerprint: int
+        :returns: Session ID and None, or None and name of error if session can't be opened
+        :rtype: Tuple: (session_id, error)
+
+        """
+
+        if (
+            not Upload_session.CHUNK_LIMITS[0]
+            <= chunk_size
+            <= Upload_session.CHUNK_LIMITS[1]
+        ):
+            return None, "InvalidChunkError"
+        if size > Upload_session.MAX_UPLOAD_SIZE:
+            return None, "FileTooLargeError"
+
+        meta = {
+            "user": user_name,
+            "file_name": file_name,
+            "size": size,
+            "chunk_size": chunk_size,
+            "fingerprint": fingerprint,
+        }
+
+        # Resume unfinished session of the same file
+        sessions = 0
+        for session_id in os.listdir(Upload_session.FOLDER):
+            user_meta = Upload_session.get(session_id, user_name)
+            if user_meta == meta:
+                return session_id, None
+            if user_meta is not None:
+                sessions += 1
+        if sessions >= Upload_session.MAX_SESSIONS:
+            return None, "TooManyUploadsError"
+
+        session_id = uuid.uuid4().hex
+        session_folder = Upload_session.FOLDER / session_id
+        session_folder.mkdir()
+        with open(session_folder / "data", "wb") as f:
+            f.truncate(size)
+        # Written at once, concurrent open of another session may be reading it
+        with open(session_folder / "meta.tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(session_folder / "meta.tmp", session_folder / "meta.json")
+
+        return session_id, None
+
+    @staticmethod
+    def valid_id(session_id: str) -> bool:
+        """
+        Checks that session ID sent by client has form of ID made by :py:meth:`open() <server.uploads.Upload_session.open>`,
+        so it can be safely joined to *FOLDER*.
+
+        :param session_id: Session ID
+        :type session_id: str
+        :rtype: bool
+
+        """
+
+        return re.fullmatch("[0-9a-f]{32}", session_id) is not None
+
+    @staticmethod
+    def get(session_id: str, user_name: str) -> dict:
+        """
+        Returns metadata of upload session.
+
+        :param session_id: Session ID
+        :type session_id: str
+        :param user_name: Name of user making request, must be owner of the session
+        :type user_name: str
+        :returns: Session metadata, None if session does not exist or belongs to another user
+        :rtype: dict
+
+        """
+
+        meta_path = Upload_session.FOLDER / session_id / "meta.json"
+        if not os.path.exists(meta_path):
+            return None
+
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+
+        return meta if meta["user"] == user_name else None
+
+    @staticmethod
+    def chunk_count(meta: dict) -> int:
+        """
+        Returns number of chunks the file is split to.
+
+        :param meta: Session metadata
+        :type meta: dict
+        :rtype: int
+
+        """
+
+        return max(1, -(-meta["size"] // meta["chunk_size"]))
+
+    @staticmethod
+    def chunk_range(meta: dict, index: int) -> tuple:
+        """
+        Returns position and length of chunk in uploaded file.
+
+        :param meta: Session metadata
+        :type meta: dict
+        :param index: Chunk number, starting from 0
+        :type index: int
+        :returns: Offset and length, None if chunk does not exist
+        :rtype: tuple: (offset, length)
+
+        """
+
+        if not 0 <= index < Upload_session.chunk_count(meta):
+            return None
+
+        offset = index * meta["chunk_size"]
+        return offset, min(meta["chunk_size"], meta["size"] - offset)
+
+    @staticmethod
+    def data_path(session_id: str) -> Path:
+        """
+        Returns location of session data file.
+
+        :param session_id: Session ID
+        :type session_id: str
+        :rtype: Path
+
+        """
+
+        return Upload_session.FOLDER / session_id / "data"
+
+    @staticmethod
+    def mark(session_id: str, index: int) -> None:
+        """
+        Marks chunk as stored, call only after chunk data are written.
+
+        :param session_id: Session ID
+        :type session_id: str
+        :param index: Chunk number
+        :type index: int
+
+        """
+
+        (Upload_session.FOLDER / session_id / f"{index}.chunk").touch()
+
+    @staticmethod
+    def chunks(session_id: str, meta: dict) -> bytes:
+        """
+        Returns bitmap of stored chunks, bit *i* (most significant bit of byte *i // 8* first) is set
+        when chunk *i* is stored.
+
+        :param session_id: Session ID
+        :type session_id: str
+        :param meta: Session metadata
+        :type meta: dict
+        :rtype: bytes
+
+        """
+
+        bitmap = bytearray(-(-Upload_session.chunk_count(meta) // 8))
+        for file in os.listdir(Upload_session.FOLDER / session_id):
+            if file.endswith(".chunk"):
+                index = int(file[: -len(".chunk")])
+                bitmap[index // 8] |= 0x80 >> (index % 8)
+        return bytes(bitmap)
+
+    @staticmethod
+    def commit(session_id: str, meta: dict, destination: Path) -> bool:
+        """
+        Moves uploaded file to its destination and deletes the session, only if all chunks are stored.
+
+        :param session_id: Session ID
+        :type session_id: str
+        :param meta: Session metadata
+        :type meta: dict
+        :param destination: Final location of uploaded file
+        :type destination: Path
+        :returns: Whether file was committed
+        :rtype: bool
+
+        """
+
+        stored = [
+            file
+            for file in os.listdir(Upload_session.FOLDER / session_id)
+            if file.endswith(".chunk")
+        ]
+        if len(stored) != Upload_session.chunk_count(meta):
+            return False
+
+        os.replace(Upload_session.data_path(session_id), destination)
+        Upload_session.delete(session_id)
+        return True
+
+    @staticmethod
+    def delete(session_id: str) -> None:
+        """
+        Deletes upload session with all its data.
+
+        :param session_id: Session ID
+        :type session_id: str
+
+        """
+
+        shutil.rmtree(Upload_session.FOLDER / session_id, ignore_errors=True)
+
+    @staticmethod
+    def expire() -> None:
+        """
+        Deletes sessions which did not receive any chunk for *EXPIRE_AFTER* seconds.
+        Last activity is taken from modification time of session folder, which changes with every stored chunk.
+
+        """
+
+        for session_id in os.listdir(Upload_session.FOLDER):
+            try:
+                idle = time.time() - os.path.getmtime(
+                    Upload_session.FOLDER / session_id
+                )
+            except FileNotFoundError:
+                # Session committed or expired by other worker process meanwhile
+                continue
+            if idle > Upload_session.EXPIRE_AFTER:
+                Upload_session.delete(session_id)
+                print(
+                    f"WARNING, Upload_session: Session '{session_id}' expired and was deleted"
+                )